@@ -0,0 +1,97 @@
+"""
+Analytics views for DistribuTech
+
+Results are computed from the order history on demand and cached, so
+repeated dashboard loads do not rescan the status table.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .permissions import IsAdministrator, IsSuperAdmin
+from .utils.lead_times import compute_lead_times
+from .utils.response_cache import get_stats, reset_stats
+
+# Default period when no range is given
+DEFAULT_PERIOD_DAYS = 90
+
+
+def _parse_date_param(request, name):
+    """Return (date or None, error message or None) for a YYYY-MM-DD query param"""
+    value = request.query_params.get(name)
+    if not value:
+        return None, None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return None, f'{name} must be a date (YYYY-MM-DD)'
+    return parsed, None
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsSuperAdmin | IsAdministrator])
+def lead_times(request):
+    """
+    Delivery lead-time analytics for orders created in a date range
+    
+    Company-wide figures, so only SuperAdmins and Administrators may read
+    them (and share one cached result).
+    
+    Query params:
+    - from: First order creation date (YYYY-MM-DD, default 90 days before to)
+    - to: Last order creation date, inclusive (YYYY-MM-DD, default today)
+    - limit: Maximum number of suppliers and items listed (default 50, at most 500)
+    
+    Returns lead time percentiles in hours, the on-time rate and the median
+    hours per stage with the slowest stage, overall and per department,
+    supplier and item.
+    """
+    date_from, from_error = _parse_date_param(request, 'from')
+    date_to, to_error = _parse_date_param(request, 'to')
+    if from_error or to_error:
+        return Response({'detail': from_error or to_error}, status=400)
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - datetime.timedelta(days=DEFAULT_PERIOD_DAYS)
+    if date_from > date_to:
+        return Response({'detail': 'from must not be after to'}, status=400)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 500))
+    except ValueError:
+        return Response({'detail': 'limit must be an integer'}, status=400)
+    
+    cache_key = f'analytics:lead_times:{date_from}:{date_to}:{limit}'
+    result = cache.get(cache_key)
+    if result is None:
+        tz = timezone.get_current_timezone()
+        start = datetime.datetime.combine(date_from, datetime.time.min, tzinfo=tz)
+        end = datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+        result = {
+            'from': date_from,
+            'to': date_to,
+            'generated_at': timezone.now(),
+            **compute_lead_times(start, end, limit=limit),
+        }
+        cache.set(cache_key, result, getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 900))
+    return Response(result)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated, IsSuperAdmin | IsAdministrator])
+def cache_stats(request):
+    """
+    Hit and miss counters of the cached read endpoints
+    
+    GET returns the counters per view with the hit rate, DELETE resets them.
+    """
+    if request.method == 'DELETE':
+        reset_stats()
+        return Response(status=204)
+    return Response(get_stats())
@@ -0,0 +1,17 @@
+"""
+URL configuration of requests served under ASGI
+
+``core.middleware.AsyncViewsMiddleware`` points async requests here. The
+async views take over the routes of their synchronous counterparts, under
+the same names; everything else falls through to ``ROOT_URLCONF``.
+"""
+from django.conf import settings
+from django.urls import include, path
+
+from . import async_views
+
+urlpatterns = [
+    path('api/public/orders/', async_views.public_orders, name='public-orders'),
+    path('api/public/orders/<int:order_id>/', async_views.public_order_detail, name='public-order-detail'),
+    path('', include(settings.ROOT_URLCONF)),
+]
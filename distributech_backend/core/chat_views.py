@@ -1,15 +1,23 @@
+import logging
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.db.models import Count, Max, Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from .models import User, Conversation, Message
+from .models import User, Conversation, Message, MessageArchive
 from .serializers import (
     UserSerializer, ConversationSerializer, 
-    ConversationDetailSerializer, MessageSerializer
+    ConversationDetailSerializer, MessageSerializer, user_relations
 )
 from .permissions import IsAuthenticatedAndActive
+from .utils.conditional import conditional, row_validators
+from .utils.message_partitions import load_archived_messages
+
+logger = logging.getLogger(__name__)
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -24,7 +32,42 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        return Conversation.objects.filter(participants=user)
+        conversations = Conversation.objects.filter(participants=user).prefetch_related(
+            Prefetch('participants', queryset=User.objects.select_related('role', 'department'))
+        )
+        if self.action == 'retrieve':
+            conversations = conversations.prefetch_related(
+                Prefetch('messages', queryset=Message.objects.select_related(*user_relations('sender')))
+            )
+        return conversations
+    
+    def get_validators(self, request, *args, **kwargs):
+        """ETag and Last-Modified of a conversation with its messages"""
+        conversations = self.get_queryset().annotate(
+            message_count=Count('messages'),
+            last_message=Max('messages__id'),
+            unread=Count('messages', filter=Q(messages__is_read=False)),
+        )
+        return row_validators(
+            conversations, kwargs[self.lookup_field],
+            ['updated_at', 'message_count', 'last_message', 'unread'], (User,)
+        )
+    
+    @conditional(get_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -67,24 +110,97 @@ class ConversationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def messages(self, request, pk=None):
         conversation = self.get_object()
-        print(f"Processing message in conversation {pk} by user {request.user.username}")
+        logger.debug("Processing message in conversation %s by user %s", pk, request.user.username)
         
         serializer = MessageSerializer(data=request.data)
-        print(f"Request data: {request.data}")
         
         if serializer.is_valid():
-            print(f"Serializer is valid")
             message = serializer.save(
                 conversation=conversation,
                 sender=request.user
             )
-            print(f"Message saved with ID: {message.id}")
+            logger.debug("Message saved with ID: %s", message.id)
             # Update conversation's last activity timestamp
             conversation.save()  # This will trigger auto_now update on updated_at field
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        print(f"Serializer errors: {serializer.errors}")
+        logger.debug("Message rejected: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Page backwards through the messages of a conversation
+        
+        Live messages are read from the partitioned message table; once a page
+        reaches past the live window the remaining rows are loaded from the
+        archived JSONL files, so clients see one continuous history.
+        
+        Query params:
+        - before: ISO timestamp, only older messages are returned (defaults to now)
+        - limit: Page size (default 50, max 200)
+        """
+        conversation = self.get_object()
+        
+        before = timezone.now()
+        if request.query_params.get('before'):
+            before = parse_datetime(request.query_params['before'])
+            if before is None:
+                return Response(
+                    {"error": "Invalid 'before' timestamp"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 200))
+        except ValueError:
+            limit = 50
+        
+        live = list(
+            Message.objects.filter(conversation=conversation, timestamp__lt=before)
+            .select_related('sender__role', 'sender__department')
+            .defer('search_vector')
+            .order_by('-timestamp', '-id')[:limit + 1]
+        )
+        has_more = len(live) > limit
+        live = live[:limit]
+        live.reverse()
+        results = MessageSerializer(live, many=True).data
+        
+        if len(live) < limit:
+            # Continue into the archive from the oldest live message
+            archive_before = live[0].timestamp if live else before
+            archived, has_more = load_archived_messages(
+                conversation.id, archive_before, limit - len(live)
+            )
+            senders = User.objects.select_related('role', 'department').in_bulk(
+                {row['sender_id'] for row in archived}
+            )
+            sender_data = {
+                user_id: UserSerializer(user).data for user_id, user in senders.items()
+            }
+            results = [
+                {
+                    'id': row['id'],
+                    'conversation': row['conversation'],
+                    'sender': sender_data.get(row['sender_id']),
+                    'content': row['content'],
+                    'timestamp': row['timestamp'],
+                    'is_read': row['is_read'],
+                    'archived': True,
+                }
+                for row in archived
+            ] + list(results)
+        elif not has_more:
+            # The live page is full: older messages may still be in the archive
+            has_more = MessageArchive.objects.filter(
+                conversation=conversation, first_timestamp__lt=live[0].timestamp
+            ).exists()
+        
+        return Response({
+            'results': results,
+            'has_more': has_more,
+            'next_before': results[0]['timestamp'] if results and has_more else None,
+        })
+    
     @action(detail=False, methods=['post'])
     def find_by_username(self, request):
         """Find or create a conversation with a user by their username"""
@@ -139,7 +255,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return Message.objects.filter(
             Q(conversation__participants=user)
-        ).distinct()
+        ).select_related(*user_relations('sender')).distinct()
     
     def perform_create(self, serializer):
         conversation = serializer.validated_data.get('conversation')
@@ -0,0 +1,194 @@
+"""
+Primary/replica database routing
+
+Writes always go to the ``default`` (primary) database. Reads go to one of
+the aliases in ``DATABASE_REPLICAS`` only inside ``replica_reads()``, which
+``core.middleware.ReplicaRoutingMiddleware`` enters for GET, HEAD and
+OPTIONS requests whose client has not written recently. Everything else
+(writes, requests after a write, management commands, the email worker and
+any query inside ``transaction.atomic``) reads from the primary, so code
+that reads and then writes never sees replica lag.
+
+One replica is picked per request, at its first read, among the replicas
+that passed their last health check; when none did, the request reads from
+the primary. Replicas are checked at most every
+``REPLICA_HEALTH_CHECK_SECONDS`` (default 10) per process, and a replica
+more than ``REPLICA_MAX_LAG_SECONDS`` (default 5) behind the primary counts
+as unhealthy.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind the primary: NULL on a database that is not a
+# standby, 0 when it has replayed everything it received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class _ReplicaReads:
+    """Replica chosen by the current request, picked at its first read"""
+    __slots__ = ('alias',)
+
+    def __init__(self):
+        self.alias = None
+
+
+# None outside replica_reads(): read from the primary
+_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+def get_replicas():
+    """Return the aliases of the replica databases"""
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+@contextmanager
+def replica_reads():
+    """Send reads made inside the block to a healthy replica"""
+    token = _reads.set(_ReplicaReads())
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Send reads made inside the block to the primary, e.g. to refill a cache"""
+    token = _reads.set(None)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+class ReplicaHealth:
+    """
+    Per-process record of which replicas are usable
+
+    A replica is checked when it is first used and then at most every
+    ``REPLICA_HEALTH_CHECK_SECONDS``. While one thread checks, the others keep
+    using the previous result instead of piling up on a slow replica.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        interval = getattr(settings, 'REPLICA_HEALTH_CHECK_SECONDS', 10)
+        with self._lock:
+            status = self._status.get(alias)
+            if status is not None:
+                healthy, checked_at = status
+                if now - checked_at < interval:
+                    return healthy
+                # Claim the check; concurrent requests use the last result meanwhile
+                self._status[alias] = (healthy, now)
+        healthy = self.check(alias)
+        self.mark(alias, healthy)
+        return healthy
+
+    def mark(self, alias, healthy):
+        with self._lock:
+            previous = self._status.get(alias)
+            self._status[alias] = (healthy, time.monotonic())
+        if previous is not None and previous[0] != healthy:
+            if healthy:
+                logger.info('Replica %s is healthy again', alias)
+            else:
+                logger.warning('Replica %s is unhealthy; reading from the other replicas or the primary', alias)
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+    def check(self, alias):
+        """
+        Run a query on a replica and measure its replication lag
+
+        Returns:
+            True if the replica answered and is within REPLICA_MAX_LAG_SECONDS
+        """
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(POSTGRES_LAG_SQL)
+                    lag = cursor.fetchone()[0]
+                else:
+                    cursor.execute('SELECT 1')
+                    lag = None
+        except DatabaseError as e:
+            logger.warning('Health check of replica %s failed: %s', alias, e)
+            # Reconnect on the next check instead of reusing a broken connection
+            connection.close()
+            return False
+
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+        if lag is not None and max_lag is not None and float(lag) > max_lag:
+            logger.warning('Replica %s is %.1fs behind the primary', alias, float(lag))
+            return False
+        return True
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """
+    Pick a healthy replica at random
+
+    Returns:
+        Alias of the replica, or None when no replica is healthy
+    """
+    healthy = [alias for alias in get_replicas() if health.is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending writes to the primary and safe reads to replicas
+
+    Enable it with ``DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']``.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _reads.get()
+        # Reads inside a transaction must see its writes and hold its locks
+        if state is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = choose_replica() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,53 @@
+"""
+FilterSets for DistribuTech
+
+Every filter maps to an index (see the Meta.indexes of Order, OrderItem and
+Stock) or to a column denormalized onto Order by the triggers in migration
+0008, so that filtered order lists stay index scans on large tables.
+``core/tests.py`` checks the query plans of every combination.
+"""
+from django.db.models import Exists, OuterRef
+import django_filters
+
+from .models import Order, OrderItem, Stock
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Comma separated list of numbers, e.g. ``?item=3,7``"""
+
+class OrderFilter(django_filters.FilterSet):
+    """
+    Filters for the order list
+
+    Query params:
+    - status, user__department: Exact matches
+    - created_after, created_before: ISO 8601 datetimes bounding created_at
+    - total_min, total_max: Bounds on the order total
+    - item: Orders containing any of the given item IDs
+    - supplier: Orders containing an item stocked by the given supplier
+    - location: Substring of the latest status location (at least 3 characters)
+    - expected_after, expected_before: Dates bounding the expected delivery date
+    """
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+    total_min = django_filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
+    total_max = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
+    item = NumberInFilter(method='filter_item')
+    supplier = django_filters.NumberFilter(method='filter_supplier')
+    # Trigram indexes cannot serve patterns shorter than three characters
+    location = django_filters.CharFilter(field_name='current_location', lookup_expr='icontains', min_length=3)
+    expected_after = django_filters.DateFilter(field_name='expected_delivery_date', lookup_expr='gte')
+    expected_before = django_filters.DateFilter(field_name='expected_delivery_date', lookup_expr='lte')
+
+    class Meta:
+        model = Order
+        fields = ['status', 'user__department']
+
+    def filter_item(self, queryset, name, value):
+        # Semi-join instead of a join, so an order with several matching lines is returned once
+        lines = OrderItem.objects.filter(order=OuterRef('pk'), item_id__in=value)
+        return queryset.filter(Exists(lines))
+
+    def filter_supplier(self, queryset, name, value):
+        supplied_items = Stock.objects.filter(supplier_id=value).values('item_id')
+        lines = OrderItem.objects.filter(order=OuterRef('pk'), item_id__in=supplied_items)
+        return queryset.filter(Exists(lines))
@@ -0,0 +1,55 @@
+"""
+Management command to move old message partitions into compressed archives
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.utils.message_partitions import (
+    archivable_partitions, archive_partition, get_archive_root, is_partitioned
+)
+
+class Command(BaseCommand):
+    help = 'Archive message partitions older than N months to compressed JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=getattr(settings, 'MESSAGE_LIVE_MONTHS', 6),
+            help='Archive partitions that ended more than this many months ago (default: MESSAGE_LIVE_MONTHS or 6)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only show which partitions would be archived'
+        )
+
+    def handle(self, *args, **options):
+        older_than = options['older_than']
+        dry_run = options['dry_run']
+
+        if older_than < 1:
+            raise CommandError("--older-than must be at least 1 month")
+        if not is_partitioned():
+            raise CommandError("The message table is not partitioned. Run the migrations on PostgreSQL first.")
+
+        months = archivable_partitions(older_than)
+        if not months:
+            self.stdout.write(self.style.SUCCESS("No partitions to archive"))
+            return
+
+        self.stdout.write(f"Archiving {len(months)} months to {get_archive_root()}")
+
+        total = 0
+        for month in months:
+            name = f"{month:%Y-%m}"
+            if dry_run:
+                self.stdout.write(f"[DRY RUN] Would archive {name}")
+                continue
+            count = archive_partition(month)
+            total += count
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} messages of {name}"))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run - no partitions were archived"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Finished archiving {total} messages"))
@@ -0,0 +1,79 @@
+"""
+Management command to move closed orders into the archive tables
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.utils.order_archive import (
+    DEFAULT_CHUNK_SIZE, archivable_orders, archive_orders, get_retention_days, table_sizes
+)
+
+class Command(BaseCommand):
+    help = 'Archive Completed and Cancelled orders older than the retention window, with all their child rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=get_retention_days(),
+            help='Archive closed orders not updated for this many days (default: ORDER_ARCHIVE_RETENTION_DAYS or 365)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Orders moved per transaction'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after archiving this many orders'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only show how many orders would be archived'
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Show live and archived row counts per table and exit'
+        )
+
+    def handle(self, *args, **options):
+        older_than = options['older_than']
+        chunk_size = options['chunk_size']
+
+        if options['report']:
+            self.print_table_sizes()
+            return
+        if older_than < 0:
+            raise CommandError("--older-than must not be negative")
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        if options['dry_run']:
+            cutoff = timezone.now() - datetime.timedelta(days=older_than)
+            count = archivable_orders(cutoff).count()
+            self.stdout.write(self.style.WARNING(f"[DRY RUN] Would archive {count} orders closed before {cutoff:%Y-%m-%d}"))
+            return
+
+        def progress(moved, counts):
+            self.stdout.write(f"Archived {moved} orders")
+
+        totals = archive_orders(older_than, chunk_size=chunk_size, limit=options['limit'], progress=progress)
+        if not totals:
+            self.stdout.write(self.style.SUCCESS("No orders to archive"))
+            return
+
+        self.stdout.write("Rows moved:")
+        for label, count in sorted(totals.items()):
+            self.stdout.write(f"  {label:<24} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Finished archiving {totals.get('core.Order', 0)} orders"))
+
+    def print_table_sizes(self):
+        self.stdout.write(f"  {'Table':<24} {'Live':>10} {'Archived':>10}")
+        for label, (live, archived) in table_sizes().items():
+            self.stdout.write(f"  {label:<24} {live:>10} {archived:>10}")
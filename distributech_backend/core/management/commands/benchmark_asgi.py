@@ -0,0 +1,244 @@
+"""
+Management command comparing the tail latency of endpoints served under ASGI and WSGI
+
+Both servers run in this process, against the data already in the database
+(load some with ``generate_load_data`` first), without the network:
+
+- WSGI: Django's ``WSGIHandler`` called from ``--concurrency`` threads, like
+  a threaded WSGI server; every request takes the synchronous views.
+- ASGI: Django's ``ASGIHandler`` driven by ``--concurrency`` tasks on one
+  event loop, like an ASGI server; with ``core.middleware.AsyncViewsMiddleware``
+  installed the requests take the async views of ``core/async_views.py``.
+
+Each mode sends the same requests, cycling through ``--paths`` and the most
+recent orders, and reports throughput and p50/p95/p99/max latency:
+
+    python manage.py benchmark_asgi --concurrency 32 --requests 5000
+"""
+import asyncio
+import io
+import itertools
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from core.management.commands.benchmark_endpoints import benchmark_host, percentile
+from core.models import Order
+
+MODES = ['wsgi', 'asgi']
+DEFAULT_PATHS = ['/api/public/orders/{order_id}/']
+ASYNC_VIEWS_MIDDLEWARE = 'core.middleware.AsyncViewsMiddleware'
+
+
+def summarize(timings, errors, elapsed):
+    """
+    Summarize the latencies of one run
+
+    Args:
+        timings: Latency of every request, in seconds
+        errors: Number of requests that did not return 200
+        elapsed: Wall time of the whole run, in seconds
+    """
+    milliseconds = [timing * 1000 for timing in timings]
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(statistics.median(milliseconds), 3),
+        'p95_ms': round(percentile(milliseconds, 0.95), 3),
+        'p99_ms': round(percentile(milliseconds, 0.99), 3),
+        'max_ms': round(max(milliseconds), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and tail latency of endpoints under ASGI (async views) and WSGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paths',
+            help=f"Comma separated paths to request; {{order_id}} is replaced by order ids "
+                 f"(default: {','.join(DEFAULT_PATHS)})"
+        )
+        parser.add_argument(
+            '--orders', type=int, default=100, help='Number of most recent orders to request (default: 100)'
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='Timed requests per mode (default: 2000)')
+        parser.add_argument(
+            '--concurrency', type=int, default=16, help='Requests in flight at once (default: 16)'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=50, help='Untimed requests per mode before timing (default: 50)'
+        )
+        parser.add_argument(
+            '--modes', default=','.join(MODES), help=f"Comma separated modes to run (default: {','.join(MODES)})"
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        templates = [path.strip() for path in (options['paths'] or '').split(',') if path.strip()] or DEFAULT_PATHS
+        order_ids = list(Order.objects.order_by('-id').values_list('id', flat=True)[:options['orders']])
+        if not order_ids and any('{order_id}' in template for template in templates):
+            raise CommandError('There are no orders to request; load some with generate_load_data first')
+        paths = [
+            template.format(order_id=order_id) for order_id in order_ids or [0] for template in templates
+        ]
+        if 'asgi' in modes and ASYNC_VIEWS_MIDDLEWARE not in settings.MIDDLEWARE:
+            self.stdout.write(self.style.WARNING(
+                f'{ASYNC_VIEWS_MIDDLEWARE} is not in MIDDLEWARE: the ASGI run uses the synchronous views'
+            ))
+        # The runs use connections of their own threads
+        connection.close()
+
+        host = benchmark_host()
+        results = {}
+        for mode in modes:
+            run = self._run_wsgi if mode == 'wsgi' else self._run_asgi
+            if options['warmup']:
+                run(paths, host, options['warmup'], options['concurrency'])
+            results[mode] = run(paths, host, options['requests'], options['concurrency'])
+
+        self.stdout.write(
+            f"{options['requests']} requests per mode, {options['concurrency']} concurrent, "
+            f"{len(paths)} paths on {connection.vendor}"
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<5} {result['requests_per_second']:8.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+                f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  max {result['max_ms']:8.2f}ms  "
+                f"errors {result['errors']}"
+            )
+        if 'wsgi' in results and 'asgi' in results and results['wsgi']['p99_ms']:
+            change = results['asgi']['p99_ms'] / results['wsgi']['p99_ms'] - 1
+            self.stdout.write(f"ASGI p99 is {abs(change):.0%} {'lower' if change < 0 else 'higher'} than WSGI")
+
+        if options['output']:
+            report = {
+                'meta': {
+                    'created_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'requests': options['requests'],
+                    'concurrency': options['concurrency'],
+                    'paths': templates,
+                    'orders': len(order_ids),
+                },
+                'modes': results,
+            }
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Wrote results to {options['output']}")
+
+    def _run_wsgi(self, paths, host, requests, concurrency):
+        handler = WSGIHandler()
+        counter = itertools.count()
+        lock = threading.Lock()
+        timings = []
+        errors = [0]
+
+        def worker():
+            try:
+                while True:
+                    index = next(counter)
+                    if index >= requests:
+                        return
+                    environ = {
+                        'REQUEST_METHOD': 'GET', 'PATH_INFO': paths[index % len(paths)], 'QUERY_STRING': '',
+                        'SCRIPT_NAME': '', 'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+                        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+                        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': True,
+                        'wsgi.multiprocess': False, 'wsgi.run_once': False,
+                    }
+                    statuses = []
+
+                    def start_response(status, headers, exc_info=None):
+                        statuses.append(int(status.split(' ', 1)[0]))
+
+                    started = time.perf_counter()
+                    response = handler(environ, start_response)
+                    try:
+                        b''.join(response)
+                    finally:
+                        response.close()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        timings.append(elapsed)
+                        if statuses != [200]:
+                            errors[0] += 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        return summarize(timings, errors[0], time.perf_counter() - started)
+
+    def _run_asgi(self, paths, host, requests, concurrency):
+        return asyncio.run(self._asgi(paths, host, requests, concurrency))
+
+    async def _asgi(self, paths, host, requests, concurrency):
+        application = ASGIHandler()
+        counter = itertools.count()
+        timings = []
+        errors = 0
+
+        async def call(path):
+            finished = asyncio.Event()
+            status = None
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Django listens for a disconnect while the view runs
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+                elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                    finished.set()
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', host.encode())], 'client': ('127.0.0.1', 0), 'server': (host, 80),
+            }
+            await application(scope, receive, send)
+            return status
+
+        async def worker():
+            nonlocal errors
+            while True:
+                index = next(counter)
+                if index >= requests:
+                    return
+                started = time.perf_counter()
+                status = await call(paths[index % len(paths)])
+                timings.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(timings, errors, time.perf_counter() - started)
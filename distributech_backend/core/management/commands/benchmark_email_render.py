@@ -0,0 +1,115 @@
+"""
+Management command to measure the cost of rendering notification emails
+"""
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+from django.utils import timezone
+from core.models import Department, Order, User
+from core.utils.email_templates import TEMPLATE_DIR, html_to_text, precompile_templates, render_email, render_many
+
+TEMPLATE_NAME = 'emails/order_notification.html'
+
+class Command(BaseCommand):
+    help = 'Benchmark per-message render cost of the order notification email'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=1000,
+            help='Number of messages to render per mode (default: 1000)'
+        )
+        parser.add_argument(
+            '--items',
+            type=int,
+            default=5,
+            help='Order items per message (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        contexts = [self._context(index, options['items']) for index in range(count)]
+
+        started = time.perf_counter()
+        precompile_templates()
+        self.stdout.write(f"Precompiled email templates in {(time.perf_counter() - started) * 1000:.2f}ms")
+
+        results = [
+            ('compile every message', self._bench_uncached(contexts)),
+            ('cached render_email', self._bench_cached(contexts)),
+            ('render_many batch', self._bench_render_many(contexts)),
+        ]
+
+        html_content, _ = render_email(TEMPLATE_NAME, contexts[0])
+        text_timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            html_to_text(html_content)
+            text_timings.append(time.perf_counter() - started)
+        results.append(('text alternative only', text_timings))
+
+        self.stdout.write(f"Rendered {count} messages per mode with {options['items']} items each")
+        for name, timings in results:
+            self.stdout.write(
+                f"{name:<24} total {sum(timings):7.3f}s  "
+                f"mean {statistics.mean(timings) * 1e6:8.1f}us  "
+                f"p50 {statistics.median(timings) * 1e6:8.1f}us  "
+                f"p95 {self._p95(timings) * 1e6:8.1f}us"
+            )
+
+    def _context(self, index, item_count):
+        # Unsaved objects: the benchmark measures rendering, not queries
+        user = User(username=f'user{index}', email=f'user{index}@example.com')
+        user.department = Department(name='Operations')
+        order = Order(id=index + 1, user=user, status='Pending', created_at=timezone.now())
+        lines = []
+        total = Decimal('0')
+        for line in range(item_count):
+            price = Decimal('19.99') + line
+            quantity = line + 1
+            total += price * quantity
+            lines.append({
+                'name': f'Item {line} <special & co>',
+                'quantity': quantity,
+                'price': f"{float(price):.2f}",
+                'total': f"{float(price * quantity):.2f}",
+            })
+        return {'order': order, 'lines': lines, 'total': f"{float(total):.2f}"}
+
+    def _p95(self, timings):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _bench_uncached(self, contexts):
+        # No cached loader: every message loads and parses the template and its layout
+        engine = Engine(
+            dirs=[TEMPLATE_DIR],
+            loaders=['django.template.loaders.filesystem.Loader'],
+            autoescape=True,
+        )
+        timings = []
+        for values in contexts:
+            started = time.perf_counter()
+            html_content = engine.get_template(TEMPLATE_NAME).render(Context(values))
+            html_to_text(html_content)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _bench_cached(self, contexts):
+        timings = []
+        for values in contexts:
+            started = time.perf_counter()
+            render_email(TEMPLATE_NAME, values)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _bench_render_many(self, contexts):
+        started = time.perf_counter()
+        render_many(TEMPLATE_NAME, contexts)
+        elapsed = time.perf_counter() - started
+        # Report the amortised per-message cost of the batch
+        return [elapsed / len(contexts)] * len(contexts)
@@ -0,0 +1,359 @@
+"""
+Management command to benchmark the latency and query count of the hot API endpoints
+
+The command seeds a configurable volume of orders, stock and chat data,
+calls every endpoint through the Django test client (the full middleware,
+permission and serializer stack, without the network) and reports p50/p95
+latency and the number of SQL queries per request. All seeded rows and the
+writes made by the benchmarked endpoints are rolled back at the end, so it
+can be run against any database.
+
+Results are written as JSON with ``--output``. With ``--baseline`` the
+results are compared to a stored run and the command fails when an endpoint
+got slower than the threshold or runs more queries:
+
+    python manage.py benchmark_endpoints --output baseline.json
+    python manage.py benchmark_endpoints --baseline baseline.json --threshold 0.2
+"""
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    Comment, Conversation, Department, Item, Message, OrderStatus, OrderStatusChoices, Role, Stock, User
+)
+from core.utils.order_creation import create_orders
+
+STATUSES = [choice for choice, _ in OrderStatusChoices.choices]
+
+
+class BenchmarkData:
+    """Ids of the seeded rows the endpoints are called with"""
+
+    def __init__(self, admin, order_id, conversation_id):
+        self.admin = admin
+        self.order_id = order_id
+        self.conversation_id = conversation_id
+
+
+def reset_unread(data):
+    # mark_read only has work to do while the conversation has unread messages
+    Message.objects.filter(conversation_id=data.conversation_id).exclude(sender=data.admin).update(is_read=False)
+
+
+# (name, method, path, payload, expected status, untimed setup run before every call)
+ENDPOINTS = [
+    ('order_list', 'get', lambda data: '/api/orders/', None, 200, None),
+    ('order_detail', 'get', lambda data: f'/api/orders/{data.order_id}/', None, 200, None),
+    ('public_orders', 'get', lambda data: '/api/public/orders/', None, 200, None),
+    ('public_order_detail', 'get', lambda data: f'/api/public/orders/{data.order_id}/', None, 200, None),
+    ('stock_list', 'get', lambda data: '/api/stock/', None, 200, None),
+    (
+        'conversation_retrieve', 'get', lambda data: f'/api/conversations/{data.conversation_id}/',
+        None, 200, None,
+    ),
+    (
+        'message_send', 'post', lambda data: f'/api/conversations/{data.conversation_id}/messages/',
+        lambda data: {
+            'conversation': data.conversation_id, 'sender_id': data.admin.id, 'content': 'Benchmark message',
+        },
+        201, None,
+    ),
+    (
+        'mark_read', 'post', lambda data: '/api/messages/mark_read/',
+        lambda data: {'conversation_id': data.conversation_id}, 200, reset_unread,
+    ),
+]
+ENDPOINT_NAMES = [endpoint[0] for endpoint in ENDPOINTS]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def benchmark_host():
+    """Return a host name the requests of a benchmark can use"""
+    # The test client's default host is only allowed under the test runner
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0].lstrip('.') if hosts else 'localhost'
+
+
+def find_regressions(results, baseline, threshold, query_slack=0, min_delta_ms=1.0):
+    """
+    Compare benchmark results to a baseline
+
+    Args:
+        results: Endpoint results of the current run ({name: {'p50_ms', 'p95_ms', 'queries'}})
+        baseline: Endpoint results of the baseline run
+        threshold: Allowed relative latency increase (0.2 means 20% slower)
+        query_slack: Allowed number of additional queries per request
+        min_delta_ms: Latency increases smaller than this are ignored as noise
+
+    Returns:
+        List of regression descriptions, empty when nothing regressed
+    """
+    regressions = []
+    for name, before in baseline.items():
+        after = results.get(name)
+        if after is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            limit = before[metric] * (1 + threshold)
+            if after[metric] > limit and after[metric] - before[metric] >= min_delta_ms:
+                regressions.append(
+                    f"{name}: {metric} {after[metric]:.2f} > {before[metric]:.2f} (+{threshold:.0%} allowed)"
+                )
+        if after['queries'] > before['queries'] + query_slack:
+            regressions.append(f"{name}: queries {after['queries']} > {before['queries']}")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark p50/p95 latency and query counts of the hot API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Customer accounts to seed (default: 50)')
+        parser.add_argument('--items', type=int, default=200, help='Items with stock to seed (default: 200)')
+        parser.add_argument('--orders', type=int, default=500, help='Orders to seed (default: 500)')
+        parser.add_argument('--lines', type=int, default=3, help='Order lines per order (default: 3)')
+        parser.add_argument(
+            '--statuses', type=int, default=3, help='Extra status history rows per order (default: 3)'
+        )
+        parser.add_argument('--comments', type=int, default=2, help='Comments per order (default: 2)')
+        parser.add_argument('--conversations', type=int, default=20, help='Conversations to seed (default: 20)')
+        parser.add_argument(
+            '--messages', type=int, default=200, help='Messages per conversation (default: 200)'
+        )
+        parser.add_argument('--seed', type=int, default=1, help='Random seed of the seeded data (default: 1)')
+        parser.add_argument(
+            '--iterations', type=int, default=30, help='Timed calls per endpoint (default: 30)'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3, help='Untimed calls per endpoint before timing (default: 3)'
+        )
+        parser.add_argument(
+            '--endpoints',
+            help=f"Comma separated endpoints to run (default: all of {', '.join(ENDPOINT_NAMES)})"
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare the results to this JSON file and fail on regressions')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Allowed relative p50/p95 increase over the baseline (default: 0.2)'
+        )
+        parser.add_argument(
+            '--query-slack',
+            type=int,
+            default=0,
+            help='Allowed additional queries per request over the baseline (default: 0)'
+        )
+        parser.add_argument(
+            '--min-delta-ms',
+            type=float,
+            default=1.0,
+            help='Ignore latency increases smaller than this many ms (default: 1.0)'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = ENDPOINTS
+        if options['endpoints']:
+            selected = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+            unknown = set(selected) - set(ENDPOINT_NAMES)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint[0] in selected]
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        volumes = {
+            name: options[name]
+            for name in ('users', 'items', 'orders', 'lines', 'statuses', 'comments', 'conversations', 'messages')
+        }
+        with transaction.atomic():
+            started = time.perf_counter()
+            data = self._seed(random.Random(options['seed']), **volumes)
+            self.stdout.write(f"Seeded {volumes} in {time.perf_counter() - started:.1f}s")
+
+            client = APIClient(HTTP_HOST=benchmark_host())
+            client.force_authenticate(data.admin)
+            results = {}
+            for endpoint in endpoints:
+                results[endpoint[0]] = self._bench(client, data, endpoint, options['iterations'], options['warmup'])
+            # Leave the database as it was
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['iterations']} calls per endpoint on {connection.vendor}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                f"mean {result['mean_ms']:8.2f}ms  queries {result['queries']:4d}"
+            )
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'volumes': volumes,
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Wrote results to {options['output']}")
+
+        if baseline is not None:
+            if baseline.get('meta', {}).get('volumes') != volumes:
+                self.stdout.write(self.style.WARNING('The baseline was recorded with different data volumes'))
+            regressions = find_regressions(
+                results, baseline.get('endpoints', {}), options['threshold'],
+                options['query_slack'], options['min_delta_ms'],
+            )
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def _bench(self, client, data, endpoint, iterations, warmup):
+        name, method, path, payload, expected_status, setup = endpoint
+        url = path(data)
+        body = payload(data) if payload else None
+        timings = []
+        queries = []
+        counter = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            counter[0] += 1
+            return execute(sql, params, many, context)
+
+        for index in range(warmup + iterations):
+            if setup:
+                setup(data)
+            counter[0] = 0
+            with connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(url)
+                else:
+                    response = client.post(url, body, format='json')
+                elapsed = time.perf_counter() - started
+            if response.status_code != expected_status:
+                raise CommandError(f"{name}: {method.upper()} {url} returned {response.status_code}")
+            if index >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(counter[0])
+
+        return {
+            'method': method.upper(),
+            'path': url,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+        }
+
+    def _seed(self, rng, users, items, orders, lines, statuses, comments, conversations, messages):
+        department, _ = Department.objects.get_or_create(name='Benchmark')
+        admin_role, _ = Role.objects.get_or_create(name='SuperAdmin')
+        customer_role, _ = Role.objects.get_or_create(name='Customer')
+        supplier_role, _ = Role.objects.get_or_create(name='Supplier')
+
+        admin = User.objects.create(
+            username='benchmark-admin', email='benchmark-admin@example.com', role=admin_role, department=department
+        )
+        supplier = User.objects.create(
+            username='benchmark-supplier', email='benchmark-supplier@example.com',
+            role=supplier_role, department=department,
+        )
+        customers = User.objects.bulk_create([
+            User(
+                username=f'benchmark-{n}', email=f'benchmark-{n}@example.com',
+                role=customer_role, department=department,
+            )
+            for n in range(max(users, 1))
+        ])
+
+        created_items = Item.objects.bulk_create([
+            Item(name=f'Benchmark item {n}', price=Decimal(rng.randint(100, 100000)) / 100)
+            for n in range(max(items, 1))
+        ])
+        Stock.objects.bulk_create([
+            Stock(
+                item=item, current_stock=rng.randint(0, 500), minimum_threshold=rng.randint(5, 50),
+                supplier=supplier,
+            )
+            for item in created_items
+        ])
+
+        created_orders = create_orders([
+            {
+                'user_id': rng.choice(customers).id,
+                'status': rng.choice(STATUSES),
+                'items': [
+                    {'item_id': item.id, 'quantity': rng.randint(1, 20), 'price': item.price}
+                    for item in rng.sample(created_items, min(lines, len(created_items)))
+                ],
+                'current_location': 'Central Hub',
+            }
+            for _ in range(max(orders, 1))
+        ], updated_by=admin, notify=False)
+
+        now = timezone.now()
+        OrderStatus.objects.bulk_create([
+            OrderStatus(
+                order=order, status=rng.choice(STATUSES), current_location=f'Hub {rng.randint(1, 50)}',
+                location_timestamp=now, remarks='', updated_by=admin,
+            )
+            for order in created_orders
+            for _ in range(statuses)
+        ], batch_size=1000)
+        Comment.objects.bulk_create([
+            Comment(order=order, user=rng.choice(customers), comment_text=f'Benchmark comment {n}')
+            for order in created_orders
+            for n in range(comments)
+        ], batch_size=1000)
+
+        created_conversations = Conversation.objects.bulk_create([
+            Conversation() for _ in range(max(conversations, 1))
+        ])
+        peers = [rng.choice(customers) for _ in created_conversations]
+        Conversation.participants.through.objects.bulk_create([
+            Conversation.participants.through(conversation_id=conversation.id, user_id=user.id)
+            for conversation, peer in zip(created_conversations, peers)
+            for user in (admin, peer)
+        ])
+        Message.objects.bulk_create([
+            Message(
+                conversation=conversation, sender=admin if n % 2 else peer,
+                content=f'Benchmark message {n}', is_read=n < messages // 2,
+            )
+            for conversation, peer in zip(created_conversations, peers)
+            for n in range(messages)
+        ], batch_size=1000)
+
+        return BenchmarkData(
+            admin=admin,
+            order_id=created_orders[len(created_orders) // 2].id,
+            conversation_id=created_conversations[0].id,
+        )
@@ -0,0 +1,142 @@
+"""
+Management command to benchmark email delivery against a local SMTP sink
+"""
+import smtplib
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.utils.email_utils import build_mime_message
+from core.utils.smtp_pool import SMTPConnectionPool
+
+class Command(BaseCommand):
+    help = 'Compare per-message SMTP connections with the pooled sender and send_many'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=500,
+            help='Number of messages to send per mode (default: 500)'
+        )
+        parser.add_argument(
+            '--host',
+            type=str,
+            help='Send to this SMTP server instead of starting a local aiosmtpd sink'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8025,
+            help='Port of the SMTP server or local sink (default: 8025)'
+        )
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=0.0,
+            help='Artificial delay the local sink adds to every SMTP command, to mimic a remote relay'
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        port = options['port']
+        host = options['host']
+        controller = None
+
+        if not host:
+            controller = self._start_sink(port, options['latency_ms'] / 1000)
+            host = '127.0.0.1'
+
+        message = build_mime_message(
+            ['benchmark@distributech.com'],
+            'DistribuTech SMTP benchmark',
+            '<html><body><p>Benchmark message</p></body></html>'
+        )
+
+        try:
+            results = [
+                ('connection per message', self._bench_unpooled(host, port, message, count)),
+                ('pooled send', self._bench_pooled(host, port, message, count)),
+                ('send_many batch', self._bench_send_many(host, port, message, count)),
+            ]
+        finally:
+            if controller is not None:
+                controller.stop()
+
+        self.stdout.write(f"Sent {count} messages per mode to {host}:{port}")
+        for name, timings in results:
+            total = sum(timings)
+            self.stdout.write(
+                f"{name:<24} total {total:7.3f}s  {count / total:8.1f} msg/s  "
+                f"p50 {statistics.median(timings) * 1000:6.2f}ms  "
+                f"p95 {self._p95(timings) * 1000:6.2f}ms"
+            )
+
+    def _start_sink(self, port, delay):
+        try:
+            from aiosmtpd.controller import Controller
+            from aiosmtpd.smtp import SMTP as SMTPServer
+        except ImportError:
+            raise CommandError("aiosmtpd is required for the local sink: pip install aiosmtpd")
+
+        import asyncio
+
+        class SinkHandler:
+            async def handle_DATA(self, server, session, envelope):
+                return '250 Message accepted for delivery'
+
+        class SlowSMTP(SMTPServer):
+            # Delay every reply to simulate the round trip to a remote relay
+            async def push(self, status):
+                if delay:
+                    await asyncio.sleep(delay)
+                return await super().push(status)
+
+        class SinkController(Controller):
+            def factory(self):
+                return SlowSMTP(self.handler, **self.SMTP_kwargs)
+
+        controller = SinkController(SinkHandler(), hostname='127.0.0.1', port=port)
+        controller.start()
+        return controller
+
+    def _p95(self, timings):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _bench_unpooled(self, host, port, message, count):
+        # Mirrors the previous send_email: connect, send and quit for every message
+        from_email, recipients, body = message
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            with smtplib.SMTP(host, port) as server:
+                server.sendmail(from_email, recipients, body)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _bench_pooled(self, host, port, message, count):
+        pool = SMTPConnectionPool(host, port, max_messages=count + 1)
+        timings = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                pool.send(*message)
+                timings.append(time.perf_counter() - started)
+        finally:
+            pool.close_all()
+        return timings
+
+    def _bench_send_many(self, host, port, message, count):
+        pool = SMTPConnectionPool(host, port, max_messages=count + 1)
+        try:
+            started = time.perf_counter()
+            errors = pool.send_many([message] * count)
+            elapsed = time.perf_counter() - started
+        finally:
+            pool.close_all()
+        failed = [error for error in errors if error is not None]
+        if failed:
+            raise CommandError(f"{len(failed)} messages failed in send_many: {failed[0]}")
+        # Report the amortised per-message cost of the batch
+        return [elapsed / count] * count
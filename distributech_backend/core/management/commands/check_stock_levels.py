@@ -4,7 +4,7 @@ Management command to check stock levels and send alerts
 from django.core.management.base import BaseCommand
 from django.db import models
 from core.models import Stock
-from core.utils.email_utils import send_stock_alert
+from core.utils.email_utils import build_stock_alerts, send_many
 
 class Command(BaseCommand):
     help = 'Check stock levels and send alerts for items below threshold'
@@ -28,26 +28,32 @@ class Command(BaseCommand):
         self.stdout.write("Checking stock levels...")
         
         # Get all stock items where current_stock <= minimum_threshold
-        low_stock_items = Stock.objects.filter(current_stock__lte=models.F('minimum_threshold'))
+        low_stock_items = list(
+            Stock.objects.filter(current_stock__lte=models.F('minimum_threshold'))
+            .select_related('item', 'supplier')
+        )
         
-        if not low_stock_items.exists():
+        if not low_stock_items:
             self.stdout.write(self.style.SUCCESS("No items below minimum threshold found"))
             return
         
-        self.stdout.write(f"Found {low_stock_items.count()} items below minimum threshold:")
+        self.stdout.write(f"Found {len(low_stock_items)} items below minimum threshold:")
         
         for stock in low_stock_items:
             item = stock.item
             self.stdout.write(f"- {item.name}: {stock.current_stock} / {stock.minimum_threshold} {item.measurement_unit or 'units'}")
-            
-            if not dry_run:
-                success = send_stock_alert(item, stock, email)
-                if success:
-                    self.stdout.write(self.style.SUCCESS(f"  Alert sent for {item.name}"))
-                else:
-                    self.stdout.write(self.style.ERROR(f"  Failed to send alert for {item.name}"))
-            
+        
         if dry_run:
             self.stdout.write(self.style.WARNING("Dry run - no emails were sent"))
-        else:
-            self.stdout.write(self.style.SUCCESS(f"Finished checking stock levels. Alerts sent for {low_stock_items.count()} items")) 
\ No newline at end of file
+            return
+        
+        # Render every alert in one pass and send them over one SMTP session
+        errors = send_many(build_stock_alerts(low_stock_items, email))
+        for stock, error in zip(low_stock_items, errors):
+            if error is None:
+                self.stdout.write(self.style.SUCCESS(f"  Alert sent for {stock.item.name}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"  Failed to send alert for {stock.item.name}: {error}"))
+        
+        sent = errors.count(None)
+        self.stdout.write(self.style.SUCCESS(f"Finished checking stock levels. Alerts sent for {sent} items"))
@@ -0,0 +1,143 @@
+"""
+Management command to generate production-scale synthetic data for load and performance testing
+"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import Comment, Conversation, Item, Message, Order, OrderItem, OrderStatus, Stock, User
+from core.utils.load_data import LoadDataGenerator, ensure_message_partitions, finish_load, load_rows
+
+DEFAULT_VOLUMES = {
+    'users': 1000000,
+    'items': 100000,
+    'orders': 2000000,
+    'conversations': 200000,
+}
+
+
+class Command(BaseCommand):
+    help = 'Generate seeded, reproducible users, items, stock, orders and chat data at production scale'
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_VOLUMES.items():
+            parser.add_argument(
+                f'--{name}',
+                type=int,
+                default=None,
+                help=f'Number of {name} to generate (default: {default:,} times --scale)'
+            )
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Multiplier of the default volumes, e.g. 0.01 for a laptop (default: 1.0)'
+        )
+        parser.add_argument(
+            '--lines-per-order', type=float, default=3, help='Mean order lines per order (default: 3)'
+        )
+        parser.add_argument(
+            '--comments-per-order', type=float, default=0.5, help='Mean comments per order (default: 0.5)'
+        )
+        parser.add_argument(
+            '--messages-per-conversation',
+            type=float,
+            default=20,
+            help='Mean messages per conversation (default: 20)'
+        )
+        parser.add_argument(
+            '--status-hours',
+            type=float,
+            default=36,
+            help='Mean hours an order spends in each status before moving on (default: 36)'
+        )
+        parser.add_argument('--days', type=int, default=365, help='Days of order history (default: 365)')
+        parser.add_argument(
+            '--end',
+            help='Date (YYYY-MM-DD) the history ends on (default: today). Pass it to reproduce a data set exactly'
+        )
+        parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+        parser.add_argument(
+            '--prefix',
+            help='Username prefix of the generated users (default: load<seed>-)'
+        )
+        parser.add_argument(
+            '--password', default='loadtest', help='Password of every generated user (default: loadtest)'
+        )
+
+    def handle(self, *args, **options):
+        volumes = {
+            name: options[name] if options[name] is not None else int(default * options['scale'])
+            for name, default in DEFAULT_VOLUMES.items()
+        }
+        if volumes['users'] < 1 or volumes['items'] < 1:
+            raise CommandError('At least one user and one item are needed')
+
+        end_date = timezone.now().date()
+        if options['end']:
+            end_date = parse_date(options['end'])
+            if end_date is None:
+                raise CommandError(f"Invalid --end date: {options['end']}")
+        end = int(datetime.datetime.combine(end_date, datetime.time(), datetime.timezone.utc).timestamp())
+        start = end - options['days'] * 86400
+
+        prefix = options['prefix'] or f"load{options['seed']}-"
+        if User.objects.filter(username=f'{prefix}0').exists():
+            raise CommandError(f"Users with the prefix '{prefix}' already exist; pass another --seed or --prefix")
+
+        generator = LoadDataGenerator(
+            seed=options['seed'],
+            start=start,
+            end=end,
+            lines_per_order=options['lines_per_order'],
+            comments_per_order=options['comments_per_order'],
+            messages_per_conversation=options['messages_per_conversation'],
+            status_hours=options['status_hours'],
+            prefix=prefix,
+            password=options['password'],
+            **volumes,
+        )
+        ensure_message_partitions(start, end)
+
+        self.stdout.write(
+            f"Generating {volumes} from {end_date - datetime.timedelta(days=options['days'])} "
+            f"to {end_date} with seed {options['seed']}"
+        )
+        counts = {}
+        started = time.perf_counter()
+        try:
+            for name, blocks in [
+                ('users', generator.users()),
+                ('items', generator.items()),
+                ('stock', generator.stock()),
+                ('orders', generator.orders()),
+                ('conversations', generator.conversations()),
+            ]:
+                section_started = time.perf_counter()
+                section_rows = 0
+                for batches in blocks:
+                    # One transaction per block: a failure keeps the blocks already loaded
+                    with transaction.atomic():
+                        for model, columns, rows in batches:
+                            written = load_rows(model, columns, rows)
+                            counts[model._meta.db_table] = counts.get(model._meta.db_table, 0) + written
+                            section_rows += written
+                elapsed = time.perf_counter() - section_started
+                self.stdout.write(
+                    f"{name:<16} {section_rows:>12,} rows  {elapsed:8.1f}s  "
+                    f"{section_rows / max(elapsed, 1e-9):>10,.0f} rows/s"
+                )
+        finally:
+            # Also after a failure, so new rows never collide with the ids already loaded
+            finish_load([User, Item, Stock, Order, OrderItem, OrderStatus, Comment, Conversation, Message])
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        for table, count in counts.items():
+            self.stdout.write(f"  {table:<32} {count:>12,}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
@@ -0,0 +1,40 @@
+"""
+Management command to pre-create monthly partitions of the message table
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core.utils.message_partitions import (
+    ensure_partitions, is_partitioned, list_partitions, partition_name
+)
+
+class Command(BaseCommand):
+    help = 'Create message table partitions for the current month and upcoming months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Number of future months to create partitions for (default: 3)'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Only list the existing partitions'
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The message table is not partitioned. Run the migrations on PostgreSQL first.")
+
+        if options['list']:
+            for month in list_partitions():
+                self.stdout.write(f"- {partition_name(month)} ({month:%Y-%m})")
+            return
+
+        created = ensure_partitions(options['months_ahead'])
+
+        for month in created:
+            self.stdout.write(self.style.SUCCESS(f"Created partition {partition_name(month)}"))
+
+        if not created:
+            self.stdout.write("All partitions already exist")
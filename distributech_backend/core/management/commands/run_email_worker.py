@@ -0,0 +1,101 @@
+"""
+Management command that delivers emails from the outbox
+"""
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.utils.email_outbox import get_worker_setting, outbox_summary, process_batch
+from core.utils.email_templates import precompile_templates
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=get_worker_setting('BATCH_SIZE', 50),
+            help='Number of emails claimed per batch'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=get_worker_setting('CONCURRENCY', 4),
+            help='Maximum number of SMTP sends in flight at once'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=get_worker_setting('POLL_INTERVAL', 2.0),
+            help='Seconds to sleep when the outbox is empty'
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=get_worker_setting('LEASE_SECONDS', 300),
+            help='Seconds after which an email stuck in Sending is claimed again'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the outbox until it is empty, then exit'
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print the outbox summary and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            summary = outbox_summary()
+            for status, count in summary['counts'].items():
+                self.stdout.write(f"{status}: {count}")
+            self.stdout.write(f"Oldest due email: {summary['oldest_due_seconds']:.0f}s")
+            return
+
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'send_seconds': 0.0}
+        precompile_templates()
+
+        self.stdout.write(
+            f"Email worker {worker_id} started "
+            f"(batch size {options['batch_size']}, concurrency {options['concurrency']})"
+        )
+
+        try:
+            while True:
+                close_old_connections()
+                started = time.monotonic()
+                stats = process_batch(
+                    worker_id,
+                    batch_size=options['batch_size'],
+                    concurrency=options['concurrency'],
+                    lease_seconds=options['lease'],
+                )
+                for key, value in stats.items():
+                    totals[key] += value
+
+                if stats['claimed']:
+                    sends = stats['sent'] + stats['retried'] + stats['failed']
+                    avg_ms = (stats['send_seconds'] / sends * 1000) if sends else 0
+                    self.stdout.write(
+                        f"Batch of {stats['claimed']}: {stats['sent']} sent, {stats['retried']} retrying, "
+                        f"{stats['failed']} failed, {stats['skipped']} skipped "
+                        f"in {time.monotonic() - started:.2f}s (avg send {avg_ms:.0f}ms per email)"
+                    )
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping email worker")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Totals: {totals['sent']} sent, {totals['retried']} retried, "
+            f"{totals['failed']} failed, {totals['skipped']} skipped"
+        ))
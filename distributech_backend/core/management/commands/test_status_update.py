@@ -3,8 +3,9 @@ Management command to test order status update functionality
 """
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from core.models import Order, OrderStatus, OrderStatusChoices
+from core.models import Order, OrderStatusChoices
 from core.utils.email_utils import send_status_change_notification
+from core.utils.order_transitions import InvalidStatusTransition, apply_status_change
 
 class Command(BaseCommand):
     help = 'Test order status update and email notification'
@@ -30,7 +31,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--email', 
             type=str, 
-            help='Email address to send notification to (defaults to manager@distributech.com)'
+            help='Email address to send notification to (defaults to the department managers)'
         )
         parser.add_argument(
             '--remarks', 
@@ -62,19 +63,19 @@ class Command(BaseCommand):
         
         self.stdout.write(f"Current status of Order #{order_id}: {order.status}")
         
-        # Create new order status
-        order_status = OrderStatus.objects.create(
-            order=order,
-            status=status,
-            current_location=location,
-            location_timestamp=timezone.now(),
-            remarks=remarks,
-            expected_delivery_date=timezone.now().date() + timezone.timedelta(days=7)
-        )
-        
-        # Update order status field
-        order.status = status
-        order.save()
+        # Record the status change through the transition rules
+        try:
+            order_status = apply_status_change(
+                order.id,
+                status,
+                current_location=location,
+                remarks=remarks,
+                expected_delivery_date=timezone.now().date() + timezone.timedelta(days=7),
+                notify=False
+            )
+        except InvalidStatusTransition as e:
+            self.stderr.write(self.style.ERROR(str(e)))
+            return
         
         self.stdout.write(self.style.SUCCESS(f"Order status updated to: {status}"))
         
@@ -82,7 +83,7 @@ class Command(BaseCommand):
         if email:
             self.stdout.write(f"Sending email notification to: {email}")
         else:
-            self.stdout.write("Sending email notification to default manager address")
+            self.stdout.write("Sending email notification to the routed recipients")
         
         success = send_status_change_notification(order_status, email)
         
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
-from core.models import Order, OrderStatus
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from core.models import Order, OrderStatus, OrderStatusChoices
 from django.utils import timezone
 import datetime
 
@@ -9,45 +11,73 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--days', type=int, default=7, help='Number of days to look back for orders')
         parser.add_argument('--status', type=str, default='Pending', help='Status to set for orders (Pending, Processing, Shipped, etc.)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders fetched and status entries inserted per batch')
         parser.add_argument('--dry-run', action='store_true', help='Only show what would be done without actually updating')
 
     def handle(self, *args, **options):
         # Get orders from the last N days
         days = options['days']
         status = options['status']
+        batch_size = options['batch_size']
         dry_run = options['dry_run']
-        
-        cutoff_date = timezone.now() - datetime.timedelta(days=days)
-        
-        # Find orders that don't have an OrderStatus entry
-        orders_without_status = []
-        recent_orders = Order.objects.filter(created_at__gte=cutoff_date)
-        
-        for order in recent_orders:
-            if not OrderStatus.objects.filter(order=order).exists():
-                orders_without_status.append(order)
-        
-        self.stdout.write(f"Found {len(orders_without_status)} orders without status entries")
-        
+        verbose = options['verbosity'] > 1
+
+        if status not in OrderStatusChoices.values:
+            raise CommandError(f"Invalid status '{status}'. Valid options are: {', '.join(OrderStatusChoices.values)}")
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        now = timezone.now()
+        cutoff_date = now - datetime.timedelta(days=days)
+        expected_delivery_date = now.date() + datetime.timedelta(days=7)
+
+        # Anti-join: orders without any OrderStatus entry, resolved by the database
+        orders_without_status = (
+            Order.objects.filter(created_at__gte=cutoff_date)
+            .filter(~Exists(OrderStatus.objects.filter(order=OuterRef('pk'))))
+            .order_by('id')
+        )
+        total = orders_without_status.count()
+
+        self.stdout.write(f"Found {total} orders without status entries")
+
         if dry_run:
             self.stdout.write(self.style.WARNING("Dry run mode - no changes will be made"))
-            
-        # Create OrderStatus entries for orders without them
+
+        # Walk the orders by primary key so every batch is one indexed query,
+        # whether or not earlier batches have been written yet
+        batch_query = orders_without_status.select_related('user').only('id', 'status', 'user__username')
+        processed = 0
         created_count = 0
-        for order in orders_without_status:
+        last_id = 0
+        while True:
+            batch = list(batch_query.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
             if not dry_run:
-                OrderStatus.objects.create(
-                    order=order,
-                    status=status,
-                    location_timestamp=timezone.now(),
-                    remarks=f"Auto-created status for order {order.id}",
-                    expected_delivery_date=timezone.now().date() + datetime.timedelta(days=7)
-                )
-                created_count += 1
-            
-            self.stdout.write(f"Order #{order.id} - Created by: {order.user.username} - Current status: {order.status}")
-        
+                with transaction.atomic():
+                    OrderStatus.objects.bulk_create([
+                        OrderStatus(
+                            order_id=order.id,
+                            status=status,
+                            location_timestamp=now,
+                            remarks=f"Auto-created status for order {order.id}",
+                            expected_delivery_date=expected_delivery_date
+                        )
+                        for order in batch
+                    ])
+                created_count += len(batch)
+
+            if verbose:
+                for order in batch:
+                    self.stdout.write(f"Order #{order.id} - Created by: {order.user.username} - Current status: {order.status}")
+
+            processed += len(batch)
+            self.stdout.write(f"Processed {processed}/{total} orders")
+
         if not dry_run:
             self.stdout.write(self.style.SUCCESS(f"Successfully created {created_count} order status entries"))
         else:
-            self.stdout.write(self.style.SUCCESS(f"Would create {len(orders_without_status)} order status entries")) 
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS(f"Would create {processed} order status entries"))
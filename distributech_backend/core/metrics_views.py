@@ -0,0 +1,49 @@
+"""
+Prometheus metrics endpoint for DistribuTech
+"""
+import hmac
+
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponse
+
+from .models import Stock
+from .utils import metrics
+from .utils.email_outbox import outbox_summary
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _gauges():
+    """Gauges read from the database at scrape time"""
+    summary = outbox_summary()
+    low_stock = Stock.objects.filter(current_stock__lte=F('minimum_threshold')).count()
+    return [
+        (
+            'distributech_email_outbox_entries', 'Email outbox entries by status',
+            [({'status': status}, count) for status, count in summary['counts'].items()],
+        ),
+        (
+            'distributech_email_outbox_oldest_due_seconds', 'Age of the oldest pending email that is due',
+            [({}, summary['oldest_due_seconds'])],
+        ),
+        (
+            'distributech_low_stock_items', 'Stock records at or below their minimum threshold',
+            [({}, low_stock)],
+        ),
+    ]
+
+
+def metrics_view(request):
+    """
+    Metrics of all worker processes in the Prometheus text format
+
+    Open unless ``METRICS_TOKEN`` is set, in which case scrapers must send
+    ``Authorization: Bearer <token>``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(header, f'Bearer {token}'):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(metrics.render(_gauges()), content_type=CONTENT_TYPE)
@@ -0,0 +1,356 @@
+"""
+Middleware for DistribuTech
+
+Every middleware here works in both modes, so that under ASGI Django does
+not have to run them through ``sync_to_async`` on every request.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import db_router
+from .utils import metrics
+from .utils.instrumentation import (
+    RequestStats, current_stats, install_query_dispatch, install_serializer_timing, wrap_queries
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Measure database, serializer and render time of sampled requests
+
+    A share of requests (``INSTRUMENTATION_SAMPLE_RATE``, default 0.1) is
+    instrumented; the others pass through untouched, so the cost can be tuned
+    for production. Sampled requests get a ``Server-Timing`` header (unless
+    ``INSTRUMENTATION_SERVER_TIMING`` is False) and are logged to the
+    ``core.middleware`` logger as one JSON line, with the slowest SQL
+    fingerprints, when they take ``INSTRUMENTATION_SLOW_MS`` (default 500)
+    or more or repeat one query ``INSTRUMENTATION_REPEAT_THRESHOLD`` (default
+    10) times or more.
+
+    Put it first in ``MIDDLEWARE`` so the timings cover the whole request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.1)
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+        self.slow_ms = getattr(settings, 'INSTRUMENTATION_SLOW_MS', 500)
+        self.repeat_threshold = getattr(settings, 'INSTRUMENTATION_REPEAT_THRESHOLD', 10)
+        self.top_queries = getattr(settings, 'INSTRUMENTATION_TOP_QUERIES', 5)
+        install_serializer_timing()
+        install_query_dispatch()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        stats = RequestStats()
+        with self.measure(stats):
+            response = self.get_response(request)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        with self.measure(stats):
+            response = await self.get_response(request)
+        return self.finish(request, response, stats)
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def measure(self, stats):
+        token = current_stats.set(stats)
+        try:
+            with wrap_queries(stats.execute_wrapper):
+                yield
+        finally:
+            current_stats.reset(token)
+
+    def finish(self, request, response, stats):
+        stats.finish()
+        # Streaming bodies are produced after this returns, so there is nothing meaningful to report
+        if response.streaming:
+            return response
+
+        if self.server_timing:
+            response['Server-Timing'] = stats.server_timing()
+        self.log(request, response, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of DRF and template responses"""
+        stats = current_stats.get()
+        if stats is not None:
+            started = stats.total_time
+
+            def rendered(response):
+                stats.render_time += stats.total_time - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def log(self, request, response, stats):
+        total_ms = stats.total_time * 1000
+        fingerprints = stats.fingerprints()
+        most_repeated = max((summary['count'] for summary in fingerprints), default=0)
+        if total_ms < self.slow_ms and most_repeated < self.repeat_threshold:
+            return
+
+        logger.warning(json.dumps({
+            'event': 'slow_request' if total_ms >= self.slow_ms else 'repeated_queries',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_ms': round(stats.db_time * 1000, 2),
+            'serialize_ms': round(stats.serializer_time * 1000, 2),
+            'render_ms': round(stats.render_time * 1000, 2),
+            'queries': stats.query_count,
+            'duplicates': stats.duplicate_count,
+            'top_sql': fingerprints[:self.top_queries],
+        }))
+
+
+class MetricsMiddleware:
+    """
+    Count requests, their latency and their SQL queries per route for ``/metrics``
+
+    Routes are labelled with the URL name (``order-detail``,
+    ``analytics-lead-times``...) so the number of series stays bounded;
+    requests that match no URL are labelled ``unmatched``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_dispatch()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = QueryTotals()
+        start = time.perf_counter()
+        with wrap_queries(queries.execute_wrapper):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryTotals()
+        start = time.perf_counter()
+        with wrap_queries(queries.execute_wrapper):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    def record(self, request, response, duration, queries):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match else 'unmatched'
+        metrics.REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        metrics.REQUEST_DURATION.observe(duration, route=route, method=request.method)
+        if queries.count:
+            metrics.DB_QUERIES.inc(queries.count, route=route)
+            metrics.DB_QUERY_SECONDS.inc(queries.seconds, route=route)
+
+
+class QueryTotals:
+    """Number and duration of the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.count += 1
+                self.seconds += duration
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Read from a replica during safe requests, except right after a write
+
+    GET, HEAD and OPTIONS requests read from a healthy replica (see
+    ``core.db_router``). Any other request reads and writes on the primary
+    and pins its client to the primary for ``REPLICA_PIN_SECONDS`` (default
+    5), so the client reads its own writes while the replicas catch up. The
+    pin is kept in two places:
+
+    - a cookie (``REPLICA_PIN_COOKIE``, default ``primary_until``) holding
+      the time it expires, for browsers;
+    - the cache (``REPLICA_PIN_CACHE_ALIAS``, default ``default``), keyed by
+      the ``user_id`` claim of the JWT access token, for API clients that do
+      not keep cookies. Use a cache shared by all processes (Redis) for it to
+      follow the client across workers.
+
+    Does nothing when ``DATABASE_REPLICAS`` is empty.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        self.cookie_name = getattr(settings, 'REPLICA_PIN_COOKIE', 'primary_until')
+        self.authentication = JWTAuthentication()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not db_router.get_replicas():
+            return self.get_response(request)
+
+        user_id = self.token_user_id(request)
+        if request.method in SAFE_METHODS:
+            cached = self.get_cache().get(self.cache_key(user_id)) if user_id is not None else None
+            if self.is_pinned(request, cached):
+                return self.get_response(request)
+            with db_router.replica_reads():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        until = self.pin(response)
+        if user_id is not None:
+            self.get_cache().set(self.cache_key(user_id), until, self.pin_seconds)
+        return response
+
+    async def __acall__(self, request):
+        if not db_router.get_replicas():
+            return await self.get_response(request)
+
+        user_id = self.token_user_id(request)
+        if request.method in SAFE_METHODS:
+            cached = await self.get_cache().aget(self.cache_key(user_id)) if user_id is not None else None
+            if self.is_pinned(request, cached):
+                return await self.get_response(request)
+            with db_router.replica_reads():
+                return await self.get_response(request)
+
+        response = await self.get_response(request)
+        until = self.pin(response)
+        if user_id is not None:
+            await self.get_cache().aset(self.cache_key(user_id), until, self.pin_seconds)
+        return response
+
+    def get_cache(self):
+        return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+    def cache_key(self, user_id):
+        return f'primary_until:{user_id}'
+
+    def token_user_id(self, request):
+        """
+        Return the user id claim of the request's access token, without loading the user
+
+        Returns:
+            User id, or None for requests without a valid token
+        """
+        header = self.authentication.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        try:
+            token = self.authentication.get_validated_token(raw_token)
+        except InvalidToken:
+            return None
+        return token.get(jwt_settings.USER_ID_CLAIM)
+
+    def is_pinned(self, request, cached):
+        """
+        Whether the client wrote recently
+
+        Args:
+            cached: Pin stored in the cache for the token's user, if any
+        """
+        now = time.time()
+        until = cached or request.COOKIES.get(self.cookie_name)
+        try:
+            until = float(until)
+        except (TypeError, ValueError):
+            return False
+        # A cookie set further ahead than one window (plus rounding) was not set by us
+        return now < until <= now + self.pin_seconds + 1
+
+    def pin(self, response):
+        """Set the pin cookie on a response, returning the time the pin expires"""
+        until = time.time() + self.pin_seconds
+        response.set_cookie(
+            self.cookie_name, f'{until:.3f}', max_age=self.pin_seconds, httponly=True, samesite='Lax'
+        )
+        return until
+
+
+class AsyncViewsMiddleware:
+    """
+    Serve the async views of ``core/async_views.py`` to requests handled under ASGI
+
+    Under ASGI, requests are resolved with ``ASYNC_URLCONF`` (default
+    ``core.async_urls``), which routes the hottest public read endpoints to
+    their async versions. Under WSGI it does nothing, so the synchronous
+    views keep serving without an event loop per request.
+
+    The async views only run without a thread hop when every middleware in
+    ``MIDDLEWARE`` is async capable (Django's own, django-cors-headers' and
+    the ones in this module are).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.urlconf = getattr(settings, 'ASYNC_URLCONF', 'core.async_urls')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.urlconf = self.urlconf
+        return await self.get_response(request)
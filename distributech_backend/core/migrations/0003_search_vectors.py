@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-18 22:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Keep search_vector in sync with the text column inside the database so that
+# bulk inserts, raw SQL and updates through any client stay searchable.
+SEARCH_TRIGGERS_SQL = """
+CREATE TRIGGER message_search_vector_update
+    BEFORE INSERT OR UPDATE OF content ON core_message
+    FOR EACH ROW EXECUTE FUNCTION
+    tsvector_update_trigger(search_vector, 'pg_catalog.english', content);
+
+CREATE TRIGGER comment_search_vector_update
+    BEFORE INSERT OR UPDATE OF comment_text ON core_comment
+    FOR EACH ROW EXECUTE FUNCTION
+    tsvector_update_trigger(search_vector, 'pg_catalog.english', comment_text);
+
+UPDATE core_message SET search_vector = to_tsvector('pg_catalog.english', content);
+UPDATE core_comment SET search_vector = to_tsvector('pg_catalog.english', comment_text);
+"""
+
+DROP_SEARCH_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS message_search_vector_update ON core_message;
+DROP TRIGGER IF EXISTS comment_search_vector_update ON core_comment;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_conversation_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfill before building the indexes so GIN is built once, not row by row
+        migrations.RunSQL(SEARCH_TRIGGERS_SQL, DROP_SEARCH_TRIGGERS_SQL),
+        migrations.AddIndex(
+            model_name='comment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='comment_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='message_search_idx'),
+        ),
+    ]
@@ -0,0 +1,140 @@
+# Generated by Django 5.1.7 on 2026-10-18 22:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def _months_between(first, last):
+    """Yield first-of-month dates from ``first`` to ``last`` inclusive"""
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield year, month
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def partition_message_table(apps, schema_editor):
+    """
+    Rebuild core_message as a table range-partitioned by month on timestamp
+
+    The primary key becomes (id, timestamp) because Postgres requires the
+    partition key in every unique constraint; Django keeps addressing rows by
+    ``id`` alone, which stays unique through the shared sequence.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Message = apps.get_model('core', 'Message')
+    table = Message._meta.db_table
+    conversation_idx = schema_editor._create_index_name(table, ['conversation_id'], suffix='')
+    sender_idx = schema_editor._create_index_name(table, ['sender_id'], suffix='')
+    conversation_fk = schema_editor._create_index_name(
+        table, ['conversation_id'], suffix='_fk_core_conversation_id'
+    )
+    sender_fk = schema_editor._create_index_name(table, ['sender_id'], suffix='_fk_core_user_id')
+
+    execute = schema_editor.execute
+    execute('DROP TRIGGER IF EXISTS message_search_vector_update ON core_message')
+    execute('ALTER TABLE core_message RENAME TO core_message_legacy')
+    execute('ALTER TABLE core_message_legacy RENAME CONSTRAINT core_message_pkey TO core_message_legacy_pkey')
+    execute('ALTER SEQUENCE IF EXISTS core_message_id_seq RENAME TO core_message_legacy_id_seq')
+    execute(f'DROP INDEX IF EXISTS message_search_idx, "{conversation_idx}", "{sender_idx}"')
+
+    execute('CREATE SEQUENCE core_message_id_seq AS integer')
+    execute(f"""
+        CREATE TABLE core_message (
+            id integer NOT NULL DEFAULT nextval('core_message_id_seq'),
+            content text NOT NULL,
+            "timestamp" timestamp with time zone NOT NULL,
+            is_read boolean NOT NULL,
+            conversation_id integer NOT NULL,
+            sender_id integer NOT NULL,
+            search_vector tsvector NULL,
+            CONSTRAINT core_message_pkey PRIMARY KEY (id, "timestamp"),
+            CONSTRAINT "{conversation_fk}" FOREIGN KEY (conversation_id)
+                REFERENCES core_conversation (id) DEFERRABLE INITIALLY DEFERRED,
+            CONSTRAINT "{sender_fk}" FOREIGN KEY (sender_id)
+                REFERENCES core_user (id) DEFERRABLE INITIALLY DEFERRED
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    execute('ALTER SEQUENCE core_message_id_seq OWNED BY core_message.id')
+    execute('CREATE TABLE core_message_default PARTITION OF core_message DEFAULT')
+
+    # One partition per month that already holds data, up to three months ahead
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(MIN(\"timestamp\"), now()), now() + interval '3 months' "
+            "FROM core_message_legacy"
+        )
+        first, last = cursor.fetchone()
+    for year, month in _months_between(first, last):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        execute(
+            f'CREATE TABLE "core_message_p{year:04d}{month:02d}" PARTITION OF core_message '
+            f"FOR VALUES FROM ('{year:04d}-{month:02d}-01 00:00:00+00') "
+            f"TO ('{next_year:04d}-{next_month:02d}-01 00:00:00+00')"
+        )
+
+    execute("""
+        INSERT INTO core_message (id, content, "timestamp", is_read, conversation_id, sender_id, search_vector)
+        SELECT id, content, "timestamp", is_read, conversation_id, sender_id, search_vector
+        FROM core_message_legacy
+    """)
+    execute('DROP TABLE core_message_legacy')
+    execute("SELECT setval('core_message_id_seq', COALESCE((SELECT MAX(id) FROM core_message), 0) + 1, false)")
+
+    execute(f'CREATE INDEX "{conversation_idx}" ON core_message (conversation_id)')
+    execute(f'CREATE INDEX "{sender_idx}" ON core_message (sender_id)')
+    execute('CREATE INDEX message_search_idx ON core_message USING gin (search_vector)')
+    execute("""
+        CREATE TRIGGER message_search_vector_update
+            BEFORE INSERT OR UPDATE OF content ON core_message
+            FOR EACH ROW EXECUTE FUNCTION
+            tsvector_update_trigger(search_vector, 'pg_catalog.english', content)
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_search_vectors'),
+    ]
+
+    operations = [
+        # Irreversible: the partitioned table cannot be collapsed back automatically
+        migrations.RunPython(partition_message_table),
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=500)),
+                ('message_count', models.IntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-timestamp'], name='message_conv_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['conversation'], name='message_unread_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagearchive',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_archives', to='core.conversation'),
+        ),
+        migrations.AddConstraint(
+            model_name='messagearchive',
+            constraint=models.UniqueConstraint(fields=('conversation', 'month'), name='unique_message_archive_month'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 22:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_message_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=50)),
+                ('recipients', models.JSONField(blank=True, default=list)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Sending', 'Sending'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=5)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status__in', ['Pending', 'Sending'])), fields=['next_attempt_at'], name='email_outbox_due_idx')],
+            },
+        ),
+    ]
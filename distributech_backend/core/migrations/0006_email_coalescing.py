@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='coalesce_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(condition=models.Q(('coalesce_key__isnull', False), ('status', 'Pending')), fields=['coalesce_key'], name='email_outbox_coalesce_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 23:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_email_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLocation',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='location', serialize=False, to='core.order')),
+                ('latitude_e7', models.IntegerField()),
+                ('longitude_e7', models.IntegerField()),
+                ('recorded_at', models.DateTimeField()),
+                ('sampled_at', models.DateTimeField(blank=True, null=True)),
+                ('ping_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationPing',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('latitude_e7', models.IntegerField()),
+                ('longitude_e7', models.IntegerField()),
+                ('recorded_at', models.DateTimeField()),
+                ('order', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='location_pings', to='core.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'recorded_at'], name='location_ping_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,182 @@
+# Generated by Django 5.1.7 on 2026-10-18 23:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Keep the denormalized order columns in sync inside the database so that
+# bulk inserts, the item and status viewsets and raw SQL all update them.
+# Statement level triggers recompute each affected order once per statement.
+ORDER_TRIGGERS_SQL = """
+CREATE FUNCTION core_order_refresh_total() RETURNS trigger AS $$
+DECLARE
+    order_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM old_rows);
+    ELSE
+        order_ids := ARRAY(SELECT order_id FROM new_rows UNION SELECT order_id FROM old_rows);
+    END IF;
+
+    UPDATE core_order o
+    SET total_amount = COALESCE((
+        SELECT SUM(i.quantity * i.price_at_order_time)
+        FROM core_orderitem i
+        WHERE i.order_id = o.id
+    ), 0)
+    WHERE o.id = ANY(order_ids);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_order_refresh_latest_status() RETURNS trigger AS $$
+DECLARE
+    order_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM old_rows);
+    ELSE
+        order_ids := ARRAY(SELECT order_id FROM new_rows UNION SELECT order_id FROM old_rows);
+    END IF;
+
+    UPDATE core_order o
+    SET current_location = latest.current_location,
+        expected_delivery_date = latest.expected_delivery_date
+    FROM unnest(order_ids) AS ids(id)
+    LEFT JOIN LATERAL (
+        SELECT s.current_location, s.expected_delivery_date
+        FROM core_orderstatus s
+        WHERE s.order_id = ids.id
+        ORDER BY s.id DESC
+        LIMIT 1
+    ) latest ON true
+    WHERE o.id = ids.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER orderitem_total_insert AFTER INSERT ON core_orderitem
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_total();
+CREATE TRIGGER orderitem_total_update AFTER UPDATE ON core_orderitem
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_total();
+CREATE TRIGGER orderitem_total_delete AFTER DELETE ON core_orderitem
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_total();
+
+CREATE TRIGGER orderstatus_latest_insert AFTER INSERT ON core_orderstatus
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_latest_status();
+CREATE TRIGGER orderstatus_latest_update AFTER UPDATE ON core_orderstatus
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_latest_status();
+CREATE TRIGGER orderstatus_latest_delete AFTER DELETE ON core_orderstatus
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_refresh_latest_status();
+
+UPDATE core_order o
+SET total_amount = totals.total
+FROM (
+    SELECT order_id, SUM(quantity * price_at_order_time) AS total
+    FROM core_orderitem
+    GROUP BY order_id
+) totals
+WHERE o.id = totals.order_id;
+
+UPDATE core_order o
+SET current_location = latest.current_location,
+    expected_delivery_date = latest.expected_delivery_date
+FROM (
+    SELECT DISTINCT ON (order_id) order_id, current_location, expected_delivery_date
+    FROM core_orderstatus
+    ORDER BY order_id, id DESC
+) latest
+WHERE o.id = latest.order_id;
+"""
+
+DROP_ORDER_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS orderitem_total_insert ON core_orderitem;
+DROP TRIGGER IF EXISTS orderitem_total_update ON core_orderitem;
+DROP TRIGGER IF EXISTS orderitem_total_delete ON core_orderitem;
+DROP TRIGGER IF EXISTS orderstatus_latest_insert ON core_orderstatus;
+DROP TRIGGER IF EXISTS orderstatus_latest_update ON core_orderstatus;
+DROP TRIGGER IF EXISTS orderstatus_latest_delete ON core_orderstatus;
+DROP FUNCTION IF EXISTS core_order_refresh_total();
+DROP FUNCTION IF EXISTS core_order_refresh_latest_status();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_location_pings'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name='order',
+            name='current_location',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='expected_delivery_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        # Backfill before building the order indexes so each is built once, not row by row
+        migrations.RunSQL(ORDER_TRIGGERS_SQL, DROP_ORDER_TRIGGERS_SQL),
+        # Create the composite indexes before dropping the single column ones they replace
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['item', 'order'], name='orderitem_item_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['supplier', 'item'], name='stock_supplier_item_idx'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.item'),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='supplier',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount'], name='order_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['expected_delivery_date'], name='order_expected_delivery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('current_location'), name='gin_trgm_ops'), name='order_location_trgm_idx'),
+        ),
+    ]
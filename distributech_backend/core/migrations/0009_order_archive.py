@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 23:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_order_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('current_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('expected_delivery_date', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('comment_text', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_set', to='core.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttachment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('file_url', models.TextField()),
+                ('uploaded_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachment_set', to='core.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('price_at_order_time', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.item')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderitem_set', to='core.archivedorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderStatus',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Shipped', 'Shipped'), ('In Transit', 'In Transit'), ('Delivered', 'Delivered'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('current_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('location_timestamp', models.DateTimeField()),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('expected_delivery_date', models.DateField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderstatus_set', to='core.archivedorder')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
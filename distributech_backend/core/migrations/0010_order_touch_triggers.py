@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+# Touch Order.updated_at whenever the rows embedded in the order detail
+# change, so that it can serve as the version of the whole order for
+# conditional requests. Statement level triggers touch each affected order
+# once per statement, however many rows it writes.
+TOUCH_FUNCTION_SQL = """
+CREATE FUNCTION core_order_touch() RETURNS trigger AS $$
+DECLARE
+    order_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        order_ids := ARRAY(SELECT DISTINCT order_id FROM old_rows);
+    ELSE
+        order_ids := ARRAY(SELECT order_id FROM new_rows UNION SELECT order_id FROM old_rows);
+    END IF;
+
+    UPDATE core_order SET updated_at = now() WHERE id = ANY(order_ids);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+TOUCHING_TABLES = ['orderitem', 'orderstatus', 'comment', 'attachment']
+
+TRIGGER_SQL = """
+CREATE TRIGGER {table}_touch_insert AFTER INSERT ON core_{table}
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_touch();
+CREATE TRIGGER {table}_touch_update AFTER UPDATE ON core_{table}
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_touch();
+CREATE TRIGGER {table}_touch_delete AFTER DELETE ON core_{table}
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_order_touch();
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS {table}_touch_insert ON core_{table};
+DROP TRIGGER IF EXISTS {table}_touch_update ON core_{table};
+DROP TRIGGER IF EXISTS {table}_touch_delete ON core_{table};
+"""
+
+ORDER_TOUCH_SQL = TOUCH_FUNCTION_SQL + ''.join(TRIGGER_SQL.format(table=table) for table in TOUCHING_TABLES)
+
+DROP_ORDER_TOUCH_SQL = (
+    ''.join(DROP_TRIGGER_SQL.format(table=table) for table in TOUCHING_TABLES)
+    + "DROP FUNCTION IF EXISTS core_order_touch();\n"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_order_archive'),
+    ]
+
+    operations = [
+        migrations.RunSQL(ORDER_TOUCH_SQL, DROP_ORDER_TOUCH_SQL),
+    ]
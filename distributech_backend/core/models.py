@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 
@@ -115,9 +118,25 @@ class Order(models.Model):
     status = models.CharField(max_length=50, null=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized for filtering, maintained by database triggers (see migration 0008):
+    # the sum of the order lines, and the location and expected delivery date
+    # of the latest OrderStatus row
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    current_location = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    expected_delivery_date = models.DateField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"Order #{self.id}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['total_amount'], name='order_total_idx'),
+            models.Index(fields=['expected_delivery_date'], name='order_expected_delivery_idx'),
+            # Serves current_location__icontains, which compares UPPER(current_location)
+            GinIndex(OpClass(Upper('current_location'), name='gin_trgm_ops'), name='order_location_trgm_idx'),
+        ]
 
 # Order Status model
 class OrderStatus(models.Model):
@@ -133,6 +152,56 @@ class OrderStatus(models.Model):
     def __str__(self):
         return f"Status: {self.status} for {self.order}"
 
+# Location Ping model
+# Downsampled GPS/scanner position history. Coordinates are stored as
+# integers in 1e-7 degrees (about 1 cm) to keep the rows small.
+class LocationPing(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    # Covered by location_ping_order_idx
+    order = models.ForeignKey(Order, related_name='location_pings', on_delete=models.CASCADE, db_index=False)
+    latitude_e7 = models.IntegerField(null=False)
+    longitude_e7 = models.IntegerField(null=False)
+    recorded_at = models.DateTimeField(null=False)
+
+    @property
+    def latitude(self):
+        return self.latitude_e7 / 1e7
+
+    @property
+    def longitude(self):
+        return self.longitude_e7 / 1e7
+
+    def __str__(self):
+        return f"Ping for Order #{self.order_id} at {self.recorded_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'recorded_at'], name='location_ping_order_idx'),
+        ]
+
+# Order Location model
+# Latest known position of each order, upserted on every ping batch
+class OrderLocation(models.Model):
+    order = models.OneToOneField(Order, related_name='location', on_delete=models.CASCADE, primary_key=True)
+    latitude_e7 = models.IntegerField(null=False)
+    longitude_e7 = models.IntegerField(null=False)
+    recorded_at = models.DateTimeField(null=False)
+    # recorded_at of the last ping written to LocationPing, used for downsampling
+    sampled_at = models.DateTimeField(null=True, blank=True)
+    ping_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def latitude(self):
+        return self.latitude_e7 / 1e7
+
+    @property
+    def longitude(self):
+        return self.longitude_e7 / 1e7
+
+    def __str__(self):
+        return f"Location of Order #{self.order_id}"
+
 # Item model
 class Item(models.Model):
     id = models.AutoField(primary_key=True)
@@ -149,12 +218,19 @@ class Item(models.Model):
 class OrderItem(models.Model):
     id = models.AutoField(primary_key=True)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, null=False)
-    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=False)
+    # Covered by orderitem_item_order_idx
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=False, db_index=False)
     quantity = models.IntegerField(null=False)
     price_at_order_time = models.DecimalField(max_digits=10, decimal_places=2, null=False)
     
     def __str__(self):
         return f"{self.quantity} x {self.item.name} in Order #{self.order.id}"
+    
+    class Meta:
+        indexes = [
+            # Orders containing an item, answered from the index alone
+            models.Index(fields=['item', 'order'], name='orderitem_item_order_idx'),
+        ]
 
 # Stock model
 class Stock(models.Model):
@@ -162,11 +238,17 @@ class Stock(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, null=False)
     current_stock = models.IntegerField(null=False)
     minimum_threshold = models.IntegerField(null=False)
-    supplier = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
+    # Covered by stock_supplier_item_idx
+    supplier = models.ForeignKey(User, on_delete=models.CASCADE, null=False, db_index=False)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Stock for {self.item.name}: {self.current_stock}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['supplier', 'item'], name='stock_supplier_item_idx'),
+        ]
 
 # Comment model
 class Comment(models.Model):
@@ -175,9 +257,16 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
     comment_text = models.TextField(null=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # Maintained by a database trigger (see migration 0003), never written by Django
+    search_vector = SearchVectorField(null=True, editable=False)
     
     def __str__(self):
         return f"Comment by {self.user.username} on Order #{self.order.id}"
+    
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='comment_search_idx'),
+        ]
 
 # Attachment model
 class Attachment(models.Model):
@@ -189,6 +278,55 @@ class Attachment(models.Model):
     def __str__(self):
         return f"Attachment for Order #{self.order.id}"
 
+# Archived order models
+# Closed orders and all their child rows are moved here by the archive_orders
+# command. Columns match the operational tables so rows are copied with
+# INSERT ... SELECT, and the reverse accessors match those of Order so the
+# order serializers work on archived orders unchanged.
+class ArchivedOrder(models.Model):
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
+    status = models.CharField(max_length=50, null=False)
+    created_at = models.DateTimeField(null=False)
+    updated_at = models.DateTimeField(null=False)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    current_location = models.CharField(max_length=255, null=True, blank=True)
+    expected_delivery_date = models.DateField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Archived Order #{self.id}"
+
+class ArchivedOrderItem(models.Model):
+    id = models.IntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='orderitem_set', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=False)
+    quantity = models.IntegerField(null=False)
+    price_at_order_time = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+
+class ArchivedOrderStatus(models.Model):
+    id = models.IntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='orderstatus_set', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=OrderStatusChoices.choices, null=False)
+    current_location = models.CharField(max_length=255, null=True, blank=True)
+    location_timestamp = models.DateTimeField(null=False)
+    updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    remarks = models.TextField(null=True, blank=True)
+    expected_delivery_date = models.DateField(null=True, blank=True)
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='comment_set', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
+    comment_text = models.TextField(null=False)
+    created_at = models.DateTimeField(null=False)
+
+class ArchivedAttachment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='attachment_set', on_delete=models.CASCADE)
+    file_url = models.TextField(null=False)
+    uploaded_at = models.DateTimeField(null=False)
+
 # Chat Conversation model
 class Conversation(models.Model):
     id = models.AutoField(primary_key=True)
@@ -210,9 +348,85 @@ class Message(models.Model):
     content = models.TextField(null=False, blank=False)
     timestamp = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
+    # Maintained by a database trigger (see migration 0003), never written by Django
+    search_vector = SearchVectorField(null=True, editable=False)
     
     def __str__(self):
         return f"Message from {self.sender.username} in Conversation #{self.conversation.id}"
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='message_search_idx'),
+            models.Index(fields=['conversation', '-timestamp'], name='message_conv_ts_idx'),
+            models.Index(
+                fields=['conversation'], name='message_unread_idx',
+                condition=models.Q(is_read=False)
+            ),
+        ]
+
+# Archived message index model
+# One row per conversation and month that was moved out of the partitioned
+# message table into a compressed JSONL file
+class MessageArchive(models.Model):
+    id = models.AutoField(primary_key=True)
+    conversation = models.ForeignKey(Conversation, related_name='message_archives', on_delete=models.CASCADE)
+    month = models.DateField(null=False)
+    path = models.CharField(max_length=500, null=False)
+    message_count = models.IntegerField(null=False)
+    first_timestamp = models.DateTimeField(null=False)
+    last_timestamp = models.DateTimeField(null=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Archive of Conversation #{self.conversation_id} for {self.month:%Y-%m}"
+    
+    class Meta:
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'month'], name='unique_message_archive_month'),
+        ]
+
+# Enum for email outbox status choices
+class EmailOutboxStatus(models.TextChoices):
+    PENDING = 'Pending', 'Pending'
+    SENDING = 'Sending', 'Sending'
+    SENT = 'Sent', 'Sent'
+    FAILED = 'Failed', 'Failed'
+
+# Email Outbox model
+# Emails are written here in the same transaction as the change that caused
+# them and delivered later by the run_email_worker command
+class EmailOutbox(models.Model):
+    id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=50, null=False)
+    recipients = models.JSONField(default=list, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    # Pending emails with the same key (kind + recipient) are merged into one digest
+    coalesce_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(
+        max_length=20, choices=EmailOutboxStatus.choices, default=EmailOutboxStatus.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Email #{self.id} ({self.kind}, {self.status})"
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'], name='email_outbox_due_idx',
+                condition=models.Q(status__in=['Pending', 'Sending'])
+            ),
+            models.Index(
+                fields=['coalesce_key'], name='email_outbox_coalesce_idx',
+                condition=models.Q(status='Pending', coalesce_key__isnull=False)
+            ),
+        ]
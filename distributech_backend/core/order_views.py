@@ -1,22 +1,89 @@
 """
 Order-related views for DistribuTech
 """
+import datetime
+
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
-import threading
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from .models import Order
-from .serializers import OrderSerializer, OrderDetailSerializer
+from .models import ArchivedOrder, Order, OrderLocation
+from .serializers import (
+    OrderSerializer, OrderDetailSerializer, OrderCreateSerializer,
+    OrderLocationSerializer, LocationPingSerializer, prefetch_order_details, user_relations
+)
+from .filters import OrderFilter
+from .renderers import CSVRenderer, NDJSONRenderer
 from .permissions import IsSuperAdmin, IsDepartmentManager, IsWarehouseManager, IsSupplier, IsAdministrator
-from .utils.email_utils import send_order_notification
+from .utils.conditional import conditional, order_validators
+from .utils.email_outbox import queue_order_notification
+from .utils.location_tracking import ingest_pings, to_e7
+from .utils.order_archive import get_archived_order
+from .utils.order_export import export_rows, gzip_stream, iter_csv, iter_ndjson
+from .utils.order_timeline import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, order_timeline
+
+def get_visible_orders(user, model=Order):
+    """
+    Return the orders the given user is allowed to see, based on their role
+    
+    Pass ``model=ArchivedOrder`` to apply the same rules to archived orders.
+    """
+    if user.role.name in ['SuperAdmin', 'Administrator', 'Warehouse Manager', 'Supplier']:
+        return model.objects.all()
+    # Department managers can only see their department's orders
+    elif user.role.name == 'Department Manager':
+        return model.objects.filter(user__department=user.department)
+    return model.objects.none()
+
+def _parse_datetime_param(value):
+    """Parse an ISO 8601 string into an aware datetime, None if it is not one"""
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def _parse_ping(data):
+    """
+    Validate one location ping from a request
+    
+    Returns:
+        Tuple of (ping dict, None) or (None, error message)
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('order_id'), int):
+        return None, 'order_id must be an integer'
+    
+    coordinates = {}
+    for name, limit in (('latitude', 90), ('longitude', 180)):
+        value = data.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not -limit <= value <= limit:
+            return None, f'{name} must be a number between -{limit} and {limit}'
+        coordinates[name] = to_e7(value)
+    
+    recorded_at = timezone.now()
+    if data.get('recorded_at') is not None:
+        recorded_at = _parse_datetime_param(data['recorded_at'])
+        if recorded_at is None:
+            return None, 'recorded_at must be an ISO 8601 datetime'
+    
+    return {
+        'order_id': data['order_id'],
+        'latitude_e7': coordinates['latitude'],
+        'longitude_e7': coordinates['longitude'],
+        'recorded_at': recorded_at,
+    }, None
 
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = OrderSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['status', 'user__department']
+    filterset_class = OrderFilter
+    search_fields = ['user__username', 'current_location']
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -25,26 +92,256 @@ class OrderViewSet(viewsets.ModelViewSet):
     
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role.name in ['SuperAdmin', 'Administrator', 'Warehouse Manager', 'Supplier']:
-            return Order.objects.all()
-        # Department managers can only see their department's orders
-        elif user.role.name == 'Department Manager':
-            return Order.objects.filter(user__department=user.department)
-        return Order.objects.none()
-    
-    def perform_create(self, serializer):
-        """Create order and send notification email"""
-        # Save the order
-        order = serializer.save()
-        
-        # Send email notification in a background thread to not block the request
-        email_thread = threading.Thread(
-            target=send_order_notification,
-            args=(order,)
+        # Newest first, served by order_created_idx
+        orders = get_visible_orders(self.request.user).order_by('-created_at')
+        if self.action == 'retrieve':
+            return prefetch_order_details(orders)
+        return orders.select_related(*user_relations('user'))
+    
+    def get_validators(self, request, *args, **kwargs):
+        """ETag and Last-Modified of the requested order, without loading it"""
+        return order_validators(
+            kwargs[self.lookup_field],
+            get_visible_orders(request.user),
+            get_visible_orders(request.user, ArchivedOrder),
         )
-        email_thread.start()
+    
+    @conditional(get_validators)
+    def retrieve(self, request, *args, **kwargs):
+        """Return a live order, falling back to the archive for archived ones"""
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = get_archived_order(
+                kwargs[self.lookup_field], get_visible_orders(request.user, ArchivedOrder)
+            )
+            if archived is None:
+                raise
+            data = OrderDetailSerializer(archived).data
+            data['archived'] = True
+            return Response(data)
+    
+    @conditional(get_validators)
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+    
+    def create(self, request, *args, **kwargs):
+        """
+        Create an order with its lines and initial status
+        
+        Lines are given as ``items: [{"item_id": 1, "quantity": 5}, ...]``;
+        prices are taken from the items. The order, lines, status row and
+        notification email are written in one transaction.
+        """
+        serializer = OrderCreateSerializer(data=[request.data], many=True, context=self.get_serializer_context())
+        if not serializer.is_valid():
+            return Response(serializer.errors[0], status=status.HTTP_400_BAD_REQUEST)
+        order = serializer.save()[0]
+        return Response(OrderDetailSerializer(order).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create many orders in one request
+        
+        POST payload: ``{"orders": [<order as for create>, ...]}``. Either
+        every order is created or, if any fails validation, none is.
+        """
+        orders = request.data.get('orders') if isinstance(request.data, dict) else None
+        max_orders = getattr(settings, 'ORDER_BULK_CREATE_MAX', 5000)
+        if not isinstance(orders, list) or not orders:
+            return Response({'detail': 'orders must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(orders) > max_orders:
+            return Response(
+                {'detail': f'At most {max_orders} orders are accepted per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = OrderCreateSerializer(data=orders, many=True, context=self.get_serializer_context())
+        if not serializer.is_valid():
+            # One entry per order, empty for the valid ones
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        created = serializer.save()
+        return Response({
+            'created': len(created),
+            'order_ids': [order.id for order in created]
+        }, status=status.HTTP_201_CREATED)
+        
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream the visible orders with their lines as CSV or NDJSON
         
+        Query params:
+        - format: csv (default) or ndjson
+        - from, to: Optional ISO 8601 dates or datetimes bounding created_at
+          (a date given as ``to`` includes that whole day)
+        - Any of the order list filters
+        
+        One row is written per order line. The body is gzip-compressed on the
+        fly when the client accepts it.
+        """
+        orders = self.filter_queryset(self.get_queryset())
+        for param, lookup in (('from', 'created_at__gte'), ('to', 'created_at__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                bound = _parse_datetime_param(value)
+                day = parse_date(value) if bound is None else None
+            except ValueError:
+                bound = day = None
+            if bound is None:
+                if day is None:
+                    return Response(
+                        {'detail': f'{param} must be an ISO 8601 date or datetime'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if param == 'to':
+                    lookup = 'created_at__lt'
+                    day += datetime.timedelta(days=1)
+                bound = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+            orders = orders.filter(**{lookup: bound})
+        
+        renderer = request.accepted_renderer
+        encode = iter_ndjson if renderer.format == 'ndjson' else iter_csv
+        body = encode(export_rows(orders))
+        compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if compress:
+            body = gzip_stream(body)
+        
+        response = StreamingHttpResponse(body, content_type=f'{renderer.media_type}; charset=utf-8')
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        response['Content-Disposition'] = f'attachment; filename="orders.{renderer.format}"'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='locations')
+    def locations(self, request):
+        """
+        Ingest a batch of GPS/scanner location pings
+        
+        POST payload: ``{"pings": [{"order_id": 1, "latitude": 12.97,
+        "longitude": 77.59, "recorded_at": "2025-03-01T10:00:05Z"}, ...]}``.
+        Pings update the current position of their orders and a downsampled
+        history; they never create OrderStatus rows or notifications. Invalid
+        pings are skipped and listed in the response.
+        """
+        pings = request.data.get('pings') if isinstance(request.data, dict) else None
+        max_pings = getattr(settings, 'LOCATION_PING_BULK_MAX', 10000)
+        if not isinstance(pings, list) or not pings:
+            return Response({'detail': 'pings must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(pings) > max_pings:
+            return Response(
+                {'detail': f'At most {max_pings} pings are accepted per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        valid = []
+        positions = []
+        errors = []
+        for index, data in enumerate(pings):
+            ping, error = _parse_ping(data)
+            if error:
+                order_id = data.get('order_id') if isinstance(data, dict) else None
+                errors.append({'index': index, 'order_id': order_id, 'message': error})
+                continue
+            valid.append(ping)
+            positions.append(index)
+        
+        stats = {'accepted': 0, 'stored': 0, 'orders': 0}
+        if valid:
+            stats, ingest_errors = ingest_pings(valid)
+            # Report positions in the request, not in the filtered list
+            for error in ingest_errors:
+                error['index'] = positions[error['index']]
+            errors.extend(ingest_errors)
+            errors.sort(key=lambda error: error['index'])
+        
+        return Response({
+            **stats,
+            'rejected': len(errors),
+            'errors': errors
+        }, status=status.HTTP_202_ACCEPTED if stats['accepted'] else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['get'])
+    def location(self, request, pk=None):
+        """Return the latest reported position of an order"""
+        order = self.get_object()
+        location = OrderLocation.objects.filter(order_id=order.id).first()
+        if location is None:
+            return Response({'detail': 'No location reported for this order'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(OrderLocationSerializer(location).data)
+    
+    @action(detail=True, methods=['get'], url_path='location/history')
+    def location_history(self, request, pk=None):
+        """
+        Return the downsampled position history of an order, oldest first
+        
+        Query params:
+        - from, to: Optional ISO 8601 bounds on recorded_at
+        - limit: Maximum number of points (default 500, at most 5000)
+        """
+        order = self.get_object()
+        pings = order.location_pings.order_by('recorded_at')
+        for param, lookup in (('from', 'recorded_at__gte'), ('to', 'recorded_at__lte')):
+            if param in request.query_params:
+                value = _parse_datetime_param(request.query_params[param])
+                if value is None:
+                    return Response(
+                        {'detail': f'{param} must be an ISO 8601 datetime'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                pings = pings.filter(**{lookup: value})
+        try:
+            limit = min(int(request.query_params.get('limit', 500)), 5000)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(LocationPingSerializer(pings[:max(limit, 1)], many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Return the status changes, comments and attachments of an order as
+        one stream, oldest first
+        
+        Query params:
+        - cursor: The ``next`` cursor of the previous page
+        - limit: Entries per page (default 50, at most 200)
+        
+        Archived orders return their archived activity.
+        """
+        try:
+            order = self.get_object()
+        except Http404:
+            order = get_archived_order(pk, get_visible_orders(request.user, ArchivedOrder))
+            if order is None:
+                raise
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            entries, cursor = order_timeline(order, after=request.query_params.get('cursor'), limit=limit)
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        next_url = None
+        if cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+        return Response({'next': next_url, 'results': entries})
+    
     @action(detail=True, methods=['post'])
     def notify(self, request, pk=None):
         """Manually send notification email for an order"""
@@ -53,16 +350,11 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Get email from request or use order user's email
         email = request.data.get('email', order.user.email)
         
-        # Send notification
-        success = send_order_notification(order, email)
-        
-        if success:
-            return Response({
-                'success': True,
-                'message': f'Order notification for Order #{order.id} sent successfully'
-            })
-        else:
-            return Response({
-                'success': False,
-                'message': 'Failed to send order notification. Check server logs for details.'
-            }, status=500) 
\ No newline at end of file
+        # Queue notification for the email worker
+        outbox = queue_order_notification(order, email, immediate=True)
+        
+        return Response({
+            'success': True,
+            'message': f'Order notification for Order #{order.id} queued for delivery',
+            'outbox_id': outbox.id
+        }, status=status.HTTP_202_ACCEPTED) 
\ No newline at end of file
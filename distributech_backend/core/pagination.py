@@ -0,0 +1,81 @@
+"""
+Pagination classes for DistribuTech
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RankedCursorPagination(BasePagination):
+    """
+    Keyset pagination over a queryset annotated with a numeric ``rank``.
+
+    Results are ordered by ``-rank, -id`` and the cursor stores the
+    (rank, id) pair of the last row of the page, so fetching any page costs
+    the same no matter how deep the client has scrolled. The rank must be a
+    double precision value so it survives the JSON round trip exactly.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return float(data['r']), int(data['id'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, rank, pk):
+        data = json.dumps({'r': rank, 'id': pk}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            rank, pk = cursor
+            queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=pk))
+
+        # Fetch one extra row to know whether there is a next page
+        rows = list(queryset.order_by('-rank', '-id')[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.last.rank, self.last.id)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
@@ -0,0 +1,18 @@
+"""
+Renderers for DistribuTech
+
+The export endpoint streams its own body; these renderers let DRF content
+negotiation accept ``?format=csv`` and ``?format=ndjson``. Anything DRF
+renders itself with them (error responses) is encoded as JSON.
+"""
+from rest_framework.renderers import JSONRenderer
+
+
+class CSVRenderer(JSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
@@ -0,0 +1,151 @@
+"""
+Full-text search views for DistribuTech
+
+Both endpoints query the GIN-indexed ``search_vector`` columns that are kept
+up to date by database triggers, so no ILIKE scans are involved.
+"""
+import html
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .models import Comment, Conversation, Message
+from .order_views import get_visible_orders
+from .pagination import RankedCursorPagination
+
+# Must match the text search configuration used by the triggers in migration 0003
+SEARCH_CONFIG = 'english'
+
+# ts_headline does not escape the text around the matches, so the matches are
+# delimited with control characters and turned into <mark> tags after escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+
+HEADLINE_OPTIONS = {
+    'start_sel': HIGHLIGHT_START,
+    'stop_sel': HIGHLIGHT_STOP,
+    'max_words': 35,
+    'min_words': 15,
+    'max_fragments': 2,
+}
+
+
+def safe_headline(headline):
+    """Escape a headline for HTML and wrap its matches in <mark> tags"""
+    return html.escape(headline).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+def _build_query(request):
+    """Parse the ``q`` parameter using web-search syntax (quotes, OR, -word)"""
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return None
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def _ranked(queryset, query, text_field):
+    # Cast the float4 ts_rank result to double precision so the value used in
+    # the pagination cursor compares equal to the one computed by the database
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        headline=SearchHeadline(text_field, query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS),
+    )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_messages(request):
+    """
+    Search chat messages in the conversations the user takes part in
+
+    Query params:
+    - q: Search text (web-search syntax)
+    - conversation: Optional conversation ID to restrict the search to
+    - cursor / page_size: Pagination
+    """
+    query = _build_query(request)
+    if query is None:
+        return Response({'error': 'Query parameter "q" is required'}, status=400)
+
+    conversation_ids = Conversation.participants.through.objects.filter(
+        user_id=request.user.id
+    ).values('conversation_id')
+    messages = Message.objects.filter(conversation_id__in=conversation_ids)
+
+    conversation_id = request.query_params.get('conversation')
+    if conversation_id:
+        try:
+            messages = messages.filter(conversation_id=int(conversation_id))
+        except ValueError:
+            return Response({'error': 'conversation must be an integer'}, status=400)
+
+    messages = _ranked(messages, query, 'content').select_related('sender').defer('search_vector')
+
+    paginator = RankedCursorPagination()
+    page = paginator.paginate_queryset(messages, request)
+    data = [
+        {
+            'id': message.id,
+            'conversation': message.conversation_id,
+            'sender': {
+                'id': message.sender.id,
+                'username': message.sender.username,
+            },
+            'content': message.content,
+            'headline': safe_headline(message.headline),
+            'timestamp': message.timestamp,
+            'rank': message.rank,
+        }
+        for message in page
+    ]
+    return paginator.get_paginated_response(data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_comments(request):
+    """
+    Search order comments on the orders visible to the user
+
+    Query params:
+    - q: Search text (web-search syntax)
+    - order: Optional order ID to restrict the search to
+    - cursor / page_size: Pagination
+    """
+    query = _build_query(request)
+    if query is None:
+        return Response({'error': 'Query parameter "q" is required'}, status=400)
+
+    comments = Comment.objects.filter(order__in=get_visible_orders(request.user).values('id'))
+
+    order_id = request.query_params.get('order')
+    if order_id:
+        try:
+            comments = comments.filter(order_id=int(order_id))
+        except ValueError:
+            return Response({'error': 'order must be an integer'}, status=400)
+
+    comments = _ranked(comments, query, 'comment_text').select_related('user').defer('search_vector')
+
+    paginator = RankedCursorPagination()
+    page = paginator.paginate_queryset(comments, request)
+    data = [
+        {
+            'id': comment.id,
+            'order': comment.order_id,
+            'user': {
+                'id': comment.user.id,
+                'username': comment.user.username,
+            },
+            'comment_text': comment.comment_text,
+            'headline': safe_headline(comment.headline),
+            'created_at': comment.created_at,
+            'rank': comment.rank,
+        }
+        for comment in page
+    ]
+    return paginator.get_paginated_response(data)
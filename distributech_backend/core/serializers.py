@@ -1,9 +1,18 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import (
-    User, UserInfo, Role, Department, Order, OrderStatus, 
-    Item, OrderItem, Stock, Comment, Attachment,
+    User, UserInfo, Role, Department, Order, OrderStatus, OrderStatusChoices,
+    OrderLocation, LocationPing, Item, OrderItem, Stock, Comment, Attachment,
     Conversation, Message
 )
+from .utils.order_creation import create_orders, get_item_prices
+
+def user_relations(*paths):
+    """
+    ``select_related`` arguments for the role and department UserSerializer
+    reads, for the users at ``paths`` (``'user'``, ``'sender'``...)
+    """
+    return [f'{path}__{relation}' for path in paths for relation in ('role', 'department')]
 
 class RoleSerializer(serializers.ModelSerializer):
     class Meta:
@@ -117,6 +126,22 @@ class OrderStatusSerializer(serializers.ModelSerializer):
             'updated_by', 'updated_by_id', 'remarks', 'expected_delivery_date'
         ]
 
+class OrderLocationSerializer(serializers.ModelSerializer):
+    latitude = serializers.FloatField(read_only=True)
+    longitude = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = OrderLocation
+        fields = ['order', 'latitude', 'longitude', 'recorded_at', 'ping_count', 'updated_at']
+
+class LocationPingSerializer(serializers.ModelSerializer):
+    latitude = serializers.FloatField(read_only=True)
+    longitude = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = LocationPing
+        fields = ['latitude', 'longitude', 'recorded_at']
+
 class OrderSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
@@ -125,7 +150,10 @@ class OrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
-        fields = ['id', 'user', 'user_id', 'status', 'created_at', 'updated_at']
+        fields = [
+            'id', 'user', 'user_id', 'status', 'created_at', 'updated_at',
+            'total_amount', 'current_location', 'expected_delivery_date'
+        ]
 
 class OrderDetailSerializer(OrderSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True, source='orderitem_set')
@@ -136,6 +164,107 @@ class OrderDetailSerializer(OrderSerializer):
     class Meta(OrderSerializer.Meta):
         fields = OrderSerializer.Meta.fields + ['order_items', 'comments', 'attachments', 'order_statuses']
 
+def order_detail_prefetches():
+    """Prefetch lookups of the relations OrderDetailSerializer reads, independent of each other"""
+    return [
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('item')),
+        Prefetch('comment_set', queryset=Comment.objects.select_related(*user_relations('user'))),
+        Prefetch('attachment_set'),
+        Prefetch('orderstatus_set', queryset=OrderStatus.objects.select_related(*user_relations('updated_by'))),
+    ]
+
+def prefetch_order_details(queryset):
+    """Load what OrderDetailSerializer reads with one query per relation, however many orders"""
+    return queryset.select_related(*user_relations('user')).prefetch_related(*order_detail_prefetches())
+
+class OrderLineWriteSerializer(serializers.Serializer):
+    # Plain integer: items are checked for the whole batch at once, not per line
+    item_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+class OrderCreateListSerializer(serializers.ListSerializer):
+    """
+    Validates and creates a batch of nested orders
+    
+    Users and item prices for every order in the batch are fetched with one
+    query each, and the orders are written with bulk inserts.
+    """
+    def to_internal_value(self, data):
+        # Checked here rather than in validate() so errors stay one entry per order
+        attrs = super().to_internal_value(data)
+        prices = get_item_prices(line['item_id'] for order in attrs for line in order['items'])
+        user_ids = {order['user_id'] for order in attrs if order.get('user_id')}
+        known_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+        request = self.context.get('request')
+        has_default_user = bool(request and request.user.is_authenticated)
+        
+        errors = []
+        for order in attrs:
+            order_errors = {}
+            missing = sorted({line['item_id'] for line in order['items']} - prices.keys())
+            if missing:
+                order_errors['items'] = [f"Unknown item_id: {', '.join(str(item_id) for item_id in missing)}"]
+            if order.get('user_id') and order['user_id'] not in known_users:
+                order_errors['user_id'] = [f"Unknown user_id: {order['user_id']}"]
+            elif not order.get('user_id') and not has_default_user:
+                order_errors['user_id'] = ["This field is required."]
+            errors.append(order_errors)
+            
+            # Price at order time comes from this single fetch
+            for line in order['items']:
+                line['price'] = prices.get(line['item_id'])
+        
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+    
+    def create(self, validated_data):
+        request = self.context.get('request')
+        user = request.user if request and request.user.is_authenticated else None
+        return create_orders(validated_data, default_user=user, updated_by=user)
+
+class OrderCreateSerializer(serializers.Serializer):
+    """
+    Nested order write: the order, its lines and the initial status in one request
+    
+    Always used with many=True (see OrderCreateListSerializer); user_id
+    defaults to the requesting user.
+    """
+    user_id = serializers.IntegerField(required=False, min_value=1)
+    status = serializers.ChoiceField(choices=OrderStatusChoices.choices, default=OrderStatusChoices.PENDING)
+    items = OrderLineWriteSerializer(many=True, default=list)
+    current_location = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    remarks = serializers.CharField(required=False, allow_blank=True, default='')
+    expected_delivery_date = serializers.DateField(required=False, allow_null=True, default=None)
+    
+    class Meta:
+        list_serializer_class = OrderCreateListSerializer
+
+class OrderStatusUpdateSerializer(serializers.Serializer):
+    """One status change, as posted to the single and bulk status endpoints"""
+    status = serializers.ChoiceField(choices=OrderStatusChoices.choices)
+    current_location = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    remarks = serializers.CharField(required=False, allow_blank=True, default='')
+    expected_delivery_date = serializers.DateField(required=False, allow_null=True, default=None)
+    # Carriers may send the time of the scan, otherwise the current time is used
+    location_timestamp = serializers.DateTimeField(required=False, allow_null=True, default=None)
+    
+    def to_internal_value(self, data):
+        # Forms send an empty string for a date left blank
+        blank = [
+            field for field in ('expected_delivery_date', 'location_timestamp')
+            if isinstance(data, dict) and data.get(field) == ''
+        ]
+        if blank:
+            data = data.copy()
+            for field in blank:
+                data[field] = None
+        return super().to_internal_value(data)
+
+class OrderStatusBulkUpdateSerializer(OrderStatusUpdateSerializer):
+    # Plain integer: the orders of a batch are locked and checked at once
+    order_id = serializers.IntegerField(min_value=1)
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     sender_id = serializers.PrimaryKeyRelatedField(
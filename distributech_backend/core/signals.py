@@ -0,0 +1,64 @@
+"""
+Signal handlers for the core app
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Message, Role, User
+from core.utils import metrics
+from core.utils.recipient_routing import invalidate_routing_table
+from core.utils.response_cache import VERSIONED_MODELS, bump_model_version
+
+# User fields the email routing table is built from
+ROUTING_FIELDS = ('role_id', 'department_id', 'email', 'is_active')
+ROUTING_UPDATE_FIELDS = {'role', 'department', *ROUTING_FIELDS}
+
+
+@receiver(pre_save, sender=User)
+def track_routing_change(sender, instance, update_fields=None, **kwargs):
+    """Remember whether a save touches any field the routing table depends on"""
+    if instance.pk is None:
+        instance._routing_changed = True
+        return
+    if update_fields is not None:
+        # Saves such as the last_login update on every login skip the lookup
+        instance._routing_changed = bool(ROUTING_UPDATE_FIELDS.intersection(update_fields))
+        return
+    previous = User.objects.filter(pk=instance.pk).values(*ROUTING_FIELDS).first()
+    instance._routing_changed = previous is None or any(
+        previous[field] != getattr(instance, field) for field in ROUTING_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_routing_on_user_save(sender, instance, **kwargs):
+    if getattr(instance, '_routing_changed', True):
+        invalidate_routing_table()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_routing(sender, **kwargs):
+    invalidate_routing_table()
+
+
+def bump_cache_version(sender, update_fields=None, **kwargs):
+    """Invalidate the cached responses built from the saved or deleted model"""
+    # The last_login update on every login changes nothing that is served
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Bumped before the commit, a concurrent miss would cache the old rows under the new version
+    transaction.on_commit(lambda: bump_model_version(sender))
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_cache_version, sender=model, dispatch_uid=f'cache_version_save_{model._meta.label_lower}')
+    post_delete.connect(bump_cache_version, sender=model, dispatch_uid=f'cache_version_delete_{model._meta.label_lower}')
+
+
+@receiver(post_save, sender=Message)
+def count_chat_message(sender, created=False, **kwargs):
+    if created:
+        metrics.CHAT_MESSAGES.inc()
@@ -5,40 +5,68 @@ from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-import threading
+from django.db import transaction
 
-from .models import Stock
-from .serializers import StockSerializer
+from .models import Department, Item, Role, Stock, User
+from .serializers import StockSerializer, user_relations
 from .permissions import IsSuperAdmin, IsDepartmentManager, IsWarehouseManager, IsSupplier, IsAdministrator
-from .utils.email_utils import send_stock_alert
+from .utils.conditional import conditional, list_validators, row_validators
+from .utils.email_outbox import queue_stock_alert
+
+# Reference data embedded in serialized stock records
+STOCK_EMBEDDED_MODELS = (Item, User, Role, Department)
 
 class StockViewSet(viewsets.ModelViewSet):
-    queryset = Stock.objects.all()
+    queryset = Stock.objects.select_related('item', *user_relations('supplier'))
     serializer_class = StockSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['item', 'supplier']
     
-
+    def get_list_validators(self, request, *args, **kwargs):
+        """ETag of a stock list page from the count and latest update of the filtered records"""
+        return list_validators(request, self.filter_queryset(self.get_queryset()), STOCK_EMBEDDED_MODELS)
+    
+    def get_validators(self, request, *args, **kwargs):
+        """ETag and Last-Modified of one stock record"""
+        return row_validators(self.get_queryset(), kwargs[self.lookup_field], ['updated_at'], STOCK_EMBEDDED_MODELS)
+    
+    @conditional(get_list_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
     
+    @transaction.atomic
     def perform_create(self, serializer):
         """Create stock and check if alerts need to be sent"""
         stock = serializer.save()
         self._check_stock_levels(stock)
     
+    @transaction.atomic
     def perform_update(self, serializer):
         """Update stock and check if alerts need to be sent"""
         stock = serializer.save()
         self._check_stock_levels(stock)
     
     def _check_stock_levels(self, stock):
-        """Check if stock levels are below threshold and send alert if needed"""
+        """Check if stock levels are below threshold and queue an alert if needed"""
         if stock.current_stock <= stock.minimum_threshold:
-            # Send email alert in a background thread
-            email_thread = threading.Thread(
-                target=send_stock_alert,
-                args=(stock.item, stock)
-            )
-            email_thread.start()
+            # Written in the caller's transaction, delivered by the email worker
+            queue_stock_alert(stock)
     
     @action(detail=True, methods=['post'])
     def alert(self, request, pk=None):
@@ -48,16 +76,11 @@ class StockViewSet(viewsets.ModelViewSet):
         # Get email from request or use defaults
         email = request.data.get('email')
         
-        # Send alert
-        success = send_stock_alert(stock.item, stock, email)
+        # Queue alert for the email worker
+        outbox = queue_stock_alert(stock, email)
         
-        if success:
-            return Response({
-                'success': True,
-                'message': f'Stock alert for {stock.item.name} sent successfully'
-            })
-        else:
-            return Response({
-                'success': False,
-                'message': 'Failed to send stock alert. Check server logs for details.'
-            }, status=500) 
\ No newline at end of file
+        return Response({
+            'success': True,
+            'message': f'Stock alert for {stock.item.name} queued for delivery',
+            'outbox_id': outbox.id
+        }, status=status.HTTP_202_ACCEPTED) 
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Query-count budgets for API tests
+
+``QueryBudgetMixin`` calls an endpoint once with 1 row of data and once with
+100 and fails when the number of SQL queries depends on the row count (an
+N+1 query in a serializer or a missing ``select_related``/
+``prefetch_related``) or goes over the budget declared for the action.
+Failure messages list the queries grouped by fingerprint, the repeated one
+first, so the culprit can be read off the test output.
+
+Each size is seeded and measured inside a savepoint that is rolled back, and
+the response cache is cleared before every measurement, so budgets always
+describe a cold request.
+"""
+from django.db import connection, transaction
+
+from core.utils.instrumentation import fingerprint
+from core.utils.response_cache import get_cache
+
+
+def group_queries(queries):
+    """
+    Group captured SQL statements by fingerprint
+
+    Returns:
+        List of (count, fingerprint) tuples, most frequent first
+    """
+    counts = {}
+    for sql in queries:
+        key = fingerprint(sql)
+        counts[key] = counts.get(key, 0) + 1
+    return sorted(((count, sql) for sql, count in counts.items()), key=lambda group: -group[0])
+
+
+def describe_queries(queries, limit=10):
+    lines = [f'{count:5d} x {sql[:300]}' for count, sql in group_queries(queries)[:limit]]
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin asserting constant, budgeted query counts
+
+    Use it with ``django.test.TestCase``, which wraps every test in a
+    transaction the savepoints of the measurements can be rolled back to.
+    """
+    # Row counts every action is measured at
+    QUERY_BUDGET_SIZES = (1, 100)
+
+    def count_queries(self, call):
+        """
+        Run ``call`` and capture the queries it makes on the default database
+
+        Statements are captured with their placeholders, before parameters
+        are bound, so a query repeated for different rows groups together.
+
+        Returns:
+            Tuple of (return value of call, list of SQL statements)
+        """
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            result = call()
+        return result, queries
+
+    def assertQueryBudget(self, request, seed, budget, status=200, sizes=None):
+        """
+        Assert that a request makes the same number of queries at every size, within ``budget``
+
+        Args:
+            request: Callable taking what ``seed`` returned, making the request
+                and returning the response
+            seed: Callable taking a row count and creating that many rows;
+                its return value (ids, objects...) is passed to ``request``
+            budget: Maximum number of queries of the request
+            status: Expected response status code
+            sizes: Row counts to measure at (default QUERY_BUDGET_SIZES)
+        """
+        measured = {}
+        for size in sizes or self.QUERY_BUDGET_SIZES:
+            with transaction.atomic():
+                context = seed(size)
+                get_cache().clear()
+                response, queries = self.count_queries(lambda: request(context))
+                transaction.set_rollback(True)
+            self.assertEqual(
+                response.status_code, status,
+                f'Unexpected status with {size} rows: {getattr(response, "data", response.content)!r}'
+            )
+            measured[size] = queries
+
+        counts = {size: len(queries) for size, queries in measured.items()}
+        largest = max(measured)
+        if len(set(counts.values())) > 1:
+            self.fail(
+                f'Query count depends on the number of rows: {counts}\n'
+                f'Queries with {largest} rows:\n{describe_queries(measured[largest])}'
+            )
+        if counts[largest] > budget:
+            self.fail(
+                f'{counts[largest]} queries, over the budget of {budget}\n'
+                f'{describe_queries(measured[largest])}'
+            )
+        return counts[largest]
@@ -1,3 +1,1068 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import db_router
+from .filters import OrderFilter
+from .management.commands.benchmark_endpoints import ENDPOINT_NAMES, find_regressions
+from .middleware import ReplicaRoutingMiddleware
+from .models import (
+    ArchivedAttachment, ArchivedComment, ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatus, Attachment, Comment,
+    Conversation, Department, EmailOutbox, Item, LocationPing, Message, MessageArchive, Order, OrderItem,
+    OrderLocation, OrderStatus, Role, Stock, User
+)
+from .search_views import HIGHLIGHT_START, HIGHLIGHT_STOP, safe_headline
+from .testing import QueryBudgetMixin
+from .utils import async_db, order_archive
+from .utils.email_outbox import STATUS_CHANGE, enqueue_email, enqueue_many
+from .utils.location_tracking import ingest_pings
+from .utils.order_archive import ArchiveMismatch, archive_orders
+from .utils.order_creation import create_orders
+from .utils.order_transitions import (
+    InvalidStatusTransition, apply_bulk_status_changes, apply_status_change, can_transition
+)
+from .utils.recipient_routing import get_routing_table
+from .utils.response_cache import get_model_versions
+from .utils.smtp_pool import PooledConnection, SMTPConnectionPool
+
+
+def create_user(username, role_name, department):
+    role, _ = Role.objects.get_or_create(name=role_name)
+    return User.objects.create(username=username, email=f'{username}@example.com', role=role, department=department)
+
+
+class OrderFilterTests(TestCase):
+    """Behaviour of the order list filters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Operations')
+        cls.admin = create_user('admin', 'SuperAdmin', department)
+        cls.supplier = create_user('supplier', 'Supplier', department)
+        cls.bolts = Item.objects.create(name='Bolts', price=Decimal('10.00'))
+        cls.pallets = Item.objects.create(name='Pallets', price=Decimal('100.00'))
+        Stock.objects.create(item=cls.bolts, current_stock=50, minimum_threshold=10, supplier=cls.supplier)
+
+        cls.bolt_order, cls.pallet_order = create_orders([
+            {
+                'user_id': cls.admin.id, 'status': 'Pending',
+                'items': [{'item_id': cls.bolts.id, 'quantity': 2}],
+                'current_location': 'Central Hub Bangalore',
+                'expected_delivery_date': datetime.date(2025, 3, 10),
+            },
+            {
+                'user_id': cls.admin.id, 'status': 'Pending',
+                'items': [{'item_id': cls.pallets.id, 'quantity': 3}, {'item_id': cls.bolts.id, 'quantity': 1}],
+                'current_location': 'Chennai Port',
+                'expected_delivery_date': datetime.date(2025, 4, 1),
+            },
+        ], notify=False)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def list_ids(self, **params):
+        response = self.client.get('/api/orders/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {order['id'] for order in response.data['results']}
+
+    def test_total_is_denormalized(self):
+        self.assertEqual(self.bolt_order.total_amount, Decimal('20.00'))
+        self.assertEqual(self.pallet_order.total_amount, Decimal('310.00'))
+
+    def test_total_range(self):
+        self.assertEqual(self.list_ids(total_min='100'), {self.pallet_order.id})
+        self.assertEqual(self.list_ids(total_max='100'), {self.bolt_order.id})
+
+    def test_contains_item(self):
+        self.assertEqual(self.list_ids(item=str(self.pallets.id)), {self.pallet_order.id})
+        self.assertEqual(
+            self.list_ids(item=f'{self.bolts.id},{self.pallets.id}'), {self.bolt_order.id, self.pallet_order.id}
+        )
+
+    def test_supplier(self):
+        self.assertEqual(self.list_ids(supplier=str(self.supplier.id)), {self.bolt_order.id, self.pallet_order.id})
+        self.assertEqual(self.list_ids(supplier=str(self.admin.id)), set())
+
+    def test_location(self):
+        self.assertEqual(self.list_ids(location='hub'), {self.bolt_order.id})
+        response = self.client.get('/api/orders/', {'location': 'hu'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_expected_delivery_window(self):
+        ids = self.list_ids(expected_after='2025-03-01', expected_before='2025-03-31')
+        self.assertEqual(ids, {self.bolt_order.id})
+
+    def test_created_range(self):
+        now = timezone.now()
+        self.assertEqual(len(self.list_ids(created_after=(now - datetime.timedelta(hours=1)).isoformat())), 2)
+        self.assertEqual(self.list_ids(created_before=(now - datetime.timedelta(hours=1)).isoformat()), set())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plan checks need PostgreSQL')
+class OrderFilterPlanTests(TestCase):
+    """
+    EXPLAIN every combination of order filters and fail on sequential scans
+
+    The data set is small, but every filter value matches well under one
+    percent of the orders, as it would on a table with millions of rows, so
+    the planner only picks an index plan if a usable index exists.
+    """
+    ORDER_COUNT = 20000
+    ITEM_COUNT = 2000
+    LARGE_TABLES = {'core_order', 'core_orderitem'}
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Operations')
+        user = create_user('admin', 'SuperAdmin', department)
+        cls.supplier = create_user('supplier', 'Supplier', department)
+        other_supplier = create_user('other-supplier', 'Supplier', department)
+        items = Item.objects.bulk_create([
+            Item(name=f'Item {n}', price=Decimal('1.00')) for n in range(cls.ITEM_COUNT)
+        ])
+        cls.item = items[5]
+        Stock.objects.bulk_create([
+            Stock(
+                item=item, current_stock=100, minimum_threshold=10,
+                supplier=cls.supplier if item == cls.item else other_supplier
+            )
+            for item in items
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO core_order (user_id, status, created_at, updated_at, total_amount) "
+                "SELECT %s, CASE WHEN g %% 200 = 0 THEN 'Pending' ELSE 'Completed' END, "
+                "now() - g * interval '1 minute', now(), 0 "
+                "FROM generate_series(1, %s) AS g",
+                [user.id, cls.ORDER_COUNT]
+            )
+            # Three lines per order; the triggers fill in total_amount
+            cursor.execute(
+                "INSERT INTO core_orderitem (order_id, item_id, quantity, price_at_order_time) "
+                "SELECT o.id, %s + (o.id * 7 + k) %% %s, k + 1, 1 + o.id %% 997 "
+                "FROM core_order o CROSS JOIN generate_series(0, 2) AS k",
+                [items[0].id, cls.ITEM_COUNT]
+            )
+            # The triggers copy the location and expected delivery date to the order
+            cursor.execute(
+                "INSERT INTO core_orderstatus (order_id, status, current_location, location_timestamp, "
+                "remarks, expected_delivery_date) "
+                "SELECT id, status, 'Hub ' || (id % 5000), now(), '', current_date + (id % 3650) "
+                "FROM core_order"
+            )
+            cursor.execute("ANALYZE core_order, core_orderitem, core_orderstatus, core_stock, core_user")
+
+    def filter_params(self):
+        now = timezone.now()
+        today = timezone.localdate()
+        return {
+            'status': {'status': 'Pending'},
+            'created': {
+                'created_after': (now - datetime.timedelta(minutes=540)).isoformat(),
+                'created_before': (now - datetime.timedelta(minutes=500)).isoformat(),
+            },
+            'total': {'total_min': '3006', 'total_max': '3006'},
+            'item': {'item': str(self.item.id)},
+            'supplier': {'supplier': str(self.supplier.id)},
+            'location': {'location': 'Hub 1234'},
+            'expected': {
+                'expected_after': (today + datetime.timedelta(days=100)).isoformat(),
+                'expected_before': (today + datetime.timedelta(days=101)).isoformat(),
+            },
+        }
+
+    def sequential_scans(self, plan):
+        """Return the large tables that ``plan`` reads with a sequential scan"""
+        found = []
+        if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in self.LARGE_TABLES:
+            found.append(plan['Relation Name'])
+        for child in plan.get('Plans', []):
+            found.extend(self.sequential_scans(child))
+        return found
+
+    def test_denormalized_columns_are_maintained(self):
+        order = Order.objects.order_by('id').first()
+        self.assertEqual(order.total_amount, 6 * (1 + order.id % 997))
+        self.assertEqual(order.current_location, f'Hub {order.id % 5000}')
+
+    def test_no_sequential_scans(self):
+        params = self.filter_params()
+        for size in range(1, len(params) + 1):
+            for names in itertools.combinations(params, size):
+                query = {}
+                for name in names:
+                    query.update(params[name])
+                with self.subTest(filters=names):
+                    filterset = OrderFilter(query, queryset=Order.objects.all())
+                    self.assertTrue(filterset.is_valid(), filterset.errors)
+                    plan = json.loads(filterset.qs.order_by().explain(format='json'))['Plan']
+                    self.assertEqual(self.sequential_scans(plan), [], json.dumps(plan, indent=1))
+
+
+class FindRegressionsTests(SimpleTestCase):
+    """Comparison of benchmark results to a baseline"""
+    BASELINE = {'order_list': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 5}}
+
+    def result(self, p50=10.0, p95=20.0, queries=5):
+        return {'order_list': {'p50_ms': p50, 'p95_ms': p95, 'queries': queries}}
+
+    def test_within_threshold(self):
+        self.assertEqual(find_regressions(self.result(p50=11.9, p95=23.9), self.BASELINE, 0.2), [])
+
+    def test_slower(self):
+        regressions = find_regressions(self.result(p95=25.0), self.BASELINE, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('p95_ms', regressions[0])
+
+    def test_small_increases_are_noise(self):
+        baseline = {'order_list': {'p50_ms': 1.0, 'p95_ms': 2.0, 'queries': 5}}
+        self.assertEqual(find_regressions(self.result(p50=1.5, p95=2.5), baseline, 0.2, min_delta_ms=1.0), [])
+
+    def test_more_queries(self):
+        self.assertEqual(len(find_regressions(self.result(queries=6), self.BASELINE, 0.2)), 1)
+        self.assertEqual(find_regressions(self.result(queries=6), self.BASELINE, 0.2, query_slack=1), [])
+
+    def test_endpoints_missing_from_the_run_are_skipped(self):
+        self.assertEqual(find_regressions({}, self.BASELINE, 0.2), [])
+
+
+class BenchmarkEndpointsTests(TestCase):
+    """The endpoint benchmark runs every endpoint and compares against its baseline"""
+    VOLUMES = ['--users', '3', '--items', '5', '--orders', '3', '--conversations', '1', '--messages', '4']
+
+    def run_benchmark(self, *args):
+        call_command(
+            'benchmark_endpoints', *self.VOLUMES, '--iterations', '2', '--warmup', '0', *args, stdout=io.StringIO()
+        )
+
+    def test_output_and_comparison(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            self.run_benchmark('--output', path)
+            with open(path) as handle:
+                report = json.load(handle)
+            self.assertEqual(list(report['endpoints']), ENDPOINT_NAMES)
+            for result in report['endpoints'].values():
+                self.assertGreater(result['queries'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+            # Query counts do not depend on timing, so a rerun matches its own baseline
+            self.run_benchmark('--baseline', path, '--min-delta-ms', '100000')
+
+            report['endpoints']['mark_read']['queries'] -= 1
+            with open(path, 'w') as handle:
+                json.dump(report, handle)
+            with self.assertRaisesMessage(CommandError, 'mark_read: queries'):
+                self.run_benchmark('--baseline', path, '--min-delta-ms', '100000')
+
+        self.assertFalse(User.objects.filter(username__startswith='benchmark').exists())
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Every router viewset and public endpoint, at 1 and at 100 rows
+
+    Lists are measured with that many rows in the table, details with that
+    many rows nested in the object. A failure means a query now runs once
+    per row (a serializer reading a relation the queryset does not load) or
+    that an action got more expensive; raise a budget only deliberately.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Operations')
+        cls.admin = create_user('admin', 'SuperAdmin', cls.department)
+        cls.customer = create_user('customer', 'Department Manager', cls.department)
+        cls.supplier = create_user('supplier', 'Supplier', cls.department)
+        cls.item = Item.objects.create(name='Bolts', price=Decimal('10.00'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get(self, path):
+        return lambda context: self.client.get(path.format(**context))
+
+    def public_get(self, path):
+        return lambda context: APIClient().get(path.format(**context))
+
+    # Seeds: create the rows and return the ids the paths are formatted with
+
+    def seed_users(self, count):
+        role = Role.objects.get(name='Department Manager')
+        users = User.objects.bulk_create([
+            User(username=f'user{n}', email=f'user{n}@example.com', role=role, department=self.department)
+            for n in range(count)
+        ])
+        return {'id': users[-1].id}
+
+    def seed_roles(self, count):
+        Role.objects.bulk_create([Role(name=f'Role {n}') for n in range(count)])
+        return {}
+
+    def seed_departments(self, count):
+        Department.objects.bulk_create([Department(name=f'Department {n}') for n in range(count)])
+        return {}
+
+    def seed_items(self, count):
+        items = Item.objects.bulk_create([Item(name=f'Item {n}', price=Decimal('1.00')) for n in range(count)])
+        return {'id': items[-1].id}
+
+    def seed_stock(self, count):
+        items = Item.objects.bulk_create([Item(name=f'Item {n}', price=Decimal('1.00')) for n in range(count)])
+        stock = Stock.objects.bulk_create([
+            Stock(item=item, current_stock=5, minimum_threshold=10, supplier=self.supplier) for item in items
+        ])
+        return {'id': stock[-1].id}
+
+    def seed_orders(self, count):
+        """``count`` orders with one line, status, comment and attachment each"""
+        orders = create_orders([
+            {'user_id': self.customer.id, 'status': 'Pending', 'items': [{'item_id': self.item.id, 'quantity': 1}]}
+            for _ in range(count)
+        ], updated_by=self.admin, notify=False)
+        Comment.objects.bulk_create([
+            Comment(order=order, user=self.customer, comment_text='Comment') for order in orders
+        ])
+        Attachment.objects.bulk_create([
+            Attachment(order=order, file_url='https://example.com/file.pdf') for order in orders
+        ])
+        return {
+            'id': orders[-1].id,
+            'line': OrderItem.objects.filter(order=orders[-1]).get().id,
+            'status': OrderStatus.objects.filter(order=orders[-1]).get().id,
+            'comment': Comment.objects.get(order=orders[-1]).id,
+            'attachment': Attachment.objects.get(order=orders[-1]).id,
+        }
+
+    def seed_order_children(self, count):
+        """One order with ``count`` lines, statuses, comments and attachments"""
+        items = Item.objects.bulk_create([Item(name=f'Item {n}', price=Decimal('1.00')) for n in range(count)])
+        order, = create_orders([{
+            'user_id': self.customer.id, 'status': 'Pending',
+            'items': [{'item_id': item.id, 'quantity': 1} for item in items],
+        }], updated_by=self.admin, notify=False)
+        OrderStatus.objects.bulk_create([
+            OrderStatus(order=order, status='Processing', location_timestamp=timezone.now(), updated_by=self.admin)
+            for _ in range(count - 1)
+        ])
+        Comment.objects.bulk_create([
+            Comment(order=order, user=self.customer, comment_text='Comment') for _ in range(count)
+        ])
+        Attachment.objects.bulk_create([
+            Attachment(order=order, file_url='https://example.com/file.pdf') for _ in range(count)
+        ])
+        return {'id': order.id}
+
+    def seed_conversations(self, count):
+        """``count`` conversations of the admin with one message each"""
+        conversations = Conversation.objects.bulk_create([Conversation() for _ in range(count)])
+        Conversation.participants.through.objects.bulk_create([
+            Conversation.participants.through(conversation_id=conversation.id, user_id=user.id)
+            for conversation in conversations
+            for user in (self.admin, self.customer)
+        ])
+        messages = Message.objects.bulk_create([
+            Message(conversation=conversation, sender=self.customer, content='Hello')
+            for conversation in conversations
+        ])
+        return {'id': conversations[-1].id, 'message': messages[-1].id}
+
+    def seed_messages(self, count):
+        """One conversation with ``count`` messages"""
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.admin, self.customer)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender=user, content='Hello')
+            for n in range(count)
+            for user in [(self.admin, self.customer)[n % 2]]
+        ])
+        return {'id': conversation.id}
+
+    def test_users(self):
+        self.assertQueryBudget(self.get('/api/users/'), self.seed_users, 2)
+        self.assertQueryBudget(self.get('/api/users/{id}/'), self.seed_users, 2)
+
+    def test_orders(self):
+        self.assertQueryBudget(self.get('/api/orders/'), self.seed_orders, 2)
+        self.assertQueryBudget(self.get('/api/orders/{id}/'), self.seed_order_children, 6)
+
+    def test_order_status(self):
+        self.assertQueryBudget(self.get('/api/order-status/'), self.seed_orders, 2)
+        self.assertQueryBudget(self.get('/api/order-status/{status}/'), self.seed_orders, 1)
+
+    def test_items(self):
+        self.assertQueryBudget(self.get('/api/items/'), self.seed_items, 2)
+        self.assertQueryBudget(self.get('/api/items/{id}/'), self.seed_items, 1)
+
+    def test_order_items(self):
+        self.assertQueryBudget(self.get('/api/order-items/'), self.seed_orders, 2)
+        self.assertQueryBudget(self.get('/api/order-items/{line}/'), self.seed_orders, 1)
+
+    def test_stock(self):
+        self.assertQueryBudget(self.get('/api/stock/'), self.seed_stock, 3)
+        self.assertQueryBudget(self.get('/api/stock/{id}/'), self.seed_stock, 2)
+
+    def test_comments(self):
+        self.assertQueryBudget(self.get('/api/comments/'), self.seed_orders, 2)
+        self.assertQueryBudget(self.get('/api/comments/{comment}/'), self.seed_orders, 1)
+
+    def test_attachments(self):
+        self.assertQueryBudget(self.get('/api/attachments/'), self.seed_orders, 2)
+        self.assertQueryBudget(self.get('/api/attachments/{attachment}/'), self.seed_orders, 1)
+
+    def test_conversations(self):
+        self.assertQueryBudget(self.get('/api/conversations/'), self.seed_conversations, 3)
+        self.assertQueryBudget(self.get('/api/conversations/{id}/'), self.seed_messages, 4)
+
+    def test_messages(self):
+        self.assertQueryBudget(self.get('/api/messages/'), self.seed_conversations, 2)
+        self.assertQueryBudget(self.get('/api/messages/{message}/'), self.seed_conversations, 1)
+
+    def test_public_endpoints(self):
+        self.assertQueryBudget(self.public_get('/api/public/roles/'), self.seed_roles, 1)
+        self.assertQueryBudget(self.public_get('/api/public/departments/'), self.seed_departments, 1)
+        self.assertQueryBudget(self.public_get('/api/public/items/'), self.seed_items, 1)
+        self.assertQueryBudget(self.public_get('/api/public/stock/'), self.seed_stock, 2)
+        self.assertQueryBudget(self.public_get('/api/public/orders/'), self.seed_orders, 5)
+        self.assertQueryBudget(self.public_get('/api/public/order-items/'), self.seed_orders, 1)
+        self.assertQueryBudget(self.public_get('/api/public/order-status/'), self.seed_orders, 1)
+        self.assertQueryBudget(self.public_get('/api/public/orders/{id}/'), self.seed_order_children, 6)
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5, REPLICA_PIN_CACHE_ALIAS='default',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Reads go to a healthy replica unless the client wrote recently"""
+
+    def setUp(self):
+        cache.clear()
+        db_router.health.reset()
+        db_router.health.mark('replica', True)
+        self.router = db_router.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_alias(self, request):
+        """Run a request through the middleware, returning the response and the database Orders are read from"""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Order))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return response, seen[0]
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        # Outside a request (commands, workers) everything stays on the primary
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Order), 'replica')
+            with db_router.use_primary():
+                self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+    def test_unhealthy_replica_falls_back_to_the_primary(self):
+        db_router.health.mark('replica', False)
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    @override_settings(REPLICA_HEALTH_CHECK_SECONDS=0)
+    def test_health_is_rechecked(self):
+        with mock.patch.object(db_router.health, 'check', return_value=False) as check:
+            self.assertIsNone(db_router.choose_replica())
+            check.return_value = True
+            self.assertEqual(db_router.choose_replica(), 'replica')
+        self.assertEqual(check.call_count, 2)
+
+    def test_write_pins_the_client_with_a_cookie(self):
+        _, alias = self.read_alias(self.factory.get('/api/orders/'))
+        self.assertEqual(alias, 'replica')
+
+        response, alias = self.read_alias(self.factory.post('/api/orders/'))
+        self.assertEqual(alias, 'default')
+        cookie = response.cookies['primary_until']
+
+        request = self.factory.get('/api/orders/')
+        request.COOKIES['primary_until'] = cookie.value
+        self.assertEqual(self.read_alias(request)[1], 'default')
+
+        # Forged cookies cannot pin a client for longer than one window
+        request.COOKIES['primary_until'] = str(float(cookie.value) + 3600)
+        self.assertEqual(self.read_alias(request)[1], 'replica')
+
+    def test_write_pins_the_token_user(self):
+        token = AccessToken.for_user(User(id=7))
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.read_alias(self.factory.post('/api/orders/', **headers))
+
+        self.assertEqual(self.read_alias(self.factory.get('/api/orders/', **headers))[1], 'default')
+        other = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(User(id=8))}'}
+        self.assertEqual(self.read_alias(self.factory.get('/api/orders/', **other))[1], 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        response, alias = self.read_alias(self.factory.get('/api/orders/'))
+        self.assertEqual(alias, 'default')
+        self.assertNotIn('primary_until', self.read_alias(self.factory.post('/api/orders/'))[0].cookies)
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """Under ASGI the async public order views answer exactly like the synchronous ones"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Operations')
+        admin = create_user('admin', 'SuperAdmin', department)
+        bolts = Item.objects.create(name='Bolts', price=Decimal('10.00'))
+        pallets = Item.objects.create(name='Pallets', price=Decimal('100.00'))
+        self.orders = create_orders([
+            {
+                'user_id': admin.id, 'status': status,
+                'items': [{'item_id': bolts.id, 'quantity': 2}, {'item_id': pallets.id, 'quantity': 1}],
+                'current_location': 'Central Hub Bangalore',
+            }
+            for status in ('Pending', 'Shipped')
+        ], updated_by=admin, notify=False)
+        Comment.objects.create(order=self.orders[0], user=admin, comment_text='Handle with care')
+        Attachment.objects.create(order=self.orders[0], file_url='https://example.com/invoice.pdf')
+
+    def async_get(self, path, **headers):
+        middleware = ['core.middleware.AsyncViewsMiddleware', *settings.MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware), \
+                mock.patch.object(async_db, 'run', wraps=async_db.run) as run:
+            response = async_to_sync(AsyncClient().get)(path, headers=headers)
+        self.assertTrue(run.called, f'{path} was not served by an async view')
+        return response
+
+    def test_same_responses(self):
+        order_id = self.orders[0].id
+        for path in [
+            f'/api/public/orders/{order_id}/', '/api/public/orders/999999/',
+            '/api/public/orders/', '/api/public/orders/?status=Shipped',
+        ]:
+            expected = self.client.get(path)
+            response = self.async_get(path)
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(response.json(), expected.json(), path)
+
+    def test_conditional_requests(self):
+        path = f'/api/public/orders/{self.orders[0].id}/'
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.async_get(path)['ETag'], etag)
+        self.assertEqual(self.async_get(path, if_none_match=etag).status_code, 304)
+
+    def test_benchmark(self):
+        output = io.StringIO()
+        call_command(
+            'benchmark_asgi', '--requests', '6', '--concurrency', '2', '--warmup', '0',
+            '--paths', '/api/public/orders/{order_id}/,/api/public/orders/', stdout=output,
+        )
+        for mode in ('wsgi', 'asgi'):
+            self.assertRegex(output.getvalue(), rf'{mode} .* errors 0')
+
+
+class SMTPConnectionPoolTests(SimpleTestCase):
+    """Checking connections out of a full pool"""
+
+    def make_pool(self):
+        pool = SMTPConnectionPool('localhost', 25, max_size=1)
+        pool._connect = lambda: PooledConnection(mock.Mock())
+        return pool
+
+    def test_acquire_waits_for_a_released_connection(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive(), 'acquire() did not block on a full pool')
+
+        pool.release(first)
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertIs(acquired[0], first)
+        self.assertEqual(pool.stats['reuses'], 1)
+
+    def test_acquire_timeout(self):
+        pool = self.make_pool()
+        pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire(timeout=0.05)
+
+
+class LeadTimePermissionTests(TestCase):
+    """Company-wide lead times are only shown to administrators"""
+
+    def test_roles(self):
+        department = Department.objects.create(name='Operations')
+        client = APIClient()
+        for role, expected in [
+            ('SuperAdmin', 200), ('Administrator', 200), ('Department Manager', 403), ('Supplier', 403),
+        ]:
+            client.force_authenticate(create_user(role.lower().replace(' ', '-'), role, department))
+            response = client.get('/api/analytics/lead-times/')
+            self.assertEqual(response.status_code, expected, role)
+
+
+class MessageHistoryTests(TestCase):
+    """Paging through a conversation continues from the live messages into the archive"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Operations')
+        self.user = create_user('admin', 'Administrator', department)
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        now = timezone.now()
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.user, content=f'Live {n}',
+                    timestamp=now - datetime.timedelta(minutes=n))
+            for n in range(3)
+        ])
+
+        archived_at = now - datetime.timedelta(days=400)
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        path = os.path.join(self.archive_dir.name, 'conversation.jsonl.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as handle:
+            handle.write(json.dumps({
+                'id': 1, 'conversation': self.conversation.id, 'sender_id': self.user.id,
+                'content': 'Archived', 'timestamp': archived_at.isoformat(), 'is_read': True,
+            }) + '\n')
+        MessageArchive.objects.create(
+            conversation=self.conversation, month=archived_at.date().replace(day=1), path=path,
+            message_count=1, first_timestamp=archived_at, last_timestamp=archived_at,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def history(self, **params):
+        return self.client.get(f'/api/conversations/{self.conversation.id}/history/', params).json()
+
+    def test_full_live_page_with_archive_has_more(self):
+        page = self.history(limit=3)
+        self.assertEqual([row['content'] for row in page['results']], ['Live 2', 'Live 1', 'Live 0'])
+        self.assertTrue(page['has_more'])
+        self.assertEqual(page['next_before'], page['results'][0]['timestamp'])
+
+        page = self.history(limit=3, before=page['next_before'])
+        self.assertEqual([row['content'] for row in page['results']], ['Archived'])
+        self.assertFalse(page['has_more'])
+        self.assertIsNone(page['next_before'])
+
+    def test_full_live_page_without_archive(self):
+        MessageArchive.objects.all().delete()
+        page = self.history(limit=3)
+        self.assertEqual(len(page['results']), 3)
+        self.assertFalse(page['has_more'])
+        self.assertIsNone(page['next_before'])
+
+    def test_page_reaching_into_archive(self):
+        page = self.history(limit=10)
+        self.assertEqual([row['content'] for row in page['results']], ['Archived', 'Live 2', 'Live 1', 'Live 0'])
+        self.assertTrue(page['results'][0]['archived'])
+        self.assertFalse(page['has_more'])
+
+
+class SearchHeadlineTests(SimpleTestCase):
+    """Headlines are safe to render as HTML"""
+
+    def test_text_is_escaped_and_matches_marked(self):
+        headline = f'<img src=x onerror="alert(1)"> the {HIGHLIGHT_START}pallet{HIGHLIGHT_STOP} & crate'
+        self.assertEqual(
+            safe_headline(headline),
+            '&lt;img src=x onerror=&quot;alert(1)&quot;&gt; the <mark>pallet</mark> &amp; crate'
+        )
+
+
+class SearchParameterTests(TestCase):
+    """Malformed filters of the search endpoints are rejected before any query runs"""
+
+    def test_non_integer_filters(self):
+        client = APIClient()
+        client.force_authenticate(create_user('admin', 'Administrator', Department.objects.create(name='Operations')))
+        for path, param in [('/api/search/messages/', 'conversation'), ('/api/search/comments/', 'order')]:
+            response = client.get(path, {'q': 'delivery', param: 'abc'})
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(response.json(), {'error': f'{param} must be an integer'})
+
+
+class OrderStatusTransitionTests(TestCase):
+    """Single and bulk status changes follow the same transition table"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Operations')
+        self.user = create_user('carrier', 'Administrator', department)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_order(self, status='Pending'):
+        order = Order.objects.create(user=self.user, status=status)
+        # Back-date so the update of updated_at is visible
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now() - datetime.timedelta(days=1))
+        order.refresh_from_db()
+        return order
+
+    def test_can_transition(self):
+        self.assertTrue(can_transition('Pending', 'Processing'))
+        self.assertTrue(can_transition('Shipped', 'Shipped'))
+        self.assertFalse(can_transition('Pending', 'Delivered'))
+        self.assertFalse(can_transition('Completed', 'Cancelled'))
+        self.assertFalse(can_transition('Pending', 'Lost'))
+        # Legacy free-text statuses may move to any valid status
+        self.assertTrue(can_transition('Awaiting pickup', 'Delivered'))
+
+    def test_rejected_single_change(self):
+        order = self.create_order()
+        with self.assertRaises(InvalidStatusTransition):
+            apply_status_change(order.id, 'Delivered')
+        self.assertFalse(OrderStatus.objects.filter(order=order).exists())
+
+        response = self.client.post(f'/api/public/orders/{order.id}/status/', {'status': 'Delivered'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'success': False, 'message': f'Order #{order.id} cannot move from Pending to Delivered',
+        })
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Pending')
+
+    def test_bulk_applies_in_order_and_reports_rejections(self):
+        order = self.create_order()
+        created, errors = apply_bulk_status_changes([
+            {'order_id': order.id, 'status': 'Processing'},
+            {'order_id': order.id, 'status': 'Completed'},
+            {'order_id': order.id, 'status': 'Shipped'},
+            {'order_id': order.id + 1000, 'status': 'Processing'},
+        ])
+        self.assertEqual([row.status for row in created], ['Processing', 'Shipped'])
+        self.assertEqual(errors, [
+            {
+                'index': 1, 'order_id': order.id,
+                'message': f'Order #{order.id} cannot move from Processing to Completed',
+            },
+            {'index': 3, 'order_id': order.id + 1000, 'message': 'Order not found'},
+        ])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Shipped')
+
+    def test_bulk_endpoint_rejections(self):
+        order = self.create_order()
+        response = self.client.post('/api/orders/status/bulk/', {'updates': [
+            {'order_id': order.id, 'status': 'Delivered'},
+            {'order_id': 'abc', 'status': 'Processing'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'success': False,
+            'applied': 0,
+            'rejected': 2,
+            'errors': [
+                {
+                    'index': 0, 'order_id': order.id,
+                    'message': f'Order #{order.id} cannot move from Pending to Delivered',
+                },
+                {'index': 1, 'order_id': 'abc', 'message': 'order_id: A valid integer is required.'},
+            ],
+            'notification_queued': False,
+        })
+        self.assertFalse(OrderStatus.objects.exists())
+
+    def test_bulk_endpoint_malformed_entries(self):
+        order = self.create_order()
+        response = self.client.post('/api/orders/status/bulk/', {'updates': [
+            {'order_id': order.id, 'status': ['Processing']},
+            {'order_id': order.id, 'status': 'Processing', 'current_location': 'x' * 256},
+            {'order_id': order.id, 'status': 'Processing', 'remarks': {'text': 'late'}},
+            {'order_id': True, 'status': 'Processing'},
+            {'order_id': 0, 'status': 'Processing'},
+            {'order_id': order.id, 'status': 'Processing', 'expected_delivery_date': '01/04/2025'},
+            'Processing',
+            {
+                'order_id': order.id, 'status': 'Processing', 'expected_delivery_date': '',
+                'location_timestamp': '2025-04-01T08:30:00Z',
+            },
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['applied'], 1)
+        self.assertEqual([error['index'] for error in body['errors']], [0, 1, 2, 3, 4, 5, 6])
+        messages = [error['message'] for error in body['errors']]
+        self.assertTrue(messages[0].startswith('status: '))
+        self.assertEqual(messages[1], 'current_location: Ensure this field has no more than 255 characters.')
+        self.assertEqual(messages[2], 'remarks: Not a valid string.')
+        self.assertEqual(messages[3], 'order_id: A valid integer is required.')
+        self.assertEqual(messages[4], 'order_id: Ensure this value is greater than or equal to 1.')
+        self.assertTrue(messages[5].startswith('expected_delivery_date: '))
+        self.assertEqual(body['errors'][6]['order_id'], None)
+
+        row = OrderStatus.objects.get(order=order)
+        self.assertEqual(row.location_timestamp, datetime.datetime(2025, 4, 1, 8, 30, tzinfo=datetime.timezone.utc))
+
+    def test_single_endpoint_malformed_payload(self):
+        order = self.create_order()
+        for payload in [{'status': ['Processing']}, {'status': 'Processing', 'current_location': 'x' * 256}, {}]:
+            response = self.client.post(f'/api/public/orders/{order.id}/status/', payload, format='json')
+            self.assertEqual(response.status_code, 400, payload)
+            self.assertFalse(response.json()['success'])
+        self.assertFalse(OrderStatus.objects.exists())
+
+    @override_settings(ORDER_STATUS_BULK_MAX=2)
+    def test_bulk_limit(self):
+        order = self.create_order()
+        updates = [{'order_id': order.id, 'status': 'Processing'}] * 3
+        response = self.client.post('/api/orders/status/bulk/', {'updates': updates}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'success': False, 'message': 'At most 2 updates are accepted per request'})
+
+        response = self.client.post('/api/orders/status/bulk/', {'updates': updates[:2]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['applied'], 1)
+
+    def test_bulk_matches_single(self):
+        single, bulk = self.create_order('Processing'), self.create_order('Processing')
+        update = {'status': 'Shipped', 'current_location': 'Depot 4', 'remarks': 'Picked up'}
+        response = self.client.post(f'/api/public/orders/{single.id}/status/', update, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(
+            '/api/orders/status/bulk/', {'updates': [{'order_id': bulk.id, **update}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        for order, previous in [(single, single.updated_at), (bulk, bulk.updated_at)]:
+            order.refresh_from_db()
+            self.assertEqual(order.status, 'Shipped')
+            self.assertGreater(order.updated_at, previous)
+        rows = [
+            OrderStatus.objects.values('status', 'current_location', 'remarks', 'updated_by').get(order=order)
+            for order in (single, bulk)
+        ]
+        self.assertEqual(rows[0], rows[1])
+
+
+class EmailDigestTests(TestCase):
+    """Notifications to the same recipients inside the window share one outbox row"""
+
+    def test_events_merge_into_pending_digest(self):
+        first = enqueue_email(STATUS_CHANGE, {'order_status_id': 1}, ['ops@example.com'])
+        second = enqueue_email(STATUS_CHANGE, {'order_status_id': 2}, 'ops@example.com')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertEqual(
+            EmailOutbox.objects.get().payload, {'events': [{'order_status_id': 1}, {'order_status_id': 2}]}
+        )
+
+    def test_batch_groups_by_recipients(self):
+        entries = enqueue_many(STATUS_CHANGE, [
+            ({'order_status_id': 1}, ['a@example.com', 'b@example.com'], False),
+            ({'order_status_id': 2}, ['c@example.com'], False),
+            ({'order_status_id': 3}, ['b@example.com', 'a@example.com'], False),
+            ({'order_status_id': 4}, ['c@example.com'], True),
+        ])
+        self.assertEqual(entries[0].id, entries[2].id)
+        self.assertEqual(len({entry.id for entry in entries}), 3)
+        self.assertEqual(entries[0].payload['events'], [{'order_status_id': 1}, {'order_status_id': 3}])
+        self.assertEqual(entries[3].payload, {'order_status_id': 4})
+
+    def test_attempted_digest_is_not_reopened(self):
+        claimed = enqueue_email(STATUS_CHANGE, {'order_status_id': 1}, ['ops@example.com'])
+        EmailOutbox.objects.filter(id=claimed.id).update(attempts=1)
+
+        entry = enqueue_email(STATUS_CHANGE, {'order_status_id': 2}, ['ops@example.com'])
+        self.assertNotEqual(entry.id, claimed.id)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.payload, {'events': [{'order_status_id': 1}]})
+        self.assertEqual(entry.payload, {'events': [{'order_status_id': 2}]})
+
+    @override_settings(EMAIL_DIGEST_MAX_EVENTS=2)
+    def test_full_digest_starts_a_new_one(self):
+        entries = [enqueue_email(STATUS_CHANGE, {'order_status_id': n}, ['ops@example.com']) for n in range(3)]
+        self.assertEqual(entries[0].id, entries[1].id)
+        self.assertNotEqual(entries[1].id, entries[2].id)
+
+
+class CacheVersionTests(TestCase):
+    """Cached responses are only invalidated once the write is committed"""
+
+    def test_version_changes_on_commit(self):
+        before, = get_model_versions([Item])
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Item.objects.create(name='Bolt', price=Decimal('1.50'))
+                self.assertEqual(get_model_versions([Item]), [before])
+            # Committed only when the test transaction would commit
+            self.assertEqual(get_model_versions([Item]), [before])
+        self.assertNotEqual(get_model_versions([Item]), [before])
+
+    def test_rolled_back_write_keeps_version(self):
+        before, = get_model_versions([Item])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Item.objects.create(name='Bolt', price=Decimal('1.50'))
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_model_versions([Item]), [before])
+
+
+class RoutingTableInvalidationTests(TestCase):
+    """The cached routing table is dropped when a routing change commits"""
+
+    def test_invalidated_on_commit(self):
+        department = Department.objects.create(name='Operations')
+        cache.clear()
+        self.assertNotIn('Department Manager', get_routing_table())
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                create_user('manager', 'Department Manager', department)
+            # A build before the commit must not be able to keep the old table
+            self.assertNotIn('Department Manager', get_routing_table())
+        self.assertEqual(
+            get_routing_table()['Department Manager'],
+            {None: ['manager@example.com'], department.id: ['manager@example.com']}
+        )
+
+
+class LocationIngestTests(TestCase):
+    """Pings are downsampled into the history and the newest one is the current position"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Operations')
+        self.order = Order.objects.create(user=create_user('carrier', 'Administrator', department), status='Shipped')
+        self.start = timezone.now() - datetime.timedelta(hours=1)
+
+    def ping(self, seconds, latitude_e7=0):
+        return {
+            'order_id': self.order.id, 'latitude_e7': latitude_e7, 'longitude_e7': 0,
+            'recorded_at': self.start + datetime.timedelta(seconds=seconds),
+        }
+
+    def history(self):
+        return [
+            (ping.recorded_at - self.start).total_seconds()
+            for ping in LocationPing.objects.filter(order=self.order).order_by('recorded_at')
+        ]
+
+    def test_downsampling_and_out_of_order_pings(self):
+        stats, errors = ingest_pings([self.ping(70, 3), self.ping(0, 1), self.ping(30, 2), self.ping(10)])
+        self.assertEqual(errors, [])
+        self.assertEqual(stats, {'accepted': 4, 'stored': 2, 'orders': 1})
+        self.assertEqual(self.history(), [0, 70])
+
+        # A late ping is counted but neither moves the position nor fills the history
+        ingest_pings([self.ping(-300, 9), self.ping(100), self.ping(140, 4)])
+        self.assertEqual(self.history(), [0, 70, 140])
+        location = OrderLocation.objects.get(order=self.order)
+        self.assertEqual((location.latitude_e7, location.ping_count), (4, 7))
+        self.assertEqual(location.recorded_at, self.start + datetime.timedelta(seconds=140))
+
+    def test_concurrent_first_position(self):
+        ingest_pings([self.ping(100, 5), self.ping(200, 6)])
+        # Both batches found no position: the second one inserts into the row the first created
+        with mock.patch.object(OrderLocation.objects, 'select_for_update', return_value=OrderLocation.objects.none()):
+            ingest_pings([self.ping(0, 1), self.ping(150, 2)])
+        location = OrderLocation.objects.get(order=self.order)
+        self.assertEqual((location.latitude_e7, location.ping_count), (6, 4))
+        self.assertEqual(location.recorded_at, self.start + datetime.timedelta(seconds=200))
+
+        with mock.patch.object(OrderLocation.objects, 'select_for_update', return_value=OrderLocation.objects.none()):
+            ingest_pings([self.ping(300, 7)])
+        location.refresh_from_db()
+        self.assertEqual((location.latitude_e7, location.ping_count), (7, 5))
+
+
+class OrderArchiveTests(TestCase):
+    """Closed orders are moved to the archive tables with their child rows and stay readable"""
+
+    def setUp(self):
+        department = Department.objects.create(name='Operations')
+        self.user = create_user('admin', 'SuperAdmin', department)
+        item = Item.objects.create(name='Bolt', price=Decimal('2.50'))
+        self.closed, self.open = create_orders([
+            {'user_id': self.user.id, 'status': status, 'items': [{'item_id': item.id, 'quantity': 4}]}
+            for status in ('Completed', 'Pending')
+        ], notify=False)
+        Comment.objects.create(order=self.closed, user=self.user, comment_text='Delivered to dock 2')
+        Attachment.objects.create(order=self.closed, file_url='https://files.example.com/pod.pdf')
+        LocationPing.objects.create(order=self.closed, latitude_e7=1, longitude_e7=1, recorded_at=timezone.now())
+        Order.objects.update(updated_at=timezone.now() - datetime.timedelta(days=400))
+
+    def live_counts(self):
+        return [
+            model.objects.filter(order=self.closed).count() for model in (OrderItem, OrderStatus, Comment, Attachment)
+        ]
+
+    def archived_counts(self):
+        return [
+            model.objects.count()
+            for model in (ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatus, ArchivedComment, ArchivedAttachment)
+        ]
+
+    def test_archive_moves_rows(self):
+        totals = archive_orders(365)
+        self.assertEqual(totals['core.Order'], 1)
+        self.assertEqual(totals['core.LocationPing'], 1)
+        self.assertEqual(self.archived_counts(), [1, 1, 1, 1, 1])
+        self.assertEqual(self.live_counts(), [0, 0, 0, 0])
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [self.open.id])
+        self.assertEqual(ArchivedOrder.objects.get().status, 'Completed')
+
+    def test_dry_run_writes_nothing(self):
+        out = io.StringIO()
+        call_command('archive_orders', '--dry-run', stdout=out)
+        self.assertIn('Would archive 1 orders', out.getvalue())
+        self.assertEqual(self.archived_counts(), [0, 0, 0, 0, 0])
+        self.assertEqual(self.live_counts(), [1, 1, 1, 1])
+
+    def test_mismatch_rolls_back(self):
+        copy_rows = order_archive._copy_rows
+
+        def copy_too_many(model, *args):
+            return copy_rows(model, *args) + (model is Comment)
+
+        with mock.patch.object(order_archive, '_copy_rows', copy_too_many), self.assertRaises(ArchiveMismatch):
+            archive_orders(365)
+        self.assertEqual(self.archived_counts(), [0, 0, 0, 0, 0])
+        self.assertEqual(self.live_counts(), [1, 1, 1, 1])
+        self.assertTrue(LocationPing.objects.filter(order=self.closed).exists())
+
+    def test_archived_order_is_readable(self):
+        archive_orders(365)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/orders/{self.closed.id}/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['archived'])
+        self.assertEqual((len(data['order_items']), len(data['comments'])), (1, 1))
+
+        response = client.get(f'/api/public/orders/{self.closed.id}/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['archived'])
+        self.assertEqual(len(data['attachments']), 1)
+        self.assertEqual(Decimal(str(data['total'])), Decimal('10.00'))
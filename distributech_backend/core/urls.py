@@ -11,9 +11,11 @@ from .views import (
 from .order_views import OrderViewSet
 from .stock_views import StockViewSet
 from .chat_views import ConversationViewSet, MessageViewSet
+from .search_views import search_messages, search_comments
+from .analytics_views import cache_stats, lead_times
 from .views_email import (
     email_test, public_email_test, order_notification, stock_alert,
-    update_order_status
+    update_order_status, bulk_update_order_status
 )
 
 router = DefaultRouter()
@@ -39,14 +41,23 @@ urlpatterns = [
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
+    # Full-text search endpoints
+    path('search/messages/', search_messages, name='search-messages'),
+    path('search/comments/', search_comments, name='search-comments'),
+    
+    # Analytics endpoints
+    path('analytics/lead-times/', lead_times, name='analytics-lead-times'),
+    path('analytics/cache/', cache_stats, name='analytics-cache'),
+    
     # Email endpoints
     path('email/test/', email_test, name='email-test'),
     path('public/email/test/', public_email_test, name='public-email-test'),
     path('orders/<int:order_id>/notify/', order_notification, name='order-notification'),
     path('items/<int:item_id>/stock-alert/', stock_alert, name='stock-alert'),
     
-    # Order status update endpoint (public)
+    # Order status update endpoints
     path('public/orders/<int:order_id>/status/', update_order_status, name='update-order-status'),
+    path('orders/status/bulk/', bulk_update_order_status, name='bulk-update-order-status'),
     
     # Public endpoints that don't require authentication
     path('public/roles/', public_roles, name='public-roles'),
@@ -0,0 +1,67 @@
+"""
+Concurrent database access for async views
+
+Django's async ORM (``aget``, ``async for``...) hands every query to
+``sync_to_async(thread_sensitive=True)``: all queries of a request run one
+after another, on one thread and one connection, so ``asyncio.gather`` over
+async querysets does not overlap anything. ``run`` executes a function in a
+small pool of threads of its own instead, each with its own database
+connection, so independent queries of one request really run at the same
+time and never queue behind the thread-sensitive executor.
+
+The pool has ``ASYNC_DB_THREADS`` (default 16) threads per process, and so
+up to that many connections per database. Their connections follow
+``CONN_MAX_AGE`` like request connections do; set it (and
+``CONN_HEALTH_CHECKS``) so they are reused instead of opened for every
+query. The caller's context is copied into the thread, so replica routing
+and request instrumentation apply to the queries as usual.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.utils.instrumentation import install_query_dispatch
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the thread pool database work runs in, created on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                install_query_dispatch()
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_DB_THREADS', 16), thread_name_prefix='async-db'
+                )
+    return _executor
+
+
+def _call(func, args, kwargs):
+    # What request_started does for request threads: drop connections past CONN_MAX_AGE or broken
+    close_old_connections()
+    return func(*args, **kwargs)
+
+
+async def run(func, *args, **kwargs):
+    """
+    Run a synchronous function that queries the database in the pool
+
+    Returns:
+        The return value of func
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, func, args, kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+async def fetch(queryset):
+    """Evaluate a queryset in the pool and return its rows as a list"""
+    return await run(list, queryset)
@@ -0,0 +1,179 @@
+"""
+Conditional requests (ETag / Last-Modified)
+
+Views decorated with ``conditional`` compute cheap validators for the
+resource before doing any work: a single indexed lookup of the row's
+``updated_at`` (and of the rows it embeds) for a detail view, or
+``COUNT``/``MAX(updated_at)`` over the filtered queryset for a list. Django's
+``get_conditional_response`` then answers:
+
+- ``304 Not Modified`` to a GET whose ``If-None-Match``/``If-Modified-Since``
+  still matches, before the view queries and serializes anything
+- ``412 Precondition Failed`` to a write whose ``If-Match`` no longer matches,
+  so clients cannot overwrite changes they have not seen
+
+``Order.updated_at`` is touched by database triggers whenever the order's
+items, statuses, comments or attachments change (migration 0010), so it
+versions the whole order detail. Embedded reference data without an
+``updated_at`` of its own (items, roles, departments) is covered by the model
+versions of the response cache.
+"""
+import datetime
+import functools
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import HttpRequest
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.request import Request
+
+from core.models import ArchivedOrder, Department, Item, Order, Role
+from core.utils import async_db
+from core.utils.response_cache import get_model_versions
+
+# Version fields of an order detail and the reference data it embeds
+ORDER_VERSION_FIELDS = ('updated_at', 'user__updated_at')
+ORDER_EMBEDDED_MODELS = (Item, Role, Department)
+
+
+def make_etag(*parts):
+    """Return a quoted ETag for the given version parts"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def row_validators(queryset, pk, fields, models=()):
+    """
+    Validators of one row, from a single lookup
+
+    Args:
+        queryset: Queryset the row must be visible in
+        pk: Primary key of the row
+        fields: Version fields to read (``updated_at``, ``user__updated_at``...)
+        models: Models embedded in the response whose cache versions count as well
+
+    Returns:
+        Tuple of (ETag, Last-Modified datetime), or None if the row is not found
+    """
+    try:
+        row = queryset.order_by().filter(pk=pk).values_list(*fields).first()
+    except (ValueError, TypeError):
+        return None
+    if row is None:
+        return None
+    timestamps = [value for value in row if isinstance(value, datetime.datetime)]
+    return make_etag(pk, *row, *get_model_versions(models)), max(timestamps, default=None)
+
+
+def list_validators(request, queryset, models=()):
+    """
+    Validators of a list page, from one aggregate over the filtered queryset
+
+    The row count catches deletions, which ``MAX(updated_at)`` alone would
+    miss, so only an ETag is returned for lists.
+
+    Returns:
+        Tuple of (ETag, None)
+    """
+    summary = queryset.order_by().aggregate(rows=Count('pk'), updated=Max('updated_at'))
+    return make_etag(
+        request.get_full_path(), summary['rows'], summary['updated'], *get_model_versions(models)
+    ), None
+
+
+def order_validators(order_id, queryset=None, archived_queryset=None):
+    """
+    Validators of an order detail, falling back to the archive
+
+    Args:
+        queryset: Orders the order must be visible in (default all)
+        archived_queryset: Archived orders it may be found in instead (default all)
+    """
+    queryset = Order.objects.all() if queryset is None else queryset
+    current = row_validators(queryset, order_id, ORDER_VERSION_FIELDS, ORDER_EMBEDDED_MODELS)
+    if current is None:
+        archived_queryset = ArchivedOrder.objects.all() if archived_queryset is None else archived_queryset
+        current = row_validators(archived_queryset, order_id, ORDER_VERSION_FIELDS, ORDER_EMBEDDED_MODELS)
+    return current
+
+
+def conditional(validators):
+    """
+    Answer conditional requests to a DRF view from cheap validators
+
+    Works on function views decorated with ``@api_view`` (apply it below
+    ``@api_view`` and the permission decorators) and on viewset methods.
+
+    Args:
+        validators: Callable taking the view's arguments and returning
+            (ETag, Last-Modified datetime or None), or None to skip the checks
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, (Request, HttpRequest)))
+            current = validators(*args, **kwargs)
+            if current is None:
+                return view(*args, **kwargs)
+
+            etag, timestamp = _unpack(current)
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = view(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if request.method in ('PUT', 'PATCH'):
+                # Hand out the new version so the client can chain If-Match
+                current = validators(*args, **kwargs)
+                if current is None:
+                    return response
+                etag, timestamp = _unpack(current)
+            elif request.method not in ('GET', 'HEAD'):
+                return response
+            return _add_validators(response, etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def async_conditional(validators):
+    """
+    ``conditional`` for async views, which only serve GET and HEAD
+
+    Args:
+        validators: Synchronous callable taking the view's arguments, run in
+            the pool of ``core.utils.async_db``
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            current = await async_db.run(validators, request, *args, **kwargs)
+            if current is None:
+                return await view(request, *args, **kwargs)
+
+            etag, timestamp = _unpack(current)
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = await view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            return _add_validators(response, etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def _unpack(current):
+    etag, last_modified = current
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def _add_validators(response, etag, timestamp):
+    if not response.has_header('ETag'):
+        response['ETag'] = etag
+    if timestamp is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(timestamp)
+    return response
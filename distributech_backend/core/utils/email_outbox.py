@@ -0,0 +1,438 @@
+"""
+Transactional email outbox for DistribuTech
+
+Request handlers never talk to SMTP. They call one of the ``queue_*``
+functions inside the same ``transaction.atomic()`` block as the change that
+triggers the email, which writes an ``EmailOutbox`` row. The row becomes
+visible to the ``run_email_worker`` command only when the transaction
+commits, so an email is never sent for a change that was rolled back and
+never lost for one that was committed.
+"""
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from core.models import EmailOutbox, EmailOutboxStatus, Order, OrderStatus, Stock
+from core.utils.email_utils import (
+    send_many, build_order_notification, build_status_change_notification,
+    build_stock_alert, build_test_email, build_order_digest, build_status_change_digest
+)
+from core.utils import metrics
+from core.utils.recipient_routing import resolve_recipients
+
+# Kinds of email the worker knows how to build
+ORDER_NOTIFICATION = 'order_notification'
+STATUS_CHANGE = 'status_change'
+STOCK_ALERT = 'stock_alert'
+TEST_EMAIL = 'test_email'
+
+
+def get_worker_setting(name, default):
+    """Read a key from the optional EMAIL_WORKER settings dict"""
+    return getattr(settings, 'EMAIL_WORKER', {}).get(name, default)
+
+
+# Seconds a notification of each kind is held back so that further events for
+# the same recipient can be merged into one digest. Kinds without a window
+# (stock alerts, test emails) are always sent on their own.
+DEFAULT_COALESCE_WINDOWS = {
+    STATUS_CHANGE: 300,
+    ORDER_NOTIFICATION: 300,
+}
+
+# Status changes that are critical enough to bypass the digest window
+DEFAULT_IMMEDIATE_STATUSES = ['Cancelled']
+
+# Upper bound on the number of events merged into a single digest email
+DEFAULT_DIGEST_MAX_EVENTS = 200
+
+
+def get_coalesce_window(kind):
+    """Return the digest window in seconds for a kind (EMAIL_COALESCE_WINDOWS overrides the defaults)"""
+    windows = {**DEFAULT_COALESCE_WINDOWS, **getattr(settings, 'EMAIL_COALESCE_WINDOWS', {})}
+    return windows.get(kind, 0)
+
+
+def enqueue_email(kind, payload, recipients=None, max_attempts=None, immediate=False):
+    """
+    Write an email to the outbox
+
+    Call this inside the transaction that performs the business change.
+    If the kind has a coalescing window and the recipients are known, the
+    event is merged into the recipient's pending digest for that kind (or
+    starts a new one that is sent when the window closes).
+
+    Args:
+        kind: One of the kinds registered in EMAIL_BUILDERS
+        payload: JSON-serializable dict of object IDs needed to build the email
+        recipients: Optional list of email addresses (the builder picks defaults otherwise)
+        max_attempts: Optional override of the retry limit
+        immediate: Send as soon as possible, skipping the digest window
+
+    Returns:
+        The EmailOutbox object the event was written to
+    """
+    return enqueue_many(kind, [(payload, recipients, immediate)], max_attempts)[0]
+
+
+def enqueue_many(kind, events, max_attempts=None):
+    """
+    Write a batch of emails of one kind to the outbox
+
+    Events for the same recipients are merged with a single locked lookup
+    per recipient group and all new rows are written with one bulk insert.
+
+    Args:
+        kind: One of the kinds registered in EMAIL_BUILDERS
+        events: Iterable of (payload, recipients, immediate) tuples, see enqueue_email
+        max_attempts: Optional override of the retry limit
+
+    Returns:
+        List with the EmailOutbox object each event was written to
+    """
+    max_attempts = max_attempts or get_worker_setting('MAX_ATTEMPTS', 5)
+    window = get_coalesce_window(kind)
+
+    results = []
+    new_entries = []
+    groups = {}
+    for index, (payload, recipients, immediate) in enumerate(events):
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        results.append(None)
+        if window and recipients and not immediate:
+            groups.setdefault(tuple(sorted(recipients)), []).append((index, payload))
+        else:
+            entry = EmailOutbox(kind=kind, payload=payload, recipients=recipients or [], max_attempts=max_attempts)
+            new_entries.append((index, entry))
+
+    with transaction.atomic():
+        for recipients, items in groups.items():
+            new_entries.extend(_coalesce(kind, items, list(recipients), window, max_attempts, results))
+        EmailOutbox.objects.bulk_create([entry for _, entry in new_entries])
+    for index, entry in new_entries:
+        results[index] = entry
+    return results
+
+
+def _coalesce(kind, items, recipients, window, max_attempts, results):
+    # Appends to the pending digest where possible; returns the digests still to be inserted
+    key = f"{kind}:{','.join(recipients)}"
+    if len(key) > 255:
+        # Routed groups can be long, keep the key within the column
+        key = f"{kind}:sha1:{hashlib.sha1(key.encode()).hexdigest()}"
+    max_events = getattr(settings, 'EMAIL_DIGEST_MAX_EVENTS', DEFAULT_DIGEST_MAX_EVENTS)
+
+    # Only untouched digests can grow; once the worker claimed one it is final
+    entry = (
+        EmailOutbox.objects.select_for_update()
+        .filter(coalesce_key=key, status=EmailOutboxStatus.PENDING, attempts=0)
+        .order_by('-id')
+        .first()
+    )
+    existing = entry
+    grew = False
+    created = []
+    for index, payload in items:
+        if entry is None or len(entry.payload['events']) >= max_events:
+            entry = EmailOutbox(
+                kind=kind,
+                payload={'events': []},
+                recipients=recipients,
+                coalesce_key=key,
+                next_attempt_at=timezone.now() + timedelta(seconds=window),
+                max_attempts=max_attempts,
+            )
+            created.append((index, entry))
+        elif entry is existing:
+            grew = True
+        entry.payload['events'].append(payload)
+        results[index] = entry
+
+    if grew:
+        existing.save(update_fields=['payload'])
+    return created
+
+
+def queue_order_notification(order, recipient_email=None, immediate=False):
+    return queue_order_notifications([order], recipient_email, immediate)[0]
+
+
+def queue_order_notifications(orders, recipient_email=None, immediate=False):
+    """Queue notifications for many orders, routing all recipients with one query"""
+    routed = resolve_recipients(ORDER_NOTIFICATION, [order.id for order in orders], recipient_email)
+    return enqueue_many(ORDER_NOTIFICATION, [
+        ({'order_id': order.id}, routed.get(order.id), immediate)
+        for order in orders
+    ])
+
+
+def queue_status_change_notification(order_status, recipient_email=None, immediate=None):
+    return queue_status_change_notifications([order_status], recipient_email, immediate)[0]
+
+
+def queue_status_change_notifications(order_statuses, recipient_email=None, immediate=None):
+    """
+    Queue notifications for many status changes, routing all recipients with one query
+
+    Unless ``immediate`` is given, changes to one of the EMAIL_IMMEDIATE_STATUSES
+    skip the digest window.
+    """
+    immediate_statuses = getattr(settings, 'EMAIL_IMMEDIATE_STATUSES', DEFAULT_IMMEDIATE_STATUSES)
+    routed = resolve_recipients(STATUS_CHANGE, [s.id for s in order_statuses], recipient_email)
+    return enqueue_many(STATUS_CHANGE, [
+        (
+            {'order_status_id': order_status.id},
+            routed.get(order_status.id),
+            order_status.status in immediate_statuses if immediate is None else immediate,
+        )
+        for order_status in order_statuses
+    ])
+
+
+def queue_stock_alert(stock, recipient_email=None):
+    metrics.LOW_STOCK_ALERTS.inc()
+    routed = resolve_recipients(STOCK_ALERT, [stock.id], recipient_email)
+    return enqueue_email(STOCK_ALERT, {'stock_id': stock.id}, routed.get(stock.id))
+
+
+def _build_order_notification(payload, recipient):
+    order = Order.objects.select_related('user__department').get(id=payload['order_id'])
+    return build_order_notification(order, recipient)
+
+
+def _build_status_change(payload, recipient):
+    order_status = OrderStatus.objects.select_related(
+        'order__user__department', 'updated_by'
+    ).get(id=payload['order_status_id'])
+    return build_status_change_notification(order_status, recipient)
+
+
+def _build_stock_alert(payload, recipient):
+    stock = Stock.objects.select_related('item', 'supplier').get(id=payload['stock_id'])
+    return build_stock_alert(stock.item, stock, recipient)
+
+
+def _build_test_email(payload, recipient):
+    return build_test_email(recipient)
+
+
+# Maps an outbox kind to a function(payload, recipient) returning
+# (recipients, subject, html_content) or None when there is nobody to send to
+EMAIL_BUILDERS = {
+    ORDER_NOTIFICATION: _build_order_notification,
+    STATUS_CHANGE: _build_status_change,
+    STOCK_ALERT: _build_stock_alert,
+    TEST_EMAIL: _build_test_email,
+}
+
+
+def _build_order_digest(events, recipient):
+    orders = list(
+        Order.objects.select_related('user__department').filter(id__in=[e['order_id'] for e in events])
+    )
+    if not orders:
+        return None
+    return build_order_digest(orders, recipient)
+
+
+def _build_status_change_digest(events, recipient):
+    order_statuses = list(
+        OrderStatus.objects.select_related('updated_by')
+        .filter(id__in=[e['order_status_id'] for e in events])
+    )
+    if not order_statuses:
+        return None
+    return build_status_change_digest(order_statuses, recipient)
+
+
+# Maps a coalescable kind to a function(events, recipient) building one digest
+DIGEST_BUILDERS = {
+    ORDER_NOTIFICATION: _build_order_digest,
+    STATUS_CHANGE: _build_status_change_digest,
+}
+
+
+def build_message(entry):
+    """
+    Build the email for an outbox entry
+
+    Entries that collected several events while their window was open are
+    rendered as a single digest.
+
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content), or None if nothing should be sent
+    """
+    builder = EMAIL_BUILDERS.get(entry.kind)
+    if builder is None:
+        raise ValueError(f"Unknown email kind '{entry.kind}'")
+    recipient = ', '.join(entry.recipients) if entry.recipients else None
+
+    events = entry.payload.get('events')
+    if events is None:
+        return builder(entry.payload, recipient)
+    if len(events) == 1:
+        return builder(events[0], recipient)
+    return DIGEST_BUILDERS[entry.kind](events, recipient)
+
+
+def claim_batch(worker_id, batch_size, lease_seconds=300):
+    """
+    Claim due outbox entries for this worker
+
+    Rows are locked with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    workers can poll the same table without blocking each other or claiming
+    the same email twice. Entries stuck in Sending for longer than the lease
+    (e.g. because a worker was killed) are claimed again.
+
+    Returns:
+        List of claimed EmailOutbox objects
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=EmailOutboxStatus.PENDING, next_attempt_at__lte=now) |
+                Q(status=EmailOutboxStatus.SENDING, locked_at__lt=stale)
+            )
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(id__in=ids).update(
+            status=EmailOutboxStatus.SENDING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(EmailOutbox.objects.filter(id__in=ids).order_by('next_attempt_at'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at EMAIL_WORKER['MAX_BACKOFF']"""
+    base = get_worker_setting('BACKOFF_BASE', 30)
+    cap = get_worker_setting('MAX_BACKOFF', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def mark_sent(entry):
+    EmailOutbox.objects.filter(id=entry.id).update(
+        status=EmailOutboxStatus.SENT,
+        sent_at=timezone.now(),
+        locked_by=None,
+        locked_at=None,
+        last_error=None,
+    )
+
+
+def mark_failed(entry, error):
+    """Schedule a retry, or give up once max_attempts is reached"""
+    if entry.attempts >= entry.max_attempts:
+        status = EmailOutboxStatus.FAILED
+        next_attempt_at = entry.next_attempt_at
+    else:
+        status = EmailOutboxStatus.PENDING
+        next_attempt_at = timezone.now() + retry_delay(entry.attempts)
+    EmailOutbox.objects.filter(id=entry.id).update(
+        status=status,
+        next_attempt_at=next_attempt_at,
+        locked_by=None,
+        locked_at=None,
+        last_error=str(error)[:2000],
+    )
+    return status
+
+
+def process_batch(worker_id, batch_size=50, concurrency=4, lease_seconds=300):
+    """
+    Claim a batch, deliver it and record the outcome of every email
+
+    Emails are built in the calling thread (all database work stays on one
+    connection), split into at most ``concurrency`` chunks and each chunk is
+    sent over a single pooled SMTP session by a worker thread.
+
+    Returns:
+        Dict of counters for the batch: claimed, sent, retried, failed, skipped
+        and send_seconds (total time spent talking to SMTP)
+    """
+    stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'send_seconds': 0.0}
+    entries = claim_batch(worker_id, batch_size, lease_seconds)
+    stats['claimed'] = len(entries)
+    if not entries:
+        return stats
+
+    jobs = []
+    for entry in entries:
+        try:
+            message = build_message(entry)
+        except Exception as e:
+            _record_failure(entry, e, stats)
+            continue
+        if message is None:
+            # Nobody to send to: treat as done so it is not retried forever
+            mark_sent(entry)
+            stats['skipped'] += 1
+            continue
+        jobs.append((entry, message))
+
+    def deliver(chunk):
+        # One pooled SMTP session per chunk instead of one connection per email
+        started = time.monotonic()
+        errors = send_many([message for _, message in chunk])
+        return chunk, errors, time.monotonic() - started
+
+    # Split the batch into at most ``concurrency`` chunks sent in parallel
+    concurrency = max(1, min(concurrency, len(jobs) or 1))
+    chunks = [jobs[i::concurrency] for i in range(concurrency) if jobs[i::concurrency]]
+    sent_ids = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for chunk, errors, elapsed in pool.map(deliver, chunks):
+            stats['send_seconds'] += elapsed
+            for (entry, _), error in zip(chunk, errors):
+                if error is None:
+                    sent_ids.append(entry.id)
+                else:
+                    _record_failure(entry, error, stats)
+
+    if sent_ids:
+        EmailOutbox.objects.filter(id__in=sent_ids).update(
+            status=EmailOutboxStatus.SENT,
+            sent_at=timezone.now(),
+            locked_by=None,
+            locked_at=None,
+            last_error=None,
+        )
+        stats['sent'] += len(sent_ids)
+    return stats
+
+
+def _record_failure(entry, error, stats):
+    if mark_failed(entry, error) == EmailOutboxStatus.FAILED:
+        stats['failed'] += 1
+    else:
+        stats['retried'] += 1
+
+
+def outbox_summary():
+    """Return the number of outbox entries per status and the age of the oldest due email"""
+    counts = dict(
+        EmailOutbox.objects.values_list('status').annotate(total=Count('id')).order_by()
+    )
+    oldest = EmailOutbox.objects.filter(
+        status=EmailOutboxStatus.PENDING, next_attempt_at__lte=timezone.now()
+    ).aggregate(oldest=Min('next_attempt_at'))['oldest']
+    return {
+        'counts': {choice: counts.get(choice, 0) for choice in EmailOutboxStatus.values},
+        'oldest_due_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
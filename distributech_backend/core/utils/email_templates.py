@@ -0,0 +1,147 @@
+"""
+Template rendering for DistribuTech emails
+
+Email bodies live in ``core/templates/emails`` and share the layout in
+``emails/base.html``. They are rendered by a dedicated template engine whose
+cached loader keeps every compiled template (layout included) in memory, so
+after the first render each email only costs a walk over an already parsed
+node tree. The plain-text alternative is derived from the rendered HTML.
+"""
+import os
+import re
+import threading
+from html import unescape
+
+from django.template import Context, Engine
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+# Every email template, compiled up front by precompile_templates()
+EMAIL_TEMPLATES = [
+    'emails/base.html',
+    'emails/order_notification.html',
+    'emails/order_digest.html',
+    'emails/status_change.html',
+    'emails/status_change_digest.html',
+    'emails/stock_alert.html',
+    'emails/test_email.html',
+]
+
+_engine = None
+_engine_lock = threading.Lock()
+
+_HIDDEN_RE = re.compile(r'<(head|style|script)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z0-9]+)[^>]*>')
+_WHITESPACE_RE = re.compile(r'\s+')
+_LINE_BREAK = '\x00'
+_BLOCK_TAGS = {'p', 'div', 'tr', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+
+def get_email_engine():
+    """
+    Return the template engine used for emails
+
+    The engine is independent of the TEMPLATES setting so it always uses
+    the cached loader and never runs the debug machinery or context
+    processors meant for request rendering.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Engine(
+                    dirs=[TEMPLATE_DIR],
+                    loaders=[(
+                        'django.template.loaders.cached.Loader',
+                        ['django.template.loaders.filesystem.Loader'],
+                    )],
+                    autoescape=True,
+                    debug=False,
+                )
+    return _engine
+
+
+def precompile_templates():
+    """
+    Parse and cache every email template
+
+    Called when a long-running process starts so the first email does not
+    pay for loading and compiling the layout.
+
+    Returns:
+        Number of templates compiled
+    """
+    engine = get_email_engine()
+    for name in EMAIL_TEMPLATES:
+        engine.get_template(name)
+    return len(EMAIL_TEMPLATES)
+
+
+def _replace_tag(match):
+    closing, name = match.groups()
+    name = name.lower()
+    if name == 'br' or (closing and name in _BLOCK_TAGS):
+        return _LINE_BREAK
+    if closing and name in ('td', 'th'):
+        return ' '
+    return ''
+
+
+def html_to_text(html):
+    """
+    Derive the plain-text alternative of an email from its HTML
+
+    Table cells are joined on one line, block elements end a line and
+    consecutive blank lines are collapsed.
+    """
+    if '<style' in html or '<head' in html or '<script' in html:
+        html = _HIDDEN_RE.sub('', html)
+    # Tags go first: they hold most of the bytes (inline styles), which
+    # leaves less text for the whitespace pass
+    text = _TAG_RE.sub(_replace_tag, html)
+    text = unescape(_WHITESPACE_RE.sub(' ', text))
+
+    lines = []
+    for line in text.split(_LINE_BREAK):
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return '\n'.join(lines).strip() + '\n'
+
+
+def render_email(template_name, context):
+    """
+    Render one email template
+
+    Args:
+        template_name: Name relative to core/templates, e.g. 'emails/stock_alert.html'
+        context: Dict of template variables
+
+    Returns:
+        Tuple of (html_content, text_content)
+    """
+    return render_many(template_name, [context])[0]
+
+
+def render_many(template_name, contexts):
+    """
+    Render the same email template for many contexts in one pass
+
+    The compiled template and a single Context are reused for every
+    message, which is what digests and bulk sends need.
+
+    Args:
+        template_name: Name relative to core/templates
+        contexts: Iterable of dicts of template variables
+
+    Returns:
+        List of (html_content, text_content) tuples in the order of ``contexts``
+    """
+    template = get_email_engine().get_template(template_name)
+    context = Context(autoescape=True)
+    rendered = []
+    for values in contexts:
+        with context.push(values):
+            html_content = template.render(context)
+        rendered.append((html_content, html_to_text(html_content)))
+    return rendered
@@ -1,37 +1,35 @@
 """
 Email utilities for sending notifications in DistribuTech
 """
-import smtplib
+import logging
+import time
+from collections import defaultdict
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from django.conf import settings
 from django.utils import timezone
 
-def send_email(recipients, subject, html_content, text_content=None):
-    """
-    Simple function to send an email using the configured email settings
-    
-    Args:
-        recipients: List or string of email addresses
-        subject: Email subject
-        html_content: HTML content of the email
-        text_content: Plain text version (optional)
-        
-    Returns:
-        Boolean indicating success or failure
-    """
+from core.utils import metrics
+from core.utils.email_templates import render_email, render_many
+from core.utils.recipient_routing import get_routes, resolve_recipients
+from core.utils.smtp_pool import get_smtp_pool
+
+logger = logging.getLogger(__name__)
+
+def _normalize_recipients(recipients):
     # Process recipients if it's a string
     if isinstance(recipients, str):
         recipients = [r.strip() for r in recipients.split(',') if r.strip()]
+    return recipients
+
+def build_mime_message(recipients, subject, html_content, text_content=None):
+    """
+    Build the MIME message string for an email
     
-    if not recipients:
-        return False
-    
-    # Get email settings from Django settings
-    smtp_server = settings.EMAIL_HOST
-    smtp_port = settings.EMAIL_PORT
-    smtp_user = settings.EMAIL_HOST_USER
-    smtp_password = settings.EMAIL_HOST_PASSWORD
+    Returns:
+        Tuple of (from_email, recipients, message_string)
+    """
+    recipients = _normalize_recipients(recipients)
     from_email = settings.DEFAULT_FROM_EMAIL
     
     # Create message
@@ -47,21 +45,78 @@ def send_email(recipients, subject, html_content, text_content=None):
     # Attach HTML content
     msg.attach(MIMEText(html_content, 'html'))
     
+    return from_email, recipients, msg.as_string()
+
+def send_email(recipients, subject, html_content, text_content=None, fail_silently=True):
+    """
+    Simple function to send an email using the configured email settings
+    
+    The message goes out over a pooled, already authenticated SMTP session
+    (see smtp_pool.py) instead of a new connection per email.
+    
+    Args:
+        recipients: List or string of email addresses
+        subject: Email subject
+        html_content: HTML content of the email
+        text_content: Plain text version (optional)
+        fail_silently: If False, SMTP errors are raised instead of returning False
+        
+    Returns:
+        Boolean indicating success or failure
+    """
+    recipients = _normalize_recipients(recipients)
+    
+    if not recipients:
+        return False
+    
+    started = time.perf_counter()
     try:
-        # Connect to SMTP server and send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            if settings.EMAIL_USE_TLS:
-                server.starttls()
-            
-            if smtp_user and smtp_password:
-                server.login(smtp_user, smtp_password)
-            
-            server.sendmail(from_email, recipients, msg.as_string())
-            
+        get_smtp_pool().send(*build_mime_message(recipients, subject, html_content, text_content))
+        metrics.EMAILS.inc(result='success')
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        metrics.EMAILS.inc(result='failure')
+        if not fail_silently:
+            raise
+        logger.error("Error sending email: %s", e)
         return False
+    finally:
+        metrics.EMAIL_SEND_DURATION.observe(time.perf_counter() - started, function='send_email')
+
+def send_many(messages):
+    """
+    Send a batch of emails over a single pooled SMTP session
+    
+    Args:
+        messages: Iterable of (recipients, subject, html_content) or
+            (recipients, subject, html_content, text_content) tuples
+        
+    Returns:
+        List with one entry per message: None if it was sent, otherwise the
+        exception that prevented it
+    """
+    results = []
+    prepared = []
+    positions = []
+    for index, message in enumerate(messages):
+        results.append(None)
+        if not _normalize_recipients(message[0]):
+            results[index] = ValueError("No recipients")
+            continue
+        prepared.append(build_mime_message(*message))
+        positions.append(index)
+    
+    started = time.perf_counter()
+    errors = get_smtp_pool().send_many(prepared)
+    metrics.EMAIL_SEND_DURATION.observe(time.perf_counter() - started, function='send_many')
+    for index, error in zip(positions, errors):
+        results[index] = error
+    failures = sum(1 for result in results if result is not None)
+    if failures:
+        metrics.EMAILS.inc(failures, result='failure')
+    if len(results) > failures:
+        metrics.EMAILS.inc(len(results) - failures, result='success')
+    return results
 
 def send_order_notification(order, recipient_email=None):
     """
@@ -74,98 +129,81 @@ def send_order_notification(order, recipient_email=None):
     Returns:
         Boolean indicating success or failure
     """
-    from core.models import OrderItem
-    
-    # If no recipient provided, use order creator's email
-    if not recipient_email and hasattr(order.user, 'email'):
-        recipient_email = order.user.email
-    
-    if not recipient_email:
+    message = build_order_notification(order, recipient_email)
+    if message is None:
         return False
+    return send_email(*message)
+
+def build_order_notification(order, recipient_email=None):
+    """
+    Build the order notification email without sending it
+    
+    Args:
+        order: Order object
+        recipient_email: Optional email address (routed to the order creator by default)
+        
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content), or None if there is no recipient
+    """
+    return build_order_notifications([order], recipient_email)[0]
+
+def build_order_notifications(orders, recipient_email=None):
+    """
+    Build order notification emails for many orders at once
     
-    # Get order items
-    order_items = OrderItem.objects.filter(order=order)
+    Recipients are routed and the items of all orders are loaded with one
+    query each, and every email is rendered in a single render_many pass.
     
-    # Format email content
-    subject = f"Order #{order.id} Notification"
+    Args:
+        orders: List of Order objects (with user and department loaded)
+        recipient_email: Optional email address (routed per order by default)
+        
+    Returns:
+        List with one entry per order: a (recipients, subject, html_content,
+        text_content) tuple, or None if the order has no recipient
+    """
+    from core.models import OrderItem
     
-    # Build items table
-    items_html = ""
-    total = 0
+    order_items = defaultdict(list)
+    for order_item in (
+        OrderItem.objects.filter(order_id__in=[order.id for order in orders])
+        .select_related('item')
+        .order_by('id')
+    ):
+        order_items[order_item.order_id].append(order_item)
     
-    for item in order_items:
-        item_total = item.quantity * item.price_at_order_time
-        total += item_total
-        items_html += f"""
-        <tr>
-            <td style="padding: 8px; border-bottom: 1px solid #ddd;">{item.item.name}</td>
-            <td style="padding: 8px; border-bottom: 1px solid #ddd;">{item.quantity}</td>
-            <td style="padding: 8px; border-bottom: 1px solid #ddd;">${float(item.price_at_order_time):.2f}</td>
-            <td style="padding: 8px; border-bottom: 1px solid #ddd;">${float(item_total):.2f}</td>
-        </tr>
-        """
+    routed = resolve_recipients('order_notification', [order.id for order in orders], recipient_email)
     
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
-        <div style="background-color: #f5f5f5; padding: 20px; border-radius: 5px; margin-bottom: 20px;">
-            <h1 style="color: #0284c7; margin: 0 0 10px;">Order Notification</h1>
-            <p>Your order has been received and is being processed.</p>
-        </div>
+    messages = [None] * len(orders)
+    positions = []
+    contexts = []
+    for index, order in enumerate(orders):
+        recipients = routed.get(order.id)
+        if not recipients:
+            continue
         
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Order Details</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Order Number:</th>
-                    <td style="padding: 8px;">#{order.id}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Date:</th>
-                    <td style="padding: 8px;">{order.created_at.strftime('%B %d, %Y')}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Status:</th>
-                    <td style="padding: 8px;">{order.status}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Department:</th>
-                    <td style="padding: 8px;">{order.user.department.name}</td>
-                </tr>
-            </table>
-        </div>
+        lines = []
+        total = 0
+        for item in order_items[order.id]:
+            item_total = item.quantity * item.price_at_order_time
+            total += item_total
+            # Amounts are formatted here, floatformat is slow in a per-row loop
+            lines.append({
+                'name': item.item.name,
+                'quantity': item.quantity,
+                'price': f"{float(item.price_at_order_time):.2f}",
+                'total': f"{float(item_total):.2f}",
+            })
         
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Order Items</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <thead>
-                    <tr style="background-color: #f5f5f5;">
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Item</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Quantity</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Unit Price</th>
-                        <th style="text-align: left; padding: 8px; border-bottom: 2px solid #ddd;">Total</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {items_html}
-                    <tr>
-                        <td colspan="3" style="text-align: right; padding: 8px; font-weight: bold;">Total:</td>
-                        <td style="padding: 8px; font-weight: bold;">${float(total):.2f}</td>
-                    </tr>
-                </tbody>
-            </table>
-        </div>
-        
-        <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; font-size: 12px; color: #666;">
-            <p>Thank you for your order. If you have any questions, please contact your department manager.</p>
-            <p>This is an automated message from DistribuTech Inventory Management System.</p>
-        </div>
-    </body>
-    </html>
-    """
+        messages[index] = (recipients, f"Order #{order.id} Notification")
+        positions.append(index)
+        contexts.append({'order': order, 'lines': lines, 'total': f"{float(total):.2f}"})
     
-    # Send the email
-    return send_email([recipient_email], subject, html_content)
+    for index, (html_content, text_content) in zip(
+        positions, render_many('emails/order_notification.html', contexts)
+    ):
+        messages[index] += (html_content, text_content)
+    return messages
 
 def send_status_change_notification(order_status, recipient_email=None):
     """
@@ -178,86 +216,73 @@ def send_status_change_notification(order_status, recipient_email=None):
     Returns:
         Boolean indicating success or failure
     """
-    # If no recipient provided, use hardcoded manager email
-    # In a real-world scenario, you might want to get the actual department manager's email
-    if not recipient_email:
-        recipient_email = "manager@distributech.com"
+    return send_email(*build_status_change_notification(order_status, recipient_email))
+
+def build_status_change_notification(order_status, recipient_email=None):
+    """
+    Build the status change email without sending it
     
-    order = order_status.order
+    Args:
+        order_status: OrderStatus object
+        recipient_email: Optional email address (routed to the department managers by default)
+        
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content)
+    """
+    recipients = (
+        resolve_recipients('status_change', [order_status.id], recipient_email).get(order_status.id)
+        or get_routes('status_change')['fallback']
+    )
     
-    # Format email content
+    order = order_status.order
     subject = f"Order #{order.id} Status Changed to {order_status.status}"
+    html_content, text_content = render_email(
+        'emails/status_change.html',
+        {'order': order, 'order_status': order_status}
+    )
+    return recipients, subject, html_content, text_content
+
+def build_status_change_digest(order_statuses, recipient_email=None):
+    """
+    Build one digest email covering several order status changes
     
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
-        <div style="background-color: #f0f9ff; padding: 20px; border-radius: 5px; margin-bottom: 20px; border-left: 5px solid #0ea5e9;">
-            <h1 style="color: #0284c7; margin: 0 0 10px;">Order Status Changed</h1>
-            <p>The status of order #{order.id} has been updated.</p>
-        </div>
-        
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Order Details</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Order Number:</th>
-                    <td style="padding: 8px;">#{order.id}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Customer:</th>
-                    <td style="padding: 8px;">{order.user.username}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Department:</th>
-                    <td style="padding: 8px;">{order.user.department.name}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Date Created:</th>
-                    <td style="padding: 8px;">{order.created_at.strftime('%B %d, %Y')}</td>
-                </tr>
-            </table>
-        </div>
-        
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Status Update</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <th style="text-align: left; padding: 8px;">New Status:</th>
-                    <td style="padding: 8px; font-weight: bold;">{order_status.status}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Current Location:</th>
-                    <td style="padding: 8px;">{order_status.current_location or 'Not specified'}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Updated At:</th>
-                    <td style="padding: 8px;">{order_status.location_timestamp.strftime('%B %d, %Y %H:%M')}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Updated By:</th>
-                    <td style="padding: 8px;">{order_status.updated_by.username if order_status.updated_by else 'System'}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Remarks:</th>
-                    <td style="padding: 8px;">{order_status.remarks or 'No remarks'}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Expected Delivery:</th>
-                    <td style="padding: 8px;">{order_status.expected_delivery_date.strftime('%B %d, %Y') if order_status.expected_delivery_date else 'Not specified'}</td>
-                </tr>
-            </table>
-        </div>
+    Args:
+        order_statuses: List of OrderStatus objects (with updated_by loaded)
+        recipient_email: Optional email address (routed to the department managers by default)
         
-        <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; font-size: 12px; color: #666;">
-            <p>This status update was processed by the DistribuTech system.</p>
-            <p>This is an automated message from DistribuTech Inventory Management System.</p>
-        </div>
-    </body>
-    </html>
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content)
     """
+    recipients = []
+    for routed in resolve_recipients('status_change', [s.id for s in order_statuses], recipient_email).values():
+        recipients.extend(email for email in routed if email not in recipients)
+    recipients = recipients or get_routes('status_change')['fallback']
     
-    # Send the email
-    return send_email([recipient_email], subject, html_content)
+    order_count = len({order_status.order_id for order_status in order_statuses})
+    subject = f"{order_count} order{'s' if order_count != 1 else ''} changed status"
+    html_content, text_content = render_email('emails/status_change_digest.html', {
+        'order_statuses': sorted(order_statuses, key=lambda s: (s.order_id, s.location_timestamp)),
+        'order_count': order_count,
+    })
+    return recipients, subject, html_content, text_content
+
+def build_order_digest(orders, recipient_email):
+    """
+    Build one digest email covering several new orders
+    
+    Args:
+        orders: List of Order objects (with user and department loaded)
+        recipient_email: Email address to send to
+        
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content)
+    """
+    subject = f"{len(orders)} new order{'s' if len(orders) != 1 else ''}"
+    html_content, text_content = render_email(
+        'emails/order_digest.html',
+        {'orders': sorted(orders, key=lambda o: o.id)}
+    )
+    return _normalize_recipients(recipient_email), subject, html_content, text_content
 
 def send_stock_alert(item, stock, recipient_email=None):
     """
@@ -271,57 +296,53 @@ def send_stock_alert(item, stock, recipient_email=None):
     Returns:
         Boolean indicating success or failure
     """
-    # If no recipient provided, use a default list
-    if not recipient_email:
-        recipient_email = "inventory@distributech.com"
+    return send_email(*build_stock_alert(item, stock, recipient_email))
+
+def build_stock_alert(item, stock, recipient_email=None):
+    """
+    Build the stock alert email without sending it
+    
+    Args:
+        item: Item object
+        stock: Stock object
+        recipient_email: Optional email address (routed to the supplier and warehouse managers by default)
+        
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content)
+    """
+    recipients = (
+        resolve_recipients('stock_alert', [stock.id], recipient_email).get(stock.id)
+        or get_routes('stock_alert')['fallback']
+    )
     
-    # Format email content
     subject = f"Low Stock Alert: {item.name}"
+    html_content, text_content = render_email(
+        'emails/stock_alert.html',
+        {'item': item, 'stock': stock}
+    )
+    return recipients, subject, html_content, text_content
+
+def build_stock_alerts(stocks, recipient_email=None):
+    """
+    Build stock alert emails for many stock records in one render pass
     
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
-        <div style="background-color: #fff3f3; padding: 20px; border-radius: 5px; margin-bottom: 20px; border-left: 5px solid #ef4444;">
-            <h1 style="color: #ef4444; margin: 0 0 10px;">Low Stock Alert</h1>
-            <p>The following item has fallen below its minimum threshold.</p>
-        </div>
-        
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Item Details</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Item Name:</th>
-                    <td style="padding: 8px;">{item.name}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Current Stock:</th>
-                    <td style="padding: 8px;">{stock.current_stock} {item.measurement_unit or 'units'}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Minimum Threshold:</th>
-                    <td style="padding: 8px;">{stock.minimum_threshold} {item.measurement_unit or 'units'}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Price:</th>
-                    <td style="padding: 8px;">${float(item.price):.2f}</td>
-                </tr>
-                <tr>
-                    <th style="text-align: left; padding: 8px;">Supplier:</th>
-                    <td style="padding: 8px;">{stock.supplier.username}</td>
-                </tr>
-            </table>
-        </div>
+    Args:
+        stocks: List of Stock objects (with item and supplier loaded)
+        recipient_email: Optional email address (routed per stock record by default)
         
-        <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; font-size: 12px; color: #666;">
-            <p>Please take appropriate action to restock this item.</p>
-            <p>This is an automated message from DistribuTech Inventory Management System.</p>
-        </div>
-    </body>
-    </html>
+    Returns:
+        List of (recipients, subject, html_content, text_content) tuples
     """
-    
-    # Send the email
-    return send_email([recipient_email], subject, html_content)
+    routed = resolve_recipients('stock_alert', [stock.id for stock in stocks], recipient_email)
+    fallback = get_routes('stock_alert')['fallback']
+    rendered = render_many(
+        'emails/stock_alert.html',
+        [{'item': stock.item, 'stock': stock} for stock in stocks]
+    )
+    return [
+        (routed.get(stock.id) or fallback, f"Low Stock Alert: {stock.item.name}", html_content, text_content)
+        for stock, (html_content, text_content) in zip(stocks, rendered)
+    ]
 
 def send_test_email(recipient_email):
     """
@@ -333,53 +354,21 @@ def send_test_email(recipient_email):
     Returns:
         Boolean indicating success or failure
     """
-    # Format current time for the email
-    current_time = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Format email content
-    subject = "DistribuTech Email Test"
+    return send_email(*build_test_email(recipient_email))
+
+def build_test_email(recipient_email):
+    """
+    Build the test email without sending it
     
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
-        <div style="background-color: #f0f9ff; padding: 20px; border-radius: 5px; margin-bottom: 20px; border-left: 5px solid #0ea5e9;">
-            <h1 style="color: #0284c7; margin: 0 0 10px;">DistribuTech Email Test</h1>
-            <p>This is a test email sent at {current_time}.</p>
-        </div>
-        
-        <div style="margin-bottom: 20px;">
-            <h2 style="color: #0284c7; border-bottom: 2px solid #0284c7; padding-bottom: 5px;">Email Features Test</h2>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <th style="text-align: left; padding: 8px; border-bottom: 1px solid #ddd;">Feature</th>
-                    <th style="text-align: left; padding: 8px; border-bottom: 1px solid #ddd;">Status</th>
-                </tr>
-                <tr>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">Email Delivery</td>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">✅ Working</td>
-                </tr>
-                <tr>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">HTML Formatting</td>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">✅ Working</td>
-                </tr>
-                <tr>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">Styling & Layout</td>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">✅ Working</td>
-                </tr>
-                <tr>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">Mailtrap Integration</td>
-                    <td style="padding: 8px; border-bottom: 1px solid #ddd;">✅ Working</td>
-                </tr>
-            </table>
-        </div>
+    Args:
+        recipient_email: Email address to send test to
         
-        <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; font-size: 12px; color: #666;">
-            <p>If you received this email, the email notification system is configured correctly.</p>
-            <p>This is a test message from DistribuTech Inventory Management System.</p>
-        </div>
-    </body>
-    </html>
+    Returns:
+        Tuple of (recipients, subject, html_content, text_content)
     """
-    
-    # Send the email
-    return send_email([recipient_email], subject, html_content) 
\ No newline at end of file
+    subject = "DistribuTech Email Test"
+    html_content, text_content = render_email('emails/test_email.html', {
+        'sent_at': timezone.now(),
+        'features': ['Email Delivery', 'HTML Formatting', 'Styling & Layout', 'Mailtrap Integration'],
+    })
+    return [recipient_email], subject, html_content, text_content
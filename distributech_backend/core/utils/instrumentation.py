@@ -0,0 +1,205 @@
+"""
+Per-request query and timing statistics
+
+``RequestStats`` collects what one request spent in the database (through
+``connection.execute_wrapper``), in DRF serializers and in rendering.
+Queries are grouped by fingerprint: the SQL with its placeholders, where
+``IN``/``VALUES`` lists of any length collapse to one form, so a query
+repeated for every row of a list (N+1) shows up as one fingerprint with a
+high count, and an identical query run twice counts as a duplicate.
+
+Serializer time is measured by wrapping ``Serializer.data`` and
+``ListSerializer.data``; only the outermost serializer of a request is
+timed, and the queries it triggers are counted as database time, not
+serializer time.
+
+Middleware hooks into queries with ``wrap_queries`` rather than
+``connection.execute_wrapper``: the wrapper is kept in a context variable
+that every connection consults, so it also sees the queries a request runs
+in other threads (sync views under ASGI, ``core.utils.async_db``), whose
+connections are distinct objects.
+"""
+import contextvars
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+# Stats of the request being handled in this thread or task, None when not sampled
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+# execute_wrappers of the current request, outermost first
+query_wrappers = contextvars.ContextVar('query_wrappers', default=())
+
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+_VALUES_LIST = re.compile(r'(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """Return the SQL with placeholder lists of any length collapsed"""
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _VALUES_LIST.sub(r'\1', sql)
+
+
+class QueryGroup:
+    """Executions of one SQL statement"""
+    __slots__ = ('count', 'duration', 'params')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.params = {}
+
+
+class RequestStats:
+    """Timings and query statistics of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.queries = {}
+        self._serializing = False
+        # Async views run queries of one request in several threads at once
+        self._lock = threading.Lock()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook recording every query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self._record(sql, params, many, duration)
+
+    def _record(self, sql, params, many, duration):
+        self.query_count += 1
+        self.db_time += duration
+        group = self.queries.get(sql)
+        if group is None:
+            group = self.queries[sql] = QueryGroup()
+        group.count += 1
+        group.duration += duration
+        if not many:
+            key = repr(params)
+            group.params[key] = group.params.get(key, 0) + 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total_time(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def duplicate_count(self):
+        """Executions of a query with exactly the same SQL and parameters as an earlier one"""
+        return sum(
+            count - 1
+            for group in self.queries.values()
+            for count in group.params.values()
+        )
+
+    def fingerprints(self):
+        """
+        Group the queries by fingerprint
+
+        Returns:
+            List of dicts (sql, count, distinct_params, duplicates, ms), slowest first
+        """
+        groups = {}
+        for sql, group in self.queries.items():
+            summary = groups.setdefault(fingerprint(sql), {
+                'sql': fingerprint(sql), 'count': 0, 'distinct_params': 0, 'duplicates': 0, 'ms': 0.0,
+            })
+            summary['count'] += group.count
+            summary['distinct_params'] += len(group.params)
+            summary['duplicates'] += sum(count - 1 for count in group.params.values())
+            summary['ms'] += group.duration * 1000
+        result = sorted(groups.values(), key=lambda summary: -summary['ms'])
+        for summary in result:
+            summary['ms'] = round(summary['ms'], 2)
+        return result
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header"""
+        db_ms = self.db_time * 1000
+        serialize_ms = self.serializer_time * 1000
+        render_ms = self.render_time * 1000
+        total_ms = self.total_time * 1000
+        app_ms = max(total_ms - db_ms - serialize_ms - render_ms, 0)
+        return ', '.join([
+            f'db;dur={db_ms:.2f};desc="{self.query_count} queries, {self.duplicate_count} duplicates"',
+            f'serialize;dur={serialize_ms:.2f}',
+            f'render;dur={render_ms:.2f}',
+            f'app;dur={app_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+
+def _timed_data(data_property):
+    def data(serializer):
+        stats = current_stats.get()
+        if stats is None or stats._serializing:
+            return data_property.fget(serializer)
+        stats._serializing = True
+        start = time.perf_counter()
+        db_time = stats.db_time
+        try:
+            return data_property.fget(serializer)
+        finally:
+            stats._serializing = False
+            stats.serializer_time += time.perf_counter() - start - (stats.db_time - db_time)
+    data.timed = True
+    return property(data)
+
+
+def install_serializer_timing():
+    """Wrap the DRF serializer ``data`` properties once per process"""
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        data_property = cls.__dict__['data']
+        if not getattr(data_property.fget, 'timed', False):
+            cls.data = _timed_data(data_property)
+
+
+def _dispatch_queries(execute, sql, params, many, context):
+    for wrapper in reversed(query_wrappers.get()):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _add_dispatch(connection, **kwargs):
+    if _dispatch_queries not in connection.execute_wrappers:
+        # First, so the pop() of a connection.execute_wrapper block entered earlier removes its own wrapper
+        connection.execute_wrappers.insert(0, _dispatch_queries)
+
+
+def install_query_dispatch():
+    """Make every database connection run its queries through ``query_wrappers`` (idempotent)"""
+    connection_created.connect(_add_dispatch, dispatch_uid='core.utils.instrumentation.query_dispatch')
+    for connection in connections.all(initialized_only=True):
+        _add_dispatch(connection)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    Run the queries of the current request through an ``execute_wrapper``, in whatever thread they run
+
+    Requires ``install_query_dispatch()``. The wrapper may be called from
+    several threads at once.
+    """
+    token = query_wrappers.set(query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        query_wrappers.reset(token)
@@ -0,0 +1,226 @@
+"""
+Delivery lead-time analytics
+
+The status history of every order created in the requested range is read
+with one query; a ``LEAD`` window over each order's rows gives the time
+spent in every stage. NumPy then turns those rows into, for the whole range
+and per department, supplier and item:
+
+- lead time percentiles (order creation to first Delivered/Completed status)
+- the on-time rate (delivered on or before the expected delivery date that
+  was current at the time of delivery)
+- the median time spent in each stage and the slowest stage (bottleneck)
+
+Two more queries map orders to their items and items to their suppliers.
+"""
+import numpy as np
+from django.db.models import F, Window
+from django.db.models.functions import Lead
+
+from core.models import OrderItem, OrderStatus, OrderStatusChoices, Stock
+
+DELIVERED_STATUSES = {OrderStatusChoices.DELIVERED, OrderStatusChoices.COMPLETED}
+
+# Stages whose duration is measured (the time until the next status row)
+STAGES = [
+    OrderStatusChoices.PENDING,
+    OrderStatusChoices.PROCESSING,
+    OrderStatusChoices.SHIPPED,
+    OrderStatusChoices.IN_TRANSIT,
+    OrderStatusChoices.DELIVERED,
+]
+
+PERCENTILES = (50, 90, 95)
+
+
+def _status_history(created_from, created_to):
+    """
+    Return the status rows of the orders created in the range, each with the
+    timestamp of the order's next status row
+    """
+    next_at = Window(
+        Lead('location_timestamp'),
+        partition_by=[F('order_id')],
+        order_by=[F('location_timestamp').asc(), F('id').asc()],
+    )
+    return (
+        OrderStatus.objects
+        .filter(order__created_at__gte=created_from, order__created_at__lt=created_to)
+        .annotate(next_at=next_at)
+        .order_by('order_id', 'location_timestamp', 'id')
+        .values_list(
+            'order_id', 'status', 'location_timestamp', 'next_at', 'expected_delivery_date',
+            'order__created_at', 'order__user__department_id', 'order__user__department__name',
+        )
+    )
+
+
+class LeadTimeData:
+    """Per-order and per-stage arrays built from the status history"""
+
+    def __init__(self, rows):
+        stage_index = {stage: index for index, stage in enumerate(STAGES)}
+        order_ids = []
+        lead_hours = []
+        on_time = []
+        departments = []
+        self.department_names = {}
+        stage_orders = []
+        stage_codes = []
+        stage_hours = []
+
+        current = None
+        for order_id, status, timestamp, next_at, expected, created_at, department_id, department_name in rows:
+            if order_id != current:
+                current = order_id
+                order_ids.append(order_id)
+                lead_hours.append(np.nan)
+                on_time.append(np.nan)
+                departments.append(department_id)
+                self.department_names[department_id] = department_name
+                promised = None
+                delivered = False
+            if expected is not None:
+                promised = expected
+            if status in DELIVERED_STATUSES and not delivered:
+                delivered = True
+                lead_hours[-1] = (timestamp - created_at).total_seconds() / 3600
+                if promised is not None:
+                    on_time[-1] = float(timestamp.date() <= promised)
+            if next_at is not None and status in stage_index:
+                stage_orders.append(len(order_ids) - 1)
+                stage_codes.append(stage_index[status])
+                stage_hours.append((next_at - timestamp).total_seconds() / 3600)
+
+        self.order_ids = np.array(order_ids, dtype=np.int64)
+        self.lead_hours = np.array(lead_hours, dtype=float)
+        self.on_time = np.array(on_time, dtype=float)
+        self.departments = np.array(departments, dtype=np.int64)
+
+        # Hours per order and stage; NaN where the order never left that stage
+        self.stage_hours = np.full((len(order_ids), len(STAGES)), np.nan)
+        if stage_hours:
+            totals = np.zeros_like(self.stage_hours)
+            seen = np.zeros(self.stage_hours.shape, dtype=bool)
+            np.add.at(totals, (stage_orders, stage_codes), stage_hours)
+            seen[stage_orders, stage_codes] = True
+            self.stage_hours[seen] = totals[seen]
+
+    def summarize(self, indices=None):
+        """
+        Summarize a group of orders
+
+        Args:
+            indices: Positions of the orders in this data set, all orders if None
+        """
+        if indices is None:
+            indices = np.arange(len(self.order_ids))
+        lead = self.lead_hours[indices]
+        lead = lead[~np.isnan(lead)]
+        on_time = self.on_time[indices]
+        on_time = on_time[~np.isnan(on_time)]
+
+        stage_hours = {}
+        stages = self.stage_hours[indices]
+        for code, stage in enumerate(STAGES):
+            column = stages[:, code]
+            column = column[~np.isnan(column)]
+            if column.size:
+                stage_hours[stage.value] = round(float(np.median(column)), 2)
+
+        lead_time = None
+        if lead.size:
+            lead_time = {
+                f'p{q}': round(float(value), 2)
+                for q, value in zip(PERCENTILES, np.percentile(lead, PERCENTILES))
+            }
+            lead_time['mean'] = round(float(lead.mean()), 2)
+
+        return {
+            'orders': int(len(indices)),
+            'delivered': int(lead.size),
+            'lead_time_hours': lead_time,
+            'on_time_rate': round(float(on_time.mean()), 4) if on_time.size else None,
+            'stage_hours': stage_hours,
+            'bottleneck': max(stage_hours, key=stage_hours.get) if stage_hours else None,
+        }
+
+    def group_by(self, keys, orders):
+        """
+        Split orders into groups
+
+        Args:
+            keys: Group key per membership
+            orders: Order position per membership (an order may be in several groups)
+
+        Returns:
+            Dict of group key -> array of order positions
+        """
+        if not len(keys):
+            return {}
+        keys = np.asarray(keys)
+        orders = np.asarray(orders)
+        order = np.argsort(keys, kind='stable')
+        unique, starts = np.unique(keys[order], return_index=True)
+        return dict(zip(unique.tolist(), np.split(orders[order], starts[1:])))
+
+
+def compute_lead_times(created_from, created_to, limit=50):
+    """
+    Compute lead-time analytics for orders created in [created_from, created_to)
+
+    Args:
+        created_from, created_to: Aware datetimes bounding Order.created_at
+        limit: Maximum number of suppliers and items returned (the ones with most orders)
+
+    Returns:
+        Dict with the overall summary and lists of department, supplier and
+        item summaries
+    """
+    data = LeadTimeData(_status_history(created_from, created_to))
+    position = {order_id: index for index, order_id in enumerate(data.order_ids.tolist())}
+
+    lines = (
+        OrderItem.objects
+        .filter(order__created_at__gte=created_from, order__created_at__lt=created_to)
+        .values_list('order_id', 'item_id', 'item__name')
+        .distinct()
+    )
+    item_keys, item_orders, item_names = [], [], {}
+    for order_id, item_id, item_name in lines:
+        if order_id in position:
+            item_keys.append(item_id)
+            item_orders.append(position[order_id])
+            item_names[item_id] = item_name
+
+    suppliers_by_item = {}
+    supplier_names = {}
+    stock = Stock.objects.filter(item_id__in=item_names).values_list('item_id', 'supplier_id', 'supplier__username')
+    for item_id, supplier_id, username in stock.distinct():
+        suppliers_by_item.setdefault(item_id, set()).add(supplier_id)
+        supplier_names[supplier_id] = username
+    supplier_pairs = {
+        (supplier_id, order)
+        for item_id, order in zip(item_keys, item_orders)
+        for supplier_id in suppliers_by_item.get(item_id, ())
+    }
+
+    def summaries(groups, names, label, top=None):
+        result = [
+            {'id': key, label: names.get(key), **data.summarize(indices)}
+            for key, indices in groups.items()
+        ]
+        result.sort(key=lambda summary: (-summary['orders'], summary['id']))
+        return result[:top] if top else result
+
+    return {
+        'overall': data.summarize(),
+        'departments': summaries(
+            data.group_by(data.departments, np.arange(len(data.order_ids))), data.department_names, 'name'
+        ),
+        'suppliers': summaries(
+            data.group_by([key for key, _ in supplier_pairs], [order for _, order in supplier_pairs]),
+            supplier_names, 'username', limit
+        ),
+        'items': summaries(data.group_by(item_keys, item_orders), item_names, 'name', limit),
+    }
@@ -0,0 +1,525 @@
+"""
+Deterministic synthetic data at production scale
+
+``LoadDataGenerator`` produces users, items, stock, orders with their lines,
+status history and comments, and conversations with their messages, with
+the skew of real traffic:
+
+- item popularity, buyers and chat participants follow a Zipf distribution,
+  with the popular ranks scattered over the id range
+- order times follow a weekly cycle, business hours, steady growth and
+  random burst days (promotions, month-end restocking)
+- the status history of an order goes as far through the Pending ->
+  Completed flow as its age allows; a few orders are cancelled
+
+Every row is a tuple of strings computed from NumPy generators seeded with
+``(seed, stream, block)``, so the same seed, volumes and end date produce the
+same rows, whatever the database. Ids are assigned up front after the
+current maximum of each table, which lets child rows reference their parents
+without reading anything back.
+
+``load_rows`` writes a batch with ``COPY ... FROM STDIN`` on PostgreSQL and
+with chunked ``bulk_create`` elsewhere. Neither sends model signals: call
+``finish_load`` afterwards to move the id sequences past the loaded rows and
+invalidate the response cache.
+"""
+import datetime
+import io
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+
+from core.models import (
+    Comment, Conversation, Department, Item, Message, Order, OrderItem, OrderStatus, Role, Stock, User
+)
+from core.utils.message_partitions import add_months, create_partition, is_partitioned, month_start
+from core.utils.response_cache import VERSIONED_MODELS, bump_model_version
+
+# Rows generated per block; part of the random streams, so changing it changes the data
+BLOCK_SIZE = 20000
+
+# Share of generated users per role
+ROLE_SHARES = [
+    ('Department Manager', 0.80),
+    ('Supplier', 0.10),
+    ('Warehouse Manager', 0.08),
+    ('Administrator', 0.019),
+    ('SuperAdmin', 0.001),
+]
+DEPARTMENTS = ['Operations', 'Production', 'Maintenance', 'Research', 'IT', 'HR', 'Finance', 'Administration']
+
+ORDER_FLOW = ['Pending', 'Processing', 'Shipped', 'In Transit', 'Delivered', 'Completed']
+CANCELLED = 'Cancelled'
+CANCEL_RATE = 0.03
+
+HUBS = [
+    f'{kind} {city}'
+    for city in [
+        'Bangalore', 'Chennai', 'Mumbai', 'Delhi', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad', 'Jaipur', 'Kochi',
+    ]
+    for kind in ['Central Hub', 'Warehouse', 'Sorting Center', 'Port']
+]
+UNITS = ['piece', 'box', 'kg', 'litre', 'metre', 'pallet', 'roll', 'set']
+ADJECTIVES = [
+    'Steel', 'Copper', 'Plastic', 'Heavy', 'Compact', 'Industrial', 'Precision', 'Coated', 'Flexible', 'Sealed',
+]
+NOUNS = [
+    'Bolt', 'Valve', 'Bearing', 'Cable', 'Pipe', 'Bracket', 'Gasket', 'Filter', 'Panel', 'Pump', 'Sensor', 'Spring',
+]
+WORDS = (
+    'order delivery shipment stock pallet invoice supplier warehouse delay arrived today tomorrow please '
+    'confirm update quantity price urgent schedule dispatch received missing damaged replace check thanks '
+    'route driver customs label batch count review approve hold release'
+).split()
+
+# Relative order volume per hour of the day (UTC)
+HOUR_WEIGHTS = np.array([
+    1, 1, 1, 1, 1, 2, 4, 7, 10, 12, 12, 11, 9, 10, 11, 11, 10, 8, 6, 4, 3, 2, 2, 1
+], dtype=float)
+WEEKEND_FACTOR = 0.35
+BURST_RATE = 0.04
+
+# Random streams
+USERS, ITEMS, STOCK, ORDER_TIMES, ORDERS, CONVERSATIONS, SAMPLERS = range(7)
+
+
+def random_stream(seed, stream, block=0):
+    """Return the NumPy generator of one stream and block"""
+    return np.random.default_rng([seed, stream, block])
+
+
+def sample_weights(rng, weights, size):
+    """Draw ``size`` indexes with probability proportional to ``weights``"""
+    cdf = np.cumsum(weights, dtype=float)
+    cdf /= cdf[-1]
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+class ZipfSampler:
+    """Zipf-distributed draws from ``count`` values, the popular ones at random positions"""
+
+    def __init__(self, rng, count, exponent):
+        weights = np.arange(1, count + 1, dtype=float) ** -exponent
+        self.cdf = np.cumsum(weights)
+        self.cdf /= self.cdf[-1]
+        self.positions = rng.permutation(count)
+
+    def sample(self, rng, size):
+        ranks = np.minimum(np.searchsorted(self.cdf, rng.random(size), side='right'), len(self.cdf) - 1)
+        return self.positions[ranks]
+
+
+def bursty_timestamps(rng, count, start, end):
+    """
+    Return ``count`` sorted epoch seconds between ``start`` and ``end``
+
+    Days are weighted by weekday, a linear growth trend, day-to-day noise and
+    random bursts; hours by ``HOUR_WEIGHTS``.
+    """
+    days = max(1, (end - start) // 86400)
+    # 1970-01-01 was a Thursday: weekday 3 with Monday as 0
+    weekdays = (start // 86400 + 3 + np.arange(days)) % 7
+    weights = np.where(weekdays >= 5, WEEKEND_FACTOR, 1.0)
+    weights *= np.linspace(0.6, 1.4, days)
+    weights *= rng.lognormal(0.0, 0.25, days)
+    bursts = rng.random(days) < BURST_RATE
+    weights[bursts] *= rng.uniform(3, 8, int(bursts.sum()))
+
+    day = sample_weights(rng, weights, count)
+    hour = sample_weights(rng, HOUR_WEIGHTS, count)
+    seconds = start + day * 86400 + hour * 3600 + rng.integers(0, 3600, count)
+    return np.sort(np.minimum(seconds, end - 1))
+
+
+def timestamp_strings(seconds):
+    """Format epoch seconds as ISO 8601 UTC timestamps"""
+    values = np.asarray(seconds, dtype='int64').astype('datetime64[s]')
+    return np.datetime_as_string(values, timezone='UTC').tolist()
+
+
+def date_strings(seconds):
+    """Format epoch seconds as ISO 8601 dates (UTC)"""
+    values = np.asarray(seconds, dtype='int64').astype('datetime64[s]').astype('datetime64[D]')
+    return np.datetime_as_string(values).tolist()
+
+
+def money_strings(cents):
+    return [f'{value // 100}.{value % 100:02d}' for value in np.asarray(cents).tolist()]
+
+
+def int_strings(values):
+    return [str(value) for value in np.asarray(values).tolist()]
+
+
+def next_id(model):
+    """First free id of a table, past both the stored rows and the id sequence"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT GREATEST(nextval(pg_get_serial_sequence(%s, 'id')), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1)",
+                [model._meta.db_table]
+            )
+        else:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def load_rows(model, columns, rows, batch_size=5000):
+    """
+    Insert rows of string values (COPY text format, no NULLs)
+
+    Returns:
+        Number of rows written
+    """
+    if not rows:
+        return 0
+    if connection.vendor == 'postgresql':
+        buffer = io.StringIO('\n'.join(map('\t'.join, rows)) + '\n')
+        quoted = ', '.join(connection.ops.quote_name(column) for column in columns)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} ({quoted}) FROM STDIN", buffer
+            )
+    else:
+        model.objects.bulk_create(
+            [model(**dict(zip(columns, row))) for row in rows], batch_size=batch_size
+        )
+    return len(rows)
+
+
+def finish_load(models):
+    """Reset the id sequences of the loaded tables, refresh planner statistics and invalidate cached responses"""
+    with connection.cursor() as cursor:
+        for statement in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(statement)
+        if connection.vendor == 'postgresql':
+            tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)
+            cursor.execute(f"ANALYZE {tables}")
+    bump_model_version(*VERSIONED_MODELS)
+
+
+def ensure_message_partitions(start, end):
+    """Create the monthly message partitions covering ``start``..``end`` (epoch seconds)"""
+    if not is_partitioned():
+        return
+    month = month_start(datetime.datetime.fromtimestamp(start, datetime.timezone.utc))
+    last = month_start(datetime.datetime.fromtimestamp(end, datetime.timezone.utc))
+    while month <= last:
+        create_partition(month)
+        month = add_months(month, 1)
+
+
+class LoadDataGenerator:
+    """
+    Generate load test rows in blocks
+
+    Every generator method yields lists of ``(model, columns, rows)`` batches
+    that must be loaded in the given order, as later batches reference the
+    ids of earlier ones.
+
+    Args:
+        seed: Seed of every random stream
+        start: Epoch seconds of the first order
+        end: Epoch seconds after the last order and message
+        users, items, orders, conversations: Number of rows to generate
+        lines_per_order, comments_per_order, messages_per_conversation: Means
+            of the child row counts
+        status_hours: Mean hours an order spends in each status; the status
+            history of an order is as long as its age allows
+        prefix: Username prefix, unique per generated data set
+        password: Password of every generated user
+    """
+    USER_COLUMNS = (
+        'id', 'username', 'email', 'password', 'password_hash', 'role_id', 'department_id',
+        'created_at', 'updated_at', 'is_active', 'is_staff', 'is_superuser',
+    )
+    ITEM_COLUMNS = ('id', 'name', 'description', 'measurement_unit', 'price', 'created_at')
+    STOCK_COLUMNS = ('id', 'item_id', 'current_stock', 'minimum_threshold', 'supplier_id', 'updated_at')
+    ORDER_COLUMNS = (
+        'id', 'user_id', 'status', 'created_at', 'updated_at', 'total_amount', 'current_location',
+        'expected_delivery_date',
+    )
+    ORDER_ITEM_COLUMNS = ('id', 'order_id', 'item_id', 'quantity', 'price_at_order_time')
+    ORDER_STATUS_COLUMNS = (
+        'id', 'order_id', 'status', 'current_location', 'location_timestamp', 'updated_by_id', 'remarks',
+        'expected_delivery_date',
+    )
+    COMMENT_COLUMNS = ('id', 'order_id', 'user_id', 'comment_text', 'created_at')
+    CONVERSATION_COLUMNS = ('id', 'started_at', 'updated_at')
+    PARTICIPANT_COLUMNS = ('conversation_id', 'user_id')
+    MESSAGE_COLUMNS = ('id', 'conversation_id', 'sender_id', 'content', 'timestamp', 'is_read')
+
+    def __init__(self, seed, start, end, users, items, orders, conversations, lines_per_order=3,
+                 comments_per_order=0.5, messages_per_conversation=20, status_hours=36,
+                 prefix='load-', password='loadtest'):
+        self.seed = seed
+        self.start = start
+        self.end = end
+        self.counts = {'users': max(users, 1), 'items': max(items, 1), 'orders': orders, 'conversations': conversations}
+        self.lines_per_order = max(lines_per_order, 1)
+        self.comments_per_order = comments_per_order
+        self.messages_per_conversation = max(messages_per_conversation, 1)
+        self.status_hours = max(status_hours, 0.1)
+        self.prefix = prefix
+        self.password = password
+
+        self.roles = {name: Role.objects.get_or_create(name=name)[0].id for name, _ in ROLE_SHARES}
+        self.departments = [Department.objects.get_or_create(name=name)[0].id for name in DEPARTMENTS]
+        self.first_ids = {
+            model: next_id(model)
+            for model in (User, Item, Stock, Order, OrderItem, OrderStatus, Comment, Conversation, Message)
+        }
+
+        rng = random_stream(seed, USERS)
+        shares = np.array([share for _, share in ROLE_SHARES])
+        self.user_roles = sample_weights(rng, shares, self.counts['users'])
+        role_index = {name: index for index, (name, _) in enumerate(ROLE_SHARES)}
+        user_positions = np.arange(self.counts['users'])
+        self.buyers = user_positions[self.user_roles == role_index['Department Manager']]
+        self.suppliers = user_positions[self.user_roles == role_index['Supplier']]
+        self.staff = user_positions[
+            np.isin(self.user_roles, [role_index['Warehouse Manager'], role_index['Administrator']])
+        ]
+        # Small volumes may miss a role entirely
+        self.buyers = self.buyers if len(self.buyers) else user_positions
+        self.suppliers = self.suppliers if len(self.suppliers) else user_positions
+        self.staff = self.staff if len(self.staff) else user_positions
+
+        rng = random_stream(seed, ITEMS)
+        self.item_cents = np.clip(
+            np.round(rng.lognormal(np.log(2500), 1.0, self.counts['items'])), 50, 99999999
+        ).astype(np.int64)
+
+        rng = random_stream(seed, SAMPLERS)
+        self.item_popularity = ZipfSampler(rng, self.counts['items'], 1.1)
+        self.buyer_activity = ZipfSampler(rng, len(self.buyers), 0.9)
+        self.supplier_share = ZipfSampler(rng, len(self.suppliers), 1.2)
+        self.chatter_activity = ZipfSampler(rng, self.counts['users'], 0.8)
+        self.sentences = [
+            ' '.join(rng.choice(WORDS, size=int(length)).tolist()).capitalize()
+            for length in rng.integers(3, 16, 1000)
+        ]
+
+    def user_id(self, positions):
+        return np.asarray(positions) + self.first_ids[User]
+
+    def _blocks(self, total):
+        for block, first in enumerate(range(0, total, BLOCK_SIZE)):
+            yield block, first, min(BLOCK_SIZE, total - first)
+
+    def users(self):
+        role_ids = [self.roles[name] for name, _ in ROLE_SHARES]
+        # A fixed salt keeps the rows reproducible; these accounts are for load tests only
+        password = make_password(self.password, salt=f'loadtest{self.seed}')
+        for block, first, size in self._blocks(self.counts['users']):
+            rng = random_stream(self.seed, USERS, block + 1)
+            positions = np.arange(first, first + size)
+            created = timestamp_strings(rng.integers(self.start - 365 * 86400, self.start, size))
+            departments = rng.integers(0, len(self.departments), size).tolist()
+            rows = []
+            for position, role, department, created_at in zip(
+                positions.tolist(), self.user_roles[first:first + size].tolist(), departments, created
+            ):
+                username = f'{self.prefix}{position}'
+                rows.append((
+                    str(self.first_ids[User] + position), username, f'{username}@loadtest.example.com',
+                    password, password, str(role_ids[role]), str(self.departments[department]),
+                    created_at, created_at, 't', 'f', 'f',
+                ))
+            yield [(User, self.USER_COLUMNS, rows)]
+
+    def items(self):
+        for block, first, size in self._blocks(self.counts['items']):
+            rng = random_stream(self.seed, ITEMS, block + 1)
+            adjectives = rng.integers(0, len(ADJECTIVES), size).tolist()
+            nouns = rng.integers(0, len(NOUNS), size).tolist()
+            units = rng.integers(0, len(UNITS), size).tolist()
+            descriptions = rng.integers(0, len(self.sentences), size).tolist()
+            created = timestamp_strings(rng.integers(self.start - 365 * 86400, self.start, size))
+            prices = money_strings(self.item_cents[first:first + size])
+            rows = [
+                (
+                    str(self.first_ids[Item] + position), f'{ADJECTIVES[adjective]} {NOUNS[noun]} {position}',
+                    self.sentences[description], UNITS[unit], price, created_at,
+                )
+                for position, adjective, noun, unit, description, price, created_at in zip(
+                    range(first, first + size), adjectives, nouns, units, descriptions, prices, created
+                )
+            ]
+            yield [(Item, self.ITEM_COLUMNS, rows)]
+
+    def stock(self):
+        """One stock row per item, supplied mostly by a few large suppliers"""
+        for block, first, size in self._blocks(self.counts['items']):
+            rng = random_stream(self.seed, STOCK, block + 1)
+            suppliers = self.user_id(self.suppliers[self.supplier_share.sample(rng, size)])
+            thresholds = rng.integers(10, 100, size)
+            # About one item in twenty is below its threshold
+            levels = np.where(rng.random(size) < 0.05, rng.integers(0, 10, size), rng.integers(10, 2000, size))
+            updated = timestamp_strings(rng.integers(self.end - 30 * 86400, self.end, size))
+            rows = list(zip(
+                int_strings(np.arange(first, first + size) + self.first_ids[Stock]),
+                int_strings(np.arange(first, first + size) + self.first_ids[Item]),
+                int_strings(levels), int_strings(thresholds), int_strings(suppliers), updated,
+            ))
+            yield [(Stock, self.STOCK_COLUMNS, rows)]
+
+    def orders(self):
+        """Orders with their lines, status history and comments, in creation order"""
+        count = self.counts['orders']
+        created = bursty_timestamps(random_stream(self.seed, ORDER_TIMES), count, self.start, self.end)
+        line_id = self.first_ids[OrderItem]
+        status_id = self.first_ids[OrderStatus]
+        comment_id = self.first_ids[Comment]
+        flow_seconds = self.status_hours * 3600
+
+        for block, first, size in self._blocks(count):
+            rng = random_stream(self.seed, ORDERS, block)
+            order_ids = np.arange(first, first + size) + self.first_ids[Order]
+            order_created = created[first:first + size]
+            buyers = self.user_id(self.buyers[self.buyer_activity.sample(rng, size)])
+
+            # Lines: geometric count per order, Zipf item popularity
+            line_counts = np.minimum(rng.geometric(1 / self.lines_per_order, size), 25)
+            line_total = int(line_counts.sum())
+            line_orders = np.repeat(order_ids, line_counts)
+            line_items = self.item_popularity.sample(rng, line_total)
+            quantities = np.minimum(rng.geometric(0.3, line_total), 100)
+            line_cents = self.item_cents[line_items]
+            offsets = np.concatenate(([0], np.cumsum(line_counts)[:-1]))
+            totals = np.add.reduceat(quantities * line_cents, offsets)
+
+            # Statuses: as far through the flow as the order age allows
+            age = self.end - order_created
+            stages = np.minimum(
+                (age / flow_seconds * rng.uniform(0.5, 1.5, size)).astype(np.int64), len(ORDER_FLOW) - 1
+            )
+            cancelled = rng.random(size) < CANCEL_RATE
+            status_counts = np.where(cancelled, 2, stages + 1)
+            status_total = int(status_counts.sum())
+            gaps = rng.exponential(flow_seconds * 0.5, status_total).astype(np.int64)
+            status_offsets = np.concatenate(([0], np.cumsum(status_counts)[:-1]))
+            # Status times: the order time plus the gaps so far, the first one at the order time
+            gaps[status_offsets] = 0
+            elapsed = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[status_offsets], status_counts)
+            status_times = np.minimum(np.repeat(order_created, status_counts) + elapsed, self.end - 1)
+            hubs = rng.integers(0, len(HUBS), status_total)
+            updaters = self.user_id(self.staff[rng.integers(0, len(self.staff), status_total)])
+            expected = date_strings(order_created + rng.integers(3, 15, size) * 86400)
+            last_status = status_offsets + status_counts - 1
+
+            # Comments: Poisson count per order, by the buyer or the staff
+            comment_counts = rng.poisson(self.comments_per_order, size)
+            comment_total = int(comment_counts.sum())
+            comment_orders = np.repeat(np.arange(size), comment_counts)
+            comment_users = np.where(
+                rng.random(comment_total) < 0.7, buyers[comment_orders],
+                self.user_id(self.staff[rng.integers(0, len(self.staff), comment_total)]),
+            )
+            comment_times = np.minimum(
+                order_created[comment_orders] + rng.exponential(86400, comment_total).astype(np.int64), self.end - 1
+            )
+            comment_texts = rng.integers(0, len(self.sentences), comment_total).tolist()
+
+            status_names = []
+            for stage, is_cancelled in zip(stages.tolist(), cancelled.tolist()):
+                status_names.extend(['Pending', CANCELLED] if is_cancelled else ORDER_FLOW[:stage + 1])
+            hub_names = [HUBS[hub] for hub in hubs.tolist()]
+            status_time_strings = timestamp_strings(status_times)
+            expected_by_status = np.repeat(np.array(expected), status_counts).tolist()
+            last_status_list = last_status.tolist()
+
+            order_rows = list(zip(
+                int_strings(order_ids), int_strings(buyers), [status_names[index] for index in last_status_list],
+                timestamp_strings(order_created), [status_time_strings[index] for index in last_status_list],
+                money_strings(totals), [hub_names[index] for index in last_status_list], expected,
+            ))
+            line_rows = list(zip(
+                int_strings(np.arange(line_id, line_id + line_total)), int_strings(line_orders),
+                int_strings(line_items + self.first_ids[Item]), int_strings(quantities), money_strings(line_cents),
+            ))
+            status_rows = list(zip(
+                int_strings(np.arange(status_id, status_id + status_total)),
+                int_strings(np.repeat(order_ids, status_counts)), status_names, hub_names, status_time_strings,
+                int_strings(updaters), [''] * status_total, expected_by_status,
+            ))
+            comment_rows = list(zip(
+                int_strings(np.arange(comment_id, comment_id + comment_total)),
+                int_strings(order_ids[comment_orders]), int_strings(comment_users),
+                [self.sentences[text] for text in comment_texts], timestamp_strings(comment_times),
+            ))
+            line_id += line_total
+            status_id += status_total
+            comment_id += comment_total
+            yield [
+                (Order, self.ORDER_COLUMNS, order_rows),
+                (OrderItem, self.ORDER_ITEM_COLUMNS, line_rows),
+                (OrderStatus, self.ORDER_STATUS_COLUMNS, status_rows),
+                (Comment, self.COMMENT_COLUMNS, comment_rows),
+            ]
+
+    def conversations(self):
+        """Conversations between two or three users, with their messages"""
+        message_id = self.first_ids[Message]
+        participants_model = Conversation.participants.through
+        user_count = self.counts['users']
+
+        for block, first, size in self._blocks(self.counts['conversations']):
+            rng = random_stream(self.seed, CONVERSATIONS, block)
+            conversation_ids = np.arange(first, first + size) + self.first_ids[Conversation]
+            started = np.sort(bursty_timestamps(rng, size, self.start, self.end))
+
+            # Distinct participants: the others are offset from the first by different amounts
+            first_users = self.chatter_activity.sample(rng, size)
+            member_counts = np.minimum(np.where(rng.random(size) < 0.1, 3, 2), user_count)
+            span = max(user_count - 1, 1)
+            second_offsets = rng.integers(0, span, size)
+            third_offsets = rng.integers(0, span, size)
+            third_offsets = np.where(third_offsets == second_offsets, (third_offsets + 1) % span, third_offsets)
+            members = [
+                first_users,
+                (first_users + 1 + second_offsets) % user_count,
+                (first_users + 1 + third_offsets) % user_count,
+            ]
+
+            message_counts = np.minimum(rng.geometric(1 / self.messages_per_conversation, size), 5000)
+            message_total = int(message_counts.sum())
+            message_conversations = np.repeat(np.arange(size), message_counts)
+            offsets = np.concatenate(([0], np.cumsum(message_counts)[:-1]))
+            gaps = rng.exponential(1800, message_total).astype(np.int64)
+            gaps[offsets] = 0
+            elapsed = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[offsets], message_counts)
+            message_times = np.minimum(started[message_conversations] + elapsed, self.end - 1)
+            senders = rng.integers(0, member_counts[message_conversations])
+            sender_users = np.choose(senders, [member[message_conversations] for member in members])
+            # The last few messages of a conversation are unread
+            unread = np.repeat(rng.integers(0, 4, size), message_counts)
+            position_from_end = np.repeat(offsets + message_counts, message_counts) - np.arange(message_total) - 1
+            is_read = np.where(position_from_end < unread, 'f', 't').tolist()
+            contents = rng.integers(0, len(self.sentences), message_total).tolist()
+            last_message = offsets + message_counts - 1
+
+            conversation_rows = list(zip(
+                int_strings(conversation_ids), timestamp_strings(started),
+                timestamp_strings(message_times[last_message]),
+            ))
+            participant_rows = [
+                (str(conversation_id), str(int(self.user_id(members[member][index]))))
+                for index, (conversation_id, count) in enumerate(zip(conversation_ids.tolist(), member_counts.tolist()))
+                for member in range(count)
+            ]
+            message_rows = list(zip(
+                int_strings(np.arange(message_id, message_id + message_total)),
+                int_strings(conversation_ids[message_conversations]), int_strings(self.user_id(sender_users)),
+                [self.sentences[content] for content in contents], timestamp_strings(message_times), is_read,
+            ))
+            message_id += message_total
+            yield [
+                (Conversation, self.CONVERSATION_COLUMNS, conversation_rows),
+                (participants_model, self.PARTICIPANT_COLUMNS, participant_rows),
+                (Message, self.MESSAGE_COLUMNS, message_rows),
+            ]
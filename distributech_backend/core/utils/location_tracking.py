@@ -0,0 +1,177 @@
+"""
+Shipment location ping ingestion
+
+GPS units and scanners report a position every few seconds per shipment.
+Those pings are kept out of ``OrderStatus`` (which is reserved for real
+status changes and drives notifications):
+
+- ``OrderLocation`` holds the latest position of each order and is upserted
+  once per order per batch, so reads are a primary key lookup
+- ``LocationPing`` keeps the history, downsampled on ingest to at most one
+  ping per order every ``LOCATION_PING_SAMPLE_SECONDS``
+
+A batch of any size costs one query to check the orders, one locking read of
+their current positions, a bulk insert for the history, and one bulk update
+and one bulk insert for the positions.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import LocationPing, Order, OrderLocation
+
+# Rows per INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+# Pings stamped further ahead than this are rejected as clock errors
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+
+LOCATION_FIELDS = ['latitude_e7', 'longitude_e7', 'recorded_at', 'sampled_at', 'ping_count', 'updated_at']
+
+
+def get_sample_interval():
+    """Return the minimum time between two history pings of one order"""
+    return datetime.timedelta(seconds=getattr(settings, 'LOCATION_PING_SAMPLE_SECONDS', 60))
+
+
+def to_e7(degrees):
+    """Convert degrees to the integer 1e-7 degree units the ping tables store"""
+    return int(round(degrees * 1e7))
+
+
+def ingest_pings(pings):
+    """
+    Record a batch of location pings
+
+    Pings may arrive in any order. The newest ping of each order becomes its
+    current position; older pings only update the history, and only when
+    they are at least the sample interval after the last stored history ping.
+
+    Args:
+        pings: List of dicts with order_id, latitude_e7, longitude_e7 and
+            recorded_at (aware datetime)
+
+    Returns:
+        Tuple of (stats dict with accepted, stored and orders counts, list of
+        error dicts with index, order_id and message)
+    """
+    errors = []
+    latest_allowed = timezone.now() + MAX_CLOCK_SKEW
+    order_ids = {ping['order_id'] for ping in pings}
+    known = set(Order.objects.filter(id__in=order_ids).values_list('id', flat=True))
+
+    by_order = {}
+    for index, ping in enumerate(pings):
+        if ping['order_id'] not in known:
+            errors.append({'index': index, 'order_id': ping['order_id'], 'message': 'Order not found'})
+        elif ping['recorded_at'] > latest_allowed:
+            errors.append({'index': index, 'order_id': ping['order_id'], 'message': 'recorded_at is in the future'})
+        else:
+            by_order.setdefault(ping['order_id'], []).append(ping)
+
+    interval = get_sample_interval()
+    now = timezone.now()
+    history = []
+    locations = []
+
+    with transaction.atomic():
+        # Lock in id order so concurrent batches cannot deadlock each other
+        current = {
+            location.order_id: location
+            for location in OrderLocation.objects.select_for_update()
+            .filter(order_id__in=by_order)
+            .order_by('order_id')
+        }
+
+        for order_id in sorted(by_order):
+            order_pings = sorted(by_order[order_id], key=lambda ping: ping['recorded_at'])
+            location = current.get(order_id) or OrderLocation(order_id=order_id, ping_count=0)
+            sampled_at = location.sampled_at
+
+            for ping in order_pings:
+                if sampled_at is None or ping['recorded_at'] >= sampled_at + interval:
+                    history.append(LocationPing(
+                        order_id=order_id,
+                        latitude_e7=ping['latitude_e7'],
+                        longitude_e7=ping['longitude_e7'],
+                        recorded_at=ping['recorded_at'],
+                    ))
+                    sampled_at = ping['recorded_at']
+
+            newest = order_pings[-1]
+            if location.recorded_at is None or newest['recorded_at'] >= location.recorded_at:
+                location.latitude_e7 = newest['latitude_e7']
+                location.longitude_e7 = newest['longitude_e7']
+                location.recorded_at = newest['recorded_at']
+            location.sampled_at = sampled_at
+            location.ping_count += len(order_pings)
+            location.updated_at = now
+            locations.append(location)
+
+        LocationPing.objects.bulk_create(history, batch_size=INSERT_BATCH_SIZE)
+        OrderLocation.objects.bulk_update(
+            [location for location in locations if location.order_id in current],
+            LOCATION_FIELDS,
+            batch_size=INSERT_BATCH_SIZE,
+        )
+        _insert_locations([location for location in locations if location.order_id not in current])
+
+    stats = {
+        'accepted': sum(len(order_pings) for order_pings in by_order.values()),
+        'stored': len(history),
+        'orders': len(locations),
+    }
+    return stats, errors
+
+
+def _insert_locations(locations):
+    """
+    Insert the first position of orders that had none when the batch started
+
+    Existing rows are locked and updated by the caller, so a conflict here
+    means a concurrent batch created the same order's first position since:
+    both batches' pings are counted and the newer position is kept.
+    """
+    if not locations:
+        return
+    opts = OrderLocation._meta
+    table = connection.ops.quote_name(opts.db_table)
+    fields = [opts.get_field('order')] + [opts.get_field(name) for name in LOCATION_FIELDS]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+
+    def column(name):
+        return connection.ops.quote_name(opts.get_field(name).column)
+
+    def newer(name, than='recorded_at'):
+        # Take the incoming value when its ping is at least as recent as the stored one
+        return (
+            f"{column(name)} = CASE WHEN {table}.{column(than)} IS NULL "
+            f"OR EXCLUDED.{column(than)} >= {table}.{column(than)} "
+            f"THEN EXCLUDED.{column(name)} ELSE {table}.{column(name)} END"
+        )
+
+    updates = ', '.join([
+        newer('latitude_e7'),
+        newer('longitude_e7'),
+        newer('recorded_at'),
+        newer('sampled_at', than='sampled_at'),
+        f"{column('ping_count')} = {table}.{column('ping_count')} + EXCLUDED.{column('ping_count')}",
+        f"{column('updated_at')} = EXCLUDED.{column('updated_at')}",
+    ])
+    row = f"({', '.join(['%s'] * len(fields))})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(locations), INSERT_BATCH_SIZE):
+            chunk = locations[start:start + INSERT_BATCH_SIZE]
+            params = [
+                field.get_db_prep_save(getattr(location, field.attname), connection)
+                for location in chunk
+                for field in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row] * len(chunk))} "
+                f"ON CONFLICT ({column('order')}) DO UPDATE SET {updates}",
+                params
+            )
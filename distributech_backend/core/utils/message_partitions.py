@@ -0,0 +1,334 @@
+"""
+Monthly partition management and cold archiving for chat messages
+
+``core_message`` is range-partitioned on ``timestamp`` with one partition per
+calendar month (``core_message_pYYYYMM``) plus a default partition that
+catches anything outside the pre-created range. Old months can be archived:
+their rows, from the month's partition and from the default partition, are
+written to gzip-compressed JSONL files (one file per conversation and month),
+then the partition is dropped and the rows are deleted from the default one. Archived history is
+read back lazily by ``load_archived_messages``.
+"""
+import datetime
+import gzip
+import json
+import os
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+MESSAGE_TABLE = 'core_message'
+PARTITION_PREFIX = 'core_message_p'
+DEFAULT_PARTITION = 'core_message_default'
+
+_PARTITION_RE = re.compile(r'^core_message_p(\d{4})(\d{2})$')
+
+
+def get_archive_root():
+    """Directory the archived JSONL files are written to"""
+    return getattr(
+        settings, 'MESSAGE_ARCHIVE_ROOT',
+        os.path.join(settings.BASE_DIR, 'archive', 'messages')
+    )
+
+
+def month_start(value):
+    """Return the first day of the month containing ``value`` as a date"""
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """Shift a first-of-month date by ``count`` months"""
+    index = month.year * 12 + (month.month - 1) + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def _bound(month):
+    # Partition bounds are always expressed in UTC
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def is_partitioned():
+    """Check whether the message table is a partitioned table (Postgres only)"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [MESSAGE_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    Return the monthly partitions currently attached to the message table
+
+    Returns:
+        Sorted list of first-of-month dates
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s",
+            [MESSAGE_TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month):
+    """
+    Create the partition for ``month`` if it does not exist yet
+
+    Returns:
+        True if a partition was created
+    """
+    if month in list_partitions():
+        return False
+    name = partition_name(month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {MESSAGE_TABLE} '
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(add_months(month, 1))}')"
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """
+    Make sure partitions exist for the current month and the next ``months_ahead``
+
+    Returns:
+        List of months for which a partition was created
+    """
+    current = month_start(now or timezone.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(month)
+    return created
+
+
+def archive_path(month, conversation_id):
+    return os.path.join(
+        get_archive_root(),
+        f"{month.year:04d}-{month.month:02d}",
+        f"conversation_{conversation_id}.jsonl.gz"
+    )
+
+
+def _month_range(month):
+    """Return the UTC datetimes bounding ``month``, end exclusive"""
+    def at(day):
+        return datetime.datetime(day.year, day.month, 1, tzinfo=datetime.timezone.utc)
+    return at(month), at(add_months(month, 1))
+
+
+def read_archive(path):
+    """Read the messages of an archive file, in chronological order"""
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        rows = [json.loads(line) for line in handle]
+    for row in rows:
+        row['timestamp'] = parse_datetime(row['timestamp'])
+    return rows
+
+
+def archive_partition(month, batch_size=5000):
+    """
+    Write every message of a month to compressed JSONL files and remove them
+    from the live table
+
+    The month's rows are read from its partition, when it still exists, and
+    from the default partition, which catches messages written outside the
+    pre-created range (including months whose partition was already
+    archived). When a conversation already has an archive file for the
+    month, its rows are merged into the new file.
+
+    Files are written before the live rows are removed, so a failure halfway
+    leaves the live data untouched and the month can simply be archived again.
+
+    Returns:
+        Number of messages archived
+    """
+    from core.models import MessageArchive
+
+    name = partition_name(month)
+    has_partition = month in list_partitions()
+    start, end = _month_range(month)
+    previous = {
+        archive.conversation_id: archive.path
+        for archive in MessageArchive.objects.filter(month=month)
+    }
+    archives = []
+    current = None
+    handle = None
+    total = 0
+
+    def write(row):
+        handle.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n')
+        current['count'] += 1
+        current['first'] = min(current['first'], row['timestamp'])
+        current['last'] = row['timestamp']
+
+    def flush_previous(until=None):
+        # Write the already archived rows that sort before ``until``
+        pending = current['pending']
+        while pending and (until is None or (pending[0]['timestamp'], pending[0]['id']) < until):
+            write(pending.pop(0))
+        if pending and until is not None and (pending[0]['timestamp'], pending[0]['id']) == until:
+            # Archived by an earlier run that failed before deleting the live row
+            pending.pop(0)
+
+    def close_current():
+        if handle is not None:
+            flush_previous()
+            handle.close()
+            os.replace(current['path'] + '.tmp', current['path'])
+            archives.append(MessageArchive(
+                conversation_id=current['conversation_id'],
+                month=month,
+                path=current['path'],
+                message_count=current['count'],
+                first_timestamp=current['first'],
+                last_timestamp=current['last'],
+            ))
+
+    columns = 'id, conversation_id, sender_id, content, "timestamp", is_read'
+    sources = [f'SELECT {columns} FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s']
+    if has_partition:
+        sources.insert(0, f'SELECT {columns} FROM "{name}"')
+
+    # Stream the rows with a named (server-side) cursor so memory stays flat
+    with transaction.atomic():
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(
+                ' UNION ALL '.join(sources) + ' ORDER BY conversation_id, "timestamp", id',
+                [start, end]
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for pk, conversation_id, sender_id, content, timestamp, is_read in rows:
+                    if current is None or current['conversation_id'] != conversation_id:
+                        close_current()
+                        path = archive_path(month, conversation_id)
+                        pending = read_archive(previous[conversation_id]) if conversation_id in previous else []
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        # Written aside so the previous file survives a failure halfway
+                        handle = gzip.open(path + '.tmp', 'wt', encoding='utf-8')
+                        current = {
+                            'conversation_id': conversation_id,
+                            'path': path,
+                            'pending': pending,
+                            'count': 0,
+                            'first': timestamp,
+                            'last': timestamp,
+                        }
+                    flush_previous((timestamp, pk))
+                    write({
+                        'id': pk,
+                        'conversation': conversation_id,
+                        'sender_id': sender_id,
+                        'content': content,
+                        'timestamp': timestamp,
+                        'is_read': is_read,
+                    })
+                    total += 1
+    close_current()
+
+    with transaction.atomic():
+        MessageArchive.objects.filter(
+            month=month, conversation_id__in=[archive.conversation_id for archive in archives]
+        ).delete()
+        MessageArchive.objects.bulk_create(archives, batch_size=1000)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s', [start, end]
+            )
+            if has_partition:
+                cursor.execute(f'ALTER TABLE {MESSAGE_TABLE} DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+    return total
+
+
+def default_partition_months(before):
+    """Return the months that have messages in the default partition, older than ``before``"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC')::date "
+            f'FROM "{DEFAULT_PARTITION}" WHERE "timestamp" < %s',
+            [_month_range(before)[0]]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def archivable_partitions(older_than_months, now=None):
+    """
+    Return the months that ended more than N months ago and still have live messages
+
+    Returns:
+        Sorted list of first-of-month dates: months with a partition, and
+        months with messages in the default partition
+    """
+    cutoff = add_months(month_start(now or timezone.now()), -older_than_months)
+    months = {month for month in list_partitions() if month < cutoff}
+    months.update(default_partition_months(cutoff))
+    return sorted(months)
+
+
+def load_archived_messages(conversation_id, before, limit):
+    """
+    Read archived messages of a conversation older than ``before``
+
+    Archives are read newest month first and only until ``limit`` messages
+    have been collected, so paging back one screen opens at most a couple of
+    files.
+
+    Args:
+        conversation_id: Conversation to load messages for
+        before: Only messages with a timestamp strictly before this are returned
+        limit: Maximum number of messages to return
+
+    Returns:
+        Tuple of (messages in chronological order, whether older archived
+        messages remain)
+    """
+    from core.models import MessageArchive
+
+    archives = MessageArchive.objects.filter(
+        conversation_id=conversation_id,
+        first_timestamp__lt=before
+    ).order_by('-month')
+
+    collected = []
+    has_more = False
+    for archive in archives:
+        if len(collected) >= limit:
+            has_more = True
+            break
+        rows = [row for row in read_archive(archive.path) if row['timestamp'] < before]
+        needed = limit - len(collected)
+        if len(rows) > needed:
+            has_more = True
+        # Files are chronological: keep the newest rows of this month
+        collected = rows[-needed:] + collected
+    return collected, has_more
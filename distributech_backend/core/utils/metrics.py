@@ -0,0 +1,241 @@
+"""
+Process-local metrics in the Prometheus text format
+
+Counters and histograms are updated without locks: every thread writes to
+its own shard (a plain dict), and shards are only merged when the metrics
+are read. The lock is taken once per thread, to register its shard.
+
+With several worker processes (gunicorn workers, the email worker), set
+``METRICS_DIR`` to a directory shared by them. Every process then writes a
+snapshot of its metrics to ``<METRICS_DIR>/metrics_<pid>.json`` at most
+every ``METRICS_FLUSH_SECONDS`` (default 5) and when it exits, and the
+``/metrics`` endpoint adds up the snapshots of all processes. Snapshots of
+processes that exited are kept so the totals never go backwards; clear the
+directory on deploy.
+
+Gauges (queue depth, low stock) are read from the database at scrape time.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = {}
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+_last_flush = 0.0
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels):
+        return (self.name, tuple(str(labels[label]) for label in self.labelnames))
+
+
+class Counter(Metric):
+    """Monotonic counter"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = _shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+        maybe_flush()
+
+
+class Histogram(Metric):
+    """Histogram with cumulative buckets, a sum and a count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = _shard()
+        key = self._key(labels)
+        values = shard.get(key)
+        if values is None:
+            # One slot per bucket, then +Inf, then the sum
+            values = shard[key] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                values[index] += 1
+                break
+        else:
+            values[len(self.buckets)] += 1
+        values[-1] += value
+        maybe_flush()
+
+
+def snapshot():
+    """Merge the shards of this process into {metric name: {labels: value}}"""
+    merged = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for (name, labels), value in list(shard.items()):
+            _merge(merged.setdefault(name, {}), labels, value)
+    return merged
+
+
+def _merge(series, labels, value):
+    if isinstance(value, list):
+        current = series.get(labels)
+        series[labels] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+    else:
+        series[labels] = series.get(labels, 0) + value
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR, if configured"""
+    global _last_flush
+    directory = get_metrics_dir()
+    _last_flush = time.monotonic()
+    if not directory:
+        return
+    data = {
+        name: [[list(labels), value] for labels, value in series.items()]
+        for name, series in snapshot().items()
+    }
+    path = _snapshot_path(directory, os.getpid())
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(temporary, path)
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def collect():
+    """Return the metrics of this process plus the snapshots of the other processes"""
+    merged = snapshot()
+    directory = get_metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return merged
+    own = os.path.basename(_snapshot_path(directory, os.getpid()))
+    for filename in os.listdir(directory):
+        if filename == own or not filename.startswith('metrics_') or not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        for name, series in data.items():
+            for labels, value in series:
+                _merge(merged.setdefault(name, {}), tuple(labels), value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(gauges=()):
+    """
+    Render every registered metric in the Prometheus text format
+
+    Args:
+        gauges: Iterable of (name, help, [(labels dict, value), ...]) computed at scrape time
+    """
+    merged = collect()
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_labels(metric.labelnames, labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value):
+                cumulative += count
+                le = '+Inf' if math.isinf(bound) else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {_number(float(value[-1]))}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {cumulative}')
+    for name, documentation, samples in gauges:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            lines.append(f'{name}{_labels(list(labels), list(labels.values()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Application metrics
+REQUESTS = Counter(
+    'distributech_http_requests_total', 'HTTP requests by route, method and status',
+    ['route', 'method', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'distributech_http_request_duration_seconds', 'HTTP request latency by route',
+    ['route', 'method'],
+)
+DB_QUERIES = Counter('distributech_db_queries_total', 'SQL queries run by requests, by route', ['route'])
+DB_QUERY_SECONDS = Counter(
+    'distributech_db_query_seconds_total', 'Time spent in SQL queries by requests, by route', ['route'],
+)
+EMAILS = Counter('distributech_emails_total', 'Emails handed to SMTP by result', ['result'])
+EMAIL_SEND_DURATION = Histogram(
+    'distributech_email_send_duration_seconds', 'Time to hand one call of emails to SMTP', ['function'],
+)
+LOW_STOCK_ALERTS = Counter('distributech_low_stock_alerts_total', 'Low-stock alerts queued')
+CHAT_MESSAGES = Counter('distributech_chat_messages_total', 'Chat messages posted')
@@ -0,0 +1,169 @@
+"""
+Hot/cold order archival
+
+Completed and Cancelled orders that have not changed for the retention
+window are moved, with their items, statuses, comments and attachments, into
+the ``Archived*`` tables. Every chunk of orders is moved in its own
+transaction: the orders are locked, each table is copied with one
+``INSERT ... SELECT`` and the originals are deleted, so a failure leaves
+every order either fully live or fully archived. Location pings and the
+current location of archived orders are dropped with them.
+
+Archived orders stay readable: ``OrderViewSet.retrieve`` and
+``public_order_detail`` fall back to the archive when an order is not live.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    ArchivedAttachment, ArchivedComment, ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatus,
+    Attachment, Comment, Order, OrderItem, OrderStatus, OrderStatusChoices,
+)
+
+CLOSED_STATUSES = [OrderStatusChoices.COMPLETED, OrderStatusChoices.CANCELLED]
+
+# Operational model -> archive model, parents first
+ARCHIVE_TABLES = [
+    (Order, ArchivedOrder),
+    (OrderItem, ArchivedOrderItem),
+    (OrderStatus, ArchivedOrderStatus),
+    (Comment, ArchivedComment),
+    (Attachment, ArchivedAttachment),
+]
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ArchiveMismatch(Exception):
+    """Raised when the rows copied to an archive table differ from the rows deleted"""
+
+
+def get_retention_days():
+    """Return how long closed orders stay in the operational tables"""
+    return getattr(settings, 'ORDER_ARCHIVE_RETENTION_DAYS', 365)
+
+
+def archivable_orders(cutoff):
+    """Return closed orders last updated before ``cutoff``"""
+    return Order.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=cutoff)
+
+
+def _copy_rows(model, archive_model, ids, archived_at):
+    """Copy the rows of ``model`` belonging to the orders ``ids`` into ``archive_model``"""
+    archive_columns = {field.column for field in archive_model._meta.concrete_fields}
+    columns = [field.column for field in model._meta.concrete_fields if field.column in archive_columns]
+    key = 'id' if model is Order else 'order_id'
+
+    quote = connection.ops.quote_name
+    target_columns = [quote(column) for column in columns]
+    source_columns = [quote(column) for column in columns]
+    params = []
+    if 'archived_at' in archive_columns:
+        target_columns.append(quote('archived_at'))
+        source_columns.append('%s')
+        params.append(archived_at)
+
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(archive_model._meta.db_table)} ({', '.join(target_columns)}) "
+            f"SELECT {', '.join(source_columns)} FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(key)} IN ({placeholders})",
+            params + list(ids)
+        )
+        return cursor.rowcount
+
+
+def archive_chunk(ids, cutoff):
+    """
+    Move the given orders and their child rows to the archive in one transaction
+
+    Orders that are no longer archivable (reopened or updated since they were
+    selected, or already moved by another run) are skipped.
+
+    Returns:
+        Dict of model label -> number of rows moved (deleted rows of related
+        tables that are not archived, such as location pings, are included)
+    """
+    archived_at = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            archivable_orders(cutoff).select_for_update(skip_locked=True)
+            .filter(id__in=ids)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return {}
+
+        copied = {
+            model._meta.label: _copy_rows(model, archive_model, ids, archived_at)
+            for model, archive_model in ARCHIVE_TABLES
+        }
+        _, deleted = Order.objects.filter(id__in=ids).delete()
+        for label, count in copied.items():
+            if deleted.get(label, 0) != count:
+                raise ArchiveMismatch(f"{label}: copied {count} rows but deleted {deleted.get(label, 0)}")
+    return {label: count for label, count in deleted.items() if count}
+
+
+def archive_orders(retention_days=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=None, progress=None):
+    """
+    Archive every closed order older than the retention window
+
+    Args:
+        retention_days: Days since the last update (default ORDER_ARCHIVE_RETENTION_DAYS)
+        chunk_size: Orders moved per transaction
+        limit: Stop after this many orders
+        progress: Optional callable receiving (orders moved so far, counts of the last chunk)
+
+    Returns:
+        Dict of model label -> total number of rows moved
+    """
+    if retention_days is None:
+        retention_days = get_retention_days()
+    cutoff = timezone.now() - datetime.timedelta(days=retention_days)
+    candidates = archivable_orders(cutoff).order_by('id').values_list('id', flat=True)
+
+    totals = {}
+    moved = 0
+    last_id = 0
+    while limit is None or moved < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - moved)
+        ids = list(candidates.filter(id__gt=last_id)[:size])
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        counts = archive_chunk(ids, cutoff)
+        for label, count in counts.items():
+            totals[label] = totals.get(label, 0) + count
+        moved += counts.get(Order._meta.label, 0)
+        if progress:
+            progress(moved, counts)
+    return totals
+
+
+def table_sizes():
+    """Return {table label: (live rows, archived rows)} for the archived tables"""
+    return {
+        model._meta.label: (model.objects.count(), archive_model.objects.count())
+        for model, archive_model in ARCHIVE_TABLES
+    }
+
+
+def get_archived_order(order_id, queryset=None):
+    """
+    Return the archived order with the given ID, or None
+
+    Args:
+        queryset: Optional ArchivedOrder queryset restricting which orders may be returned
+    """
+    queryset = ArchivedOrder.objects.all() if queryset is None else queryset
+    try:
+        return queryset.select_related('user__department').filter(id=order_id).first()
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,92 @@
+"""
+Bulk order creation
+
+``create_orders`` writes any number of orders together with their lines and
+initial status history row using one bulk insert per table, so an import of
+thousands of orders costs a handful of queries instead of several per line.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Item, Order, OrderItem, OrderStatus
+from core.utils.email_outbox import queue_order_notifications
+
+# Rows per INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+
+def get_item_prices(item_ids):
+    """Return {item_id: price} for the given items with one query"""
+    return dict(Item.objects.filter(id__in=set(item_ids)).values_list('id', 'price'))
+
+
+def create_orders(orders, default_user=None, updated_by=None, notify=True):
+    """
+    Create orders with their lines and initial OrderStatus in one transaction
+
+    ``price_at_order_time`` is the current Item price. Lines that already
+    carry a ``price`` (the serializer fetched them while validating) are not
+    looked up again.
+
+    Args:
+        orders: List of dicts with user_id (optional), status, items (list of
+            dicts with item_id and quantity) and the optional current_location,
+            remarks and expected_delivery_date of the initial status
+        default_user: User that owns orders without a user_id
+        updated_by: User recorded on the initial OrderStatus rows
+        notify: Queue the order notification emails
+
+    Returns:
+        List of created Order objects, in the order of ``orders``
+    """
+    missing_prices = [
+        line['item_id'] for data in orders for line in data.get('items', []) if 'price' not in line
+    ]
+    prices = get_item_prices(missing_prices) if missing_prices else {}
+    for data in orders:
+        for line in data.get('items', []):
+            line.setdefault('price', prices.get(line['item_id']))
+    now = timezone.now()
+
+    with transaction.atomic():
+        # The denormalized columns are also set by the database triggers; they
+        # are filled here so the returned objects match the stored rows
+        created = Order.objects.bulk_create([
+            Order(
+                user_id=data.get('user_id') or default_user.id,
+                status=data['status'],
+                created_at=now,
+                total_amount=sum(line['quantity'] * line['price'] for line in data.get('items', [])),
+                current_location=data.get('current_location', ''),
+                expected_delivery_date=data.get('expected_delivery_date'),
+            )
+            for data in orders
+        ], batch_size=INSERT_BATCH_SIZE)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order_id=order.id,
+                item_id=line['item_id'],
+                quantity=line['quantity'],
+                price_at_order_time=line['price'],
+            )
+            for order, data in zip(created, orders)
+            for line in data.get('items', [])
+        ], batch_size=INSERT_BATCH_SIZE)
+
+        OrderStatus.objects.bulk_create([
+            OrderStatus(
+                order_id=order.id,
+                status=order.status,
+                current_location=data.get('current_location', ''),
+                location_timestamp=now,
+                remarks=data.get('remarks', ''),
+                expected_delivery_date=data.get('expected_delivery_date'),
+                updated_by=updated_by,
+            )
+            for order, data in zip(created, orders)
+        ], batch_size=INSERT_BATCH_SIZE)
+
+        if notify:
+            queue_order_notifications(created)
+    return created
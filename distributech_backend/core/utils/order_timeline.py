@@ -0,0 +1,145 @@
+"""
+Order activity timeline
+
+Status changes, comments and attachments of an order are read as one
+time-ordered stream with a single ``UNION ALL`` query. Every branch selects
+the same columns (kind, id, timestamp, user and the kind-specific fields),
+the union is sorted by (timestamp, kind, id) and paged with a keyset cursor,
+which each branch applies on its own so no page ever scans past the rows it
+returns. The users referenced by a page are then loaded with one more query.
+
+The entries are read through the order's reverse accessors, so archived
+orders get the same timeline from the archive tables.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import CharField, DateField, F, IntegerField, Q, TextField, Value
+from django.utils.dateparse import parse_datetime
+
+from core.models import User
+from core.serializers import UserSerializer
+
+STATUS, COMMENT, ATTACHMENT = 0, 1, 2
+
+KIND_NAMES = {STATUS: 'status', COMMENT: 'comment', ATTACHMENT: 'attachment'}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a timeline cursor cannot be decoded"""
+
+
+def encode_cursor(entry):
+    """Return the opaque cursor pointing just after the given entry"""
+    position = [entry['timestamp'].isoformat(), entry['kind'], entry['id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by ``encode_cursor``
+
+    Returns:
+        Tuple of (timestamp, kind, id)
+    """
+    try:
+        timestamp, kind, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(timestamp)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if timestamp is None or kind not in KIND_NAMES or not isinstance(entry_id, int):
+        raise InvalidCursor(cursor)
+    return timestamp, kind, entry_id
+
+
+def _branch(queryset, kind, timestamp, user=None, status=None, location=None, text=None, expected=None, after=None):
+    """
+    Select the common timeline columns from one entry table
+
+    Every argument names the column that fills a timeline column; None
+    selects NULL. ``after`` is a decoded cursor.
+    """
+    def column(name, output_field):
+        return F(name) if name else Value(None, output_field=output_field)
+
+    rows = queryset.annotate(
+        entry_kind=Value(kind, output_field=IntegerField()),
+        entry_id=F('id'),
+        entry_at=F(timestamp),
+        entry_user=column(user, IntegerField()),
+        entry_status=column(status, CharField()),
+        entry_location=column(location, CharField()),
+        entry_text=column(text, TextField()),
+        entry_expected=column(expected, DateField()),
+    )
+    if after is not None:
+        at, after_kind, after_id = after
+        later = Q(**{f'{timestamp}__gt': at})
+        if kind > after_kind:
+            later |= Q(**{timestamp: at})
+        elif kind == after_kind:
+            later |= Q(**{timestamp: at, 'id__gt': after_id})
+        rows = rows.filter(later)
+    return rows.values_list(
+        'entry_kind', 'entry_id', 'entry_at', 'entry_user', 'entry_status',
+        'entry_location', 'entry_text', 'entry_expected',
+    ).order_by()
+
+
+def _entry(row):
+    kind, entry_id, timestamp, user_id, status, location, text, expected = row
+    entry = {'type': KIND_NAMES[kind], 'kind': kind, 'id': entry_id, 'timestamp': timestamp, 'user_id': user_id}
+    if kind == STATUS:
+        entry.update(status=status, current_location=location, remarks=text, expected_delivery_date=expected)
+    elif kind == COMMENT:
+        entry['comment_text'] = text
+    else:
+        entry['file_url'] = text
+    return entry
+
+
+def order_timeline(order, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of an order's activity, oldest first
+
+    Args:
+        order: Order or ArchivedOrder
+        after: Optional cursor string from a previous page
+        limit: Maximum number of entries
+
+    Returns:
+        Tuple of (list of entry dicts, cursor for the next page or None)
+
+    Raises:
+        InvalidCursor: If ``after`` cannot be decoded
+    """
+    position = decode_cursor(after) if after else None
+    statuses = _branch(
+        order.orderstatus_set.all(), STATUS, 'location_timestamp', user='updated_by_id', status='status',
+        location='current_location', text='remarks', expected='expected_delivery_date', after=position,
+    )
+    comments = _branch(order.comment_set.all(), COMMENT, 'created_at', user='user_id', text='comment_text', after=position)
+    attachments = _branch(order.attachment_set.all(), ATTACHMENT, 'uploaded_at', text='file_url', after=position)
+
+    rows = list(
+        statuses.union(comments, attachments, all=True)
+        .order_by('entry_at', 'entry_kind', 'entry_id')[:limit + 1]
+    )
+    entries = [_entry(row) for row in rows[:limit]]
+
+    user_ids = {entry['user_id'] for entry in entries if entry['user_id'] is not None}
+    users = {}
+    if user_ids:
+        queryset = User.objects.filter(id__in=user_ids).select_related('role', 'department')
+        users = {user['id']: user for user in UserSerializer(queryset, many=True).data}
+    for entry in entries:
+        entry['user'] = users.get(entry.pop('user_id'))
+
+    next_cursor = encode_cursor(entries[-1]) if len(rows) > limit else None
+    for entry in entries:
+        del entry['kind']
+    return entries, next_cursor
@@ -0,0 +1,186 @@
+"""
+Order status state machine
+
+``ALLOWED_TRANSITIONS`` lists the statuses an order may move to from each
+status. Carriers re-scan shipments while they are on the road, so Shipped
+and In Transit may also be repeated to record a new location.
+
+``apply_status_change`` handles one order; ``apply_bulk_status_changes``
+handles carrier batches of thousands of scans with a fixed number of
+queries: one locking SELECT, a bulk insert of the OrderStatus rows, one
+``UPDATE ... FROM (VALUES ...)`` per chunk of orders and one batched outbox
+write for the notifications.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from core.models import Order, OrderStatus, OrderStatusChoices
+from core.utils.email_outbox import queue_status_change_notifications
+
+ALLOWED_TRANSITIONS = {
+    OrderStatusChoices.PENDING: {OrderStatusChoices.PROCESSING, OrderStatusChoices.CANCELLED},
+    OrderStatusChoices.PROCESSING: {OrderStatusChoices.SHIPPED, OrderStatusChoices.CANCELLED},
+    OrderStatusChoices.SHIPPED: {
+        OrderStatusChoices.SHIPPED, OrderStatusChoices.IN_TRANSIT,
+        OrderStatusChoices.DELIVERED, OrderStatusChoices.CANCELLED,
+    },
+    OrderStatusChoices.IN_TRANSIT: {OrderStatusChoices.IN_TRANSIT, OrderStatusChoices.DELIVERED},
+    OrderStatusChoices.DELIVERED: {OrderStatusChoices.COMPLETED},
+    OrderStatusChoices.COMPLETED: set(),
+    OrderStatusChoices.CANCELLED: set(),
+}
+
+# Orders per UPDATE statement in the bulk path
+UPDATE_CHUNK_SIZE = 5000
+
+
+class InvalidStatusTransition(ValueError):
+    """Raised when an order cannot move from its current status to the requested one"""
+
+    def __init__(self, order_id, current, requested):
+        self.order_id = order_id
+        self.current = current
+        self.requested = requested
+        super().__init__(f"Order #{order_id} cannot move from {current} to {requested}")
+
+
+def can_transition(current, requested):
+    """
+    Check whether an order in status ``current`` may move to ``requested``
+
+    Orders whose stored status is not one of the known choices (legacy
+    rows, the status field is free text) may move to any valid status.
+    """
+    if requested not in ALLOWED_TRANSITIONS:
+        return False
+    if current not in ALLOWED_TRANSITIONS:
+        return True
+    return requested in ALLOWED_TRANSITIONS[current]
+
+
+def apply_status_change(order_id, status, current_location='', remarks='', expected_delivery_date=None,
+                        updated_by=None, location_timestamp=None, notification_email=None, notify=True):
+    """
+    Validate and record a status change for one order
+
+    The order row is locked while the transition is checked, the history
+    row is inserted and only ``status`` and ``updated_at`` are written back.
+    Unless ``notify`` is False, the notification is queued in the same
+    transaction.
+
+    Returns:
+        The created OrderStatus object
+
+    Raises:
+        Order.DoesNotExist: If the order does not exist
+        InvalidStatusTransition: If the move is not allowed
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().only('id', 'status').get(id=order_id)
+        if not can_transition(order.status, status):
+            raise InvalidStatusTransition(order.id, order.status, status)
+
+        order_status = OrderStatus.objects.create(
+            order=order,
+            status=status,
+            current_location=current_location,
+            location_timestamp=location_timestamp or timezone.now(),
+            remarks=remarks,
+            expected_delivery_date=expected_delivery_date,
+            updated_by=updated_by,
+        )
+        order.status = status
+        order.save(update_fields=['status', 'updated_at'])
+
+        if notify:
+            queue_status_change_notifications([order_status], notification_email)
+    return order_status
+
+
+def _update_order_statuses(final_statuses):
+    # final_statuses: {order_id: status}
+    now = timezone.now()
+    items = sorted(final_statuses.items())
+    for start in range(0, len(items), UPDATE_CHUNK_SIZE):
+        chunk = items[start:start + UPDATE_CHUNK_SIZE]
+        if connection.vendor == 'postgresql':
+            table = connection.ops.quote_name(Order._meta.db_table)
+            values = ', '.join(['(%s, %s)'] * len(chunk))
+            params = [value for row in chunk for value in row]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} AS o SET status = v.status, updated_at = %s "
+                    f"FROM (VALUES {values}) AS v(id, status) WHERE o.id = v.id",
+                    [now] + params
+                )
+        else:
+            Order.objects.filter(id__in=[order_id for order_id, _ in chunk]).update(
+                status=Case(*[When(id=order_id, then=Value(status)) for order_id, status in chunk]),
+                updated_at=now,
+            )
+
+
+def apply_bulk_status_changes(updates, updated_by=None, notification_email=None):
+    """
+    Validate and record a batch of status changes
+
+    Updates are applied in the given order, so one batch may move an order
+    through several statuses. Updates that fail validation are skipped and
+    reported, the rest are applied in one transaction.
+
+    Args:
+        updates: List of dicts with order_id and status, plus optional
+            current_location, remarks, expected_delivery_date and location_timestamp
+        updated_by: User recorded on every OrderStatus row
+        notification_email: Optional address overriding recipient routing
+
+    Returns:
+        Tuple of (created OrderStatus objects, list of error dicts with
+        index, order_id and message)
+    """
+    order_ids = {update['order_id'] for update in updates}
+    errors = []
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Lock in id order so concurrent batches cannot deadlock each other
+        current = dict(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids)
+            .order_by('id')
+            .values_list('id', 'status')
+        )
+
+        new_rows = []
+        for index, update in enumerate(updates):
+            order_id = update['order_id']
+            status = update['status']
+            if order_id not in current:
+                errors.append({'index': index, 'order_id': order_id, 'message': 'Order not found'})
+                continue
+            if not can_transition(current[order_id], status):
+                errors.append({
+                    'index': index,
+                    'order_id': order_id,
+                    'message': str(InvalidStatusTransition(order_id, current[order_id], status)),
+                })
+                continue
+            current[order_id] = status
+            new_rows.append(OrderStatus(
+                order_id=order_id,
+                status=status,
+                current_location=update.get('current_location', ''),
+                location_timestamp=update.get('location_timestamp') or now,
+                remarks=update.get('remarks', ''),
+                expected_delivery_date=update.get('expected_delivery_date'),
+                updated_by=updated_by,
+            ))
+
+        if new_rows:
+            created = OrderStatus.objects.bulk_create(new_rows, batch_size=1000)
+            _update_order_statuses({row.order_id: current[row.order_id] for row in created})
+            queue_status_change_notifications(created, notification_email)
+        else:
+            created = []
+    return created, errors
@@ -0,0 +1,152 @@
+"""
+Recipient routing for notification emails
+
+Each email kind is routed by a list of rules instead of a hard-coded
+address:
+
+- ``{'field': 'creator'}``: the user who placed the order
+- ``{'field': 'supplier'}``: the supplier of the stock record
+- ``{'role': 'Warehouse Manager'}``: every active user with that role
+- ``{'role': 'Department Manager', 'same_department': True}``: users with
+  that role in the department the event belongs to
+
+Role membership comes from a routing table (role -> department -> emails)
+that is built with one query, cached, and invalidated by the signals in
+``core/signals.py`` when a change to a user's role, department, email or
+active flag commits. Resolving a batch of events costs one further query for the
+events themselves, however many there are.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from core.models import Order, OrderStatus, Stock, User
+
+# Fallback recipients used when routing finds nobody
+DEFAULT_MANAGER_EMAIL = "manager@distributech.com"
+DEFAULT_INVENTORY_EMAIL = "inventory@distributech.com"
+
+ROUTING_CACHE_KEY = 'email_routing_table'
+
+# Routing rules per email kind, overridable with the EMAIL_ROUTING setting
+DEFAULT_ROUTES = {
+    'order_notification': {
+        'rules': [{'field': 'creator'}],
+        'fallback': [],
+    },
+    'status_change': {
+        'rules': [{'role': 'Department Manager', 'same_department': True}],
+        'fallback': [DEFAULT_MANAGER_EMAIL],
+    },
+    'stock_alert': {
+        'rules': [{'field': 'supplier'}, {'role': 'Warehouse Manager'}],
+        'fallback': [DEFAULT_INVENTORY_EMAIL],
+    },
+}
+
+# Model and the fields rules can refer to, per email kind
+EVENT_SOURCES = {
+    'order_notification': (Order, {
+        'department_id': 'user__department_id',
+        'creator': 'user__email',
+    }),
+    'status_change': (OrderStatus, {
+        'department_id': 'order__user__department_id',
+        'creator': 'order__user__email',
+    }),
+    'stock_alert': (Stock, {
+        'department_id': 'supplier__department_id',
+        'supplier': 'supplier__email',
+    }),
+}
+
+
+def get_routes(kind):
+    """Return the routing config for a kind (EMAIL_ROUTING overrides the defaults)"""
+    routes = {**DEFAULT_ROUTES, **getattr(settings, 'EMAIL_ROUTING', {})}
+    return routes.get(kind, {'rules': [], 'fallback': []})
+
+
+def _routed_roles():
+    roles = set()
+    for kind in EVENT_SOURCES:
+        for rule in get_routes(kind)['rules']:
+            if 'role' in rule:
+                roles.add(rule['role'])
+    return roles
+
+
+def get_routing_table():
+    """
+    Return the cached routing table, building it if needed
+
+    Returns:
+        Dict of role name -> {department_id: [emails], None: [all emails with the role]}
+    """
+    table = cache.get(ROUTING_CACHE_KEY)
+    if table is not None:
+        return table
+
+    table = {}
+    users = (
+        User.objects.filter(is_active=True, role__name__in=_routed_roles())
+        .order_by('id')
+        .values_list('role__name', 'department_id', 'email')
+    )
+    for role_name, department_id, email in users:
+        by_department = table.setdefault(role_name, {None: []})
+        by_department.setdefault(department_id, []).append(email)
+        by_department[None].append(email)
+
+    cache.set(ROUTING_CACHE_KEY, table, getattr(settings, 'EMAIL_ROUTING_CACHE_TIMEOUT', 600))
+    return table
+
+
+def invalidate_routing_table():
+    """Drop the cached routing table once the current transaction commits"""
+    # Dropped before the commit, a concurrent build would cache the old table again
+    transaction.on_commit(lambda: cache.delete(ROUTING_CACHE_KEY))
+
+
+def resolve_recipients(kind, object_ids, recipient_email=None):
+    """
+    Resolve the recipients of a batch of events of one kind
+
+    Args:
+        kind: Email kind, a key of EVENT_SOURCES
+        object_ids: IDs of the Order, OrderStatus or Stock objects the emails are about
+        recipient_email: Optional explicit address(es) that replace routing for every event
+
+    Returns:
+        Dict of object ID -> list of email addresses (the kind's fallback if
+        no rule matched; IDs that no longer exist are left out)
+    """
+    if recipient_email:
+        if isinstance(recipient_email, str):
+            recipient_email = [r.strip() for r in recipient_email.split(',') if r.strip()]
+        return {object_id: list(recipient_email) for object_id in object_ids}
+
+    model, fields = EVENT_SOURCES[kind]
+    routes = get_routes(kind)
+    table = get_routing_table() if any('role' in rule for rule in routes['rules']) else {}
+
+    # Aliases are prefixed so they cannot clash with model fields like Stock.supplier
+    events = model.objects.filter(id__in=set(object_ids)).values(
+        'id', **{f'route_{name}': F(path) for name, path in fields.items()}
+    )
+
+    resolved = {}
+    for event in events:
+        recipients = []
+        for rule in routes['rules']:
+            if 'field' in rule:
+                emails = [event.get(f"route_{rule['field']}")]
+            else:
+                department = event['route_department_id'] if rule.get('same_department') else None
+                emails = table.get(rule['role'], {}).get(department, [])
+            for email in emails:
+                if email and email not in recipients:
+                    recipients.append(email)
+        resolved[event['id']] = recipients or list(routes['fallback'])
+    return resolved
@@ -0,0 +1,176 @@
+"""
+Versioned response cache
+
+Read endpoints over reference data (roles, departments, items, stock) cache
+their serialized response data. Every cache key includes a version number
+per model the response is built from, and ``core/signals.py`` bumps a
+model's version on every ``post_save``/``post_delete``, so a write makes all
+responses depending on that model unreachable at once without scanning or
+deleting keys. Stale entries simply expire.
+
+The cache backend is any Django cache alias (``RESPONSE_CACHE_ALIAS``,
+default ``default``), so locmem, file-based and Redis backends are selected
+in ``CACHES`` without code changes. Hits and misses are counted per view in
+the same cache so they add up across worker processes.
+
+Model signals bump versions when the write commits. Writes that bypass them
+(``QuerySet.update``, ``bulk_create``, raw SQL) must call
+``bump_model_version`` themselves, after the commit.
+
+Misses are computed on the primary database even when the request reads from
+a replica: a lagging replica would otherwise store pre-write data under the
+version the write just bumped, and it would be served until it expires.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core import db_router
+from core.models import Department, Item, Role, Stock, User
+
+# Models whose versions are bumped by the signals in core/signals.py
+VERSIONED_MODELS = (Role, Department, Item, Stock, User)
+
+VERSION_KEY = 'cache_version:{label}'
+STATS_KEY = 'cache_stats:{view}:{outcome}'
+STATS_VIEWS_KEY = 'cache_stats:views'
+
+
+def get_cache():
+    """Return the cache backend used for responses"""
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    """Return how long cached responses are kept, in seconds"""
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600)
+
+
+def _version_key(model):
+    return VERSION_KEY.format(label=model._meta.label_lower)
+
+
+def get_model_versions(models):
+    """
+    Return the current version of each model, initializing missing ones
+
+    A version that was evicted restarts from the current time rather than
+    from 1, so it can never come back to a value used by older entries.
+    """
+    cache = get_cache()
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_model_version(*models):
+    """Invalidate every cached response built from the given models"""
+    cache = get_cache()
+    for model in models:
+        key = _version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def _count(view_name, outcome):
+    cache = get_cache()
+    key = STATS_KEY.format(view=view_name, outcome=outcome)
+    if cache.add(key, 1, timeout=None):
+        views = cache.get(STATS_VIEWS_KEY) or set()
+        if view_name not in views:
+            cache.set(STATS_VIEWS_KEY, views | {view_name}, timeout=None)
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    """
+    Return the hit and miss counters of every cached view
+
+    Returns:
+        Dict of view name -> {'hits', 'misses', 'hit_rate'}
+    """
+    cache = get_cache()
+    views = sorted(cache.get(STATS_VIEWS_KEY) or ())
+    keys = [STATS_KEY.format(view=view, outcome=outcome) for view in views for outcome in ('hit', 'miss')]
+    counts = cache.get_many(keys)
+    stats = {}
+    for view in views:
+        hits = counts.get(STATS_KEY.format(view=view, outcome='hit'), 0)
+        misses = counts.get(STATS_KEY.format(view=view, outcome='miss'), 0)
+        stats[view] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+
+def reset_stats():
+    """Clear the hit and miss counters"""
+    cache = get_cache()
+    views = cache.get(STATS_VIEWS_KEY) or ()
+    cache.delete_many(
+        [STATS_KEY.format(view=view, outcome=outcome) for view in views for outcome in ('hit', 'miss')]
+        + [STATS_VIEWS_KEY]
+    )
+
+
+def cached_response(*models, timeout=None, per_user=False):
+    """
+    Cache the data of successful GET responses of a DRF view
+
+    Works on function views decorated with ``@api_view`` (apply it below
+    ``@api_view`` and the permission decorators) and on viewset methods such
+    as ``list``. The key covers the full URL with its query string and the
+    current version of every model in ``models``.
+
+    Args:
+        models: Models the response is built from
+        timeout: Seconds to keep entries (default RESPONSE_CACHE_TIMEOUT)
+        per_user: Cache separately per authenticated user, for views whose
+            result depends on who asks
+    """
+    def decorator(view):
+        view_name = f'{view.__module__}.{view.__qualname__}'
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, (Request, HttpRequest)))
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            cache = get_cache()
+            versions = '.'.join(str(version) for version in get_model_versions(models))
+            path = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+            user = f':{request.user.pk}' if per_user else ''
+            key = f'response:{view_name}:{versions}:{path}{user}'
+
+            data = cache.get(key)
+            if data is not None:
+                _count(view_name, 'hit')
+                return Response(data)
+
+            _count(view_name, 'miss')
+            with db_router.use_primary():
+                response = view(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set(key, response.data, timeout if timeout is not None else get_timeout())
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,261 @@
+"""
+Process-wide pool of persistent SMTP connections
+
+Opening an SMTP session costs a TCP connect, the server greeting, EHLO,
+STARTTLS (a TLS handshake plus a second EHLO) and AUTH before the first
+message can go out. The pool keeps authenticated sessions open and hands
+them out again, checking them with NOOP when they have been idle for a
+while, so that cost is paid once per connection instead of once per email.
+"""
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+def is_connection_error(error):
+    """
+    Whether an error means the session is dead (as opposed to a rejected message)
+
+    SMTPException derives from OSError, so socket errors have to be told
+    apart from protocol replies explicitly.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class PooledConnection:
+    """An open SMTP session plus the bookkeeping the pool needs"""
+
+    def __init__(self, server):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP connections
+
+    Args:
+        host, port: SMTP relay address
+        username, password: Optional credentials for AUTH
+        use_tls: Run STARTTLS after connecting
+        timeout: Socket timeout in seconds
+        max_size: Maximum number of open connections (callers block beyond that)
+        idle_timeout: Connections idle for longer than this are closed, not reused
+        health_check_interval: Idle connections older than this are checked with NOOP
+        max_messages: Connections are recycled after sending this many messages
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, timeout=10,
+                 max_size=4, idle_timeout=60, health_check_interval=15, max_messages=100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.max_messages = max_messages
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.stats = {'connects': 0, 'reuses': 0, 'health_checks': 0, 'discarded': 0}
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.stats['connects'] += 1
+        return PooledConnection(server)
+
+    def _is_usable(self, conn):
+        now = time.monotonic()
+        if now - conn.last_used > self.idle_timeout or conn.messages_sent >= self.max_messages:
+            return False
+        if now - conn.last_used > self.health_check_interval:
+            self.stats['health_checks'] += 1
+            try:
+                code, _ = conn.server.noop()
+            except OSError:
+                return False
+            return code == 250
+        return True
+
+    def acquire(self, timeout=None):
+        """
+        Take a connection out of the pool, opening a new one if needed
+
+        Blocks while ``max_size`` connections are checked out, for at most
+        ``timeout`` seconds if given (forever when None).
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a free SMTP connection")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                if self._is_usable(conn):
+                    self.stats['reuses'] += 1
+                    return conn
+                self.stats['discarded'] += 1
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool, or close it if it is broken or worn out"""
+        try:
+            if broken or conn.messages_sent >= self.max_messages:
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def _sendmail(self, conn, from_email, recipients, message):
+        conn.server.sendmail(from_email, recipients, message)
+        conn.messages_sent += 1
+
+    def send(self, from_email, recipients, message):
+        """
+        Send one message, reconnecting once if the pooled session turned out to be dead
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    self._sendmail(conn, from_email, recipients, message)
+                return
+            except Exception as e:
+                if attempt or not is_connection_error(e):
+                    raise
+
+    def send_many(self, messages):
+        """
+        Send a batch of messages over as few sessions as possible
+
+        Args:
+            messages: Iterable of (from_email, recipients, message_string) tuples
+
+        Returns:
+            List with one entry per message: None if it was sent, otherwise
+            the exception that prevented it
+        """
+        results = []
+        conn = None
+        try:
+            for from_email, recipients, message in messages:
+                error = None
+                for attempt in range(2):
+                    if conn is None or conn.messages_sent >= self.max_messages:
+                        if conn is not None:
+                            self.release(conn)
+                            conn = None
+                        try:
+                            conn = self.acquire()
+                        except Exception as e:
+                            error = e
+                            break
+                    try:
+                        self._sendmail(conn, from_email, recipients, message)
+                        error = None
+                        break
+                    except Exception as e:
+                        error = e
+                        if not is_connection_error(e):
+                            # Rejected message, the session itself is still fine
+                            break
+                        # Dead session: drop it and retry this message on a fresh one
+                        self.release(conn, broken=True)
+                        conn = None
+                results.append(error)
+        finally:
+            if conn is not None:
+                self.release(conn)
+        return results
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_setting(name, default):
+    """Read a key from the optional EMAIL_SMTP_POOL settings dict"""
+    return getattr(settings, 'EMAIL_SMTP_POOL', {}).get(name, default)
+
+
+def get_smtp_pool():
+    """
+    Return the pool for this process, creating it from the email settings
+
+    The pool is recreated after a fork so child processes never share
+    sockets with their parent.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = SMTPConnectionPool(
+                    host=settings.EMAIL_HOST,
+                    port=settings.EMAIL_PORT,
+                    username=settings.EMAIL_HOST_USER,
+                    password=settings.EMAIL_HOST_PASSWORD,
+                    use_tls=settings.EMAIL_USE_TLS,
+                    timeout=get_pool_setting('TIMEOUT', 10),
+                    max_size=get_pool_setting('MAX_SIZE', 4),
+                    idle_timeout=get_pool_setting('IDLE_TIMEOUT', 60),
+                    health_check_interval=get_pool_setting('HEALTH_CHECK_INTERVAL', 15),
+                    max_messages=get_pool_setting('MAX_MESSAGES_PER_CONNECTION', 100),
+                )
+                _pool_pid = pid
+    return _pool
@@ -3,34 +3,47 @@ from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.contrib.postgres.search import SearchQuery
 from .models import (
     User, UserInfo, Role, Department, Order, OrderStatus,
-    Item, OrderItem, Stock, Comment, Attachment
+    Item, OrderItem, Stock, Comment, Attachment, ArchivedOrder
 )
 from .serializers import (
     UserSerializer, UserDetailSerializer, UserInfoSerializer, RoleSerializer,
     DepartmentSerializer, OrderSerializer, OrderDetailSerializer, OrderStatusSerializer,
     ItemSerializer, OrderItemSerializer, StockSerializer, CommentSerializer,
-    AttachmentSerializer
+    AttachmentSerializer, prefetch_order_details, user_relations
 )
 from .permissions import (
     IsSuperAdmin, IsDepartmentManager, IsWarehouseManager,
     IsSupplier, IsAdministrator
 )
+from .search_views import SEARCH_CONFIG
+from .utils.conditional import conditional, list_validators, order_validators, row_validators
+from .utils.order_archive import get_archived_order
+from .utils.response_cache import cached_response
 from rest_framework.permissions import AllowAny
 
 class RoleViewSet(viewsets.ModelViewSet):
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
+    
+    @cached_response(Role)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 class DepartmentViewSet(viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.IsAuthenticated, IsSuperAdmin | IsAdministrator]
+    
+    @cached_response(Department)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('role', 'department')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, IsSuperAdmin | IsAdministrator]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
@@ -42,6 +55,26 @@ class UserViewSet(viewsets.ModelViewSet):
             return UserDetailSerializer
         return UserSerializer
     
+    def get_validators(self, request, *args, **kwargs):
+        """ETag and Last-Modified of one user"""
+        return row_validators(self.get_queryset(), kwargs[self.lookup_field], ['updated_at'], (Role, Department))
+    
+    @conditional(get_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+    
+    @conditional(get_validators)
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def me(self, request):
         serializer = UserDetailSerializer(request.user)
@@ -61,6 +94,10 @@ class ItemViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
         return [permission() for permission in permission_classes]
+    
+    @cached_response(Item)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all().order_by('-created_at')
@@ -135,7 +172,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             }, status=500)
 
 class OrderStatusViewSet(viewsets.ModelViewSet):
-    queryset = OrderStatus.objects.all().order_by('-location_timestamp')
+    queryset = OrderStatus.objects.select_related(*user_relations('updated_by')).order_by('-location_timestamp')
     serializer_class = OrderStatusSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['order', 'status']
@@ -153,7 +190,7 @@ class OrderStatusViewSet(viewsets.ModelViewSet):
         serializer.save(updated_by=self.request.user)
 
 class OrderItemViewSet(viewsets.ModelViewSet):
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related('item')
     serializer_class = OrderItemSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['order', 'item']
@@ -187,11 +224,20 @@ class StockViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related(*user_relations('user'))
     serializer_class = CommentSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend]
     filterset_fields = ['order', 'user']
-    search_fields = ['comment_text']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get('search')
+        if search:
+            # Match against the GIN-indexed search vector instead of an ILIKE scan
+            queryset = queryset.filter(
+                search_vector=SearchQuery(search, config=SEARCH_CONFIG, search_type='websearch')
+            )
+        return queryset
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'create']:
@@ -236,6 +282,7 @@ class AttachmentViewSet(viewsets.ModelViewSet):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(Role)
 def public_roles(request):
     """
     Public endpoint to get all roles (used for registration)
@@ -246,6 +293,7 @@ def public_roles(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(Department)
 def public_departments(request):
     """
     Public endpoint to get all departments (used for registration)
@@ -270,11 +318,12 @@ def public_orders(request):
         orders = orders.filter(status=status)
     
     # Use the detail serializer to include all related data
-    serializer = OrderDetailSerializer(orders, many=True)
+    serializer = OrderDetailSerializer(prefetch_order_details(orders), many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(Item)
 def public_items(request):
     """
     Public endpoint to get all items without authentication
@@ -292,16 +341,25 @@ def public_order_items(request):
     # Get query parameter for order id
     order_id = request.query_params.get('order', None)
     
+    order_items = OrderItem.objects.select_related('item')
     if order_id:
-        order_items = OrderItem.objects.filter(order_id=order_id)
-    else:
-        order_items = OrderItem.objects.all()
+        order_items = order_items.filter(order_id=order_id)
     
     serializer = OrderItemSerializer(order_items, many=True)
     return Response(serializer.data)
 
+def public_stock_validators(request):
+    item_id = request.query_params.get('item', None)
+    stock_items = Stock.objects.filter(item_id=item_id) if item_id else Stock.objects.all()
+    try:
+        return list_validators(request, stock_items, (Item, User, Role, Department))
+    except ValueError:
+        return None
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(public_stock_validators)
+@cached_response(Stock, Item, User, Role, Department)
 def public_stock(request):
     """
     Public endpoint to get stock information without authentication
@@ -309,10 +367,9 @@ def public_stock(request):
     # Get query parameter for item id
     item_id = request.query_params.get('item', None)
     
+    stock_items = Stock.objects.select_related('item', *user_relations('supplier'))
     if item_id:
-        stock_items = Stock.objects.filter(item_id=item_id)
-    else:
-        stock_items = Stock.objects.all()
+        stock_items = stock_items.filter(item_id=item_id)
     
     serializer = StockSerializer(stock_items, many=True)
     return Response(serializer.data)
@@ -326,16 +383,112 @@ def public_order_status(request):
     # Get query parameter for order id
     order_id = request.query_params.get('order', None)
     
+    order_statuses = OrderStatus.objects.select_related(*user_relations('updated_by')).order_by('-location_timestamp')
     if order_id:
-        order_statuses = OrderStatus.objects.filter(order_id=order_id).order_by('-location_timestamp')
-    else:
-        order_statuses = OrderStatus.objects.all().order_by('-location_timestamp')
+        order_statuses = order_statuses.filter(order_id=order_id)
     
     serializer = OrderStatusSerializer(order_statuses, many=True)
     return Response(serializer.data)
 
+def public_order_validators(request, order_id):
+    return order_validators(order_id)
+
+def get_public_order(order_id):
+    """Return the live or archived order with its user and department, or None"""
+    order = Order.objects.select_related('user__department').filter(id=order_id).first()
+    # Fall back to the archive for archived orders
+    return order or get_archived_order(order_id)
+
+def public_order_related(order):
+    """
+    Querysets of what the public order detail shows besides the order itself
+
+    The related managers of live and archived orders have the same names.
+
+    Returns:
+        Tuple of (order items, statuses, comments, attachments) querysets
+    """
+    return (
+        order.orderitem_set.select_related('item'),
+        order.orderstatus_set.select_related('updated_by').order_by('-location_timestamp'),
+        order.comment_set.select_related('user').order_by('-created_at'),
+        order.attachment_set.all(),
+    )
+
+def public_order_data(order, order_items, order_statuses, comments, attachments):
+    """Format the public order detail from the order and its related rows"""
+    order_data = {
+        'id': order.id,
+        'archived': isinstance(order, ArchivedOrder),
+        'status': order.status,
+        'created_at': order.created_at,
+        'updated_at': order.updated_at,
+        'user': {
+            'id': order.user.id,
+            'username': order.user.username,
+            'email': order.user.email,
+            'department': {
+                'id': order.user.department.id,
+                'name': order.user.department.name
+            }
+        },
+        'items': [
+            {
+                'id': order_item.id,
+                'item': {
+                    'id': order_item.item.id,
+                    'name': order_item.item.name,
+                    'description': order_item.item.description,
+                    'measurement_unit': order_item.item.measurement_unit,
+                    'price': float(order_item.item.price)
+                },
+                'quantity': order_item.quantity,
+                'price_at_order_time': float(order_item.price_at_order_time),
+                'total': float(order_item.quantity * order_item.price_at_order_time)
+            }
+            for order_item in order_items
+        ],
+        'statuses': [
+            {
+                'id': status.id,
+                'status': status.status,
+                'current_location': status.current_location,
+                'location_timestamp': status.location_timestamp,
+                'remarks': status.remarks,
+                'expected_delivery_date': status.expected_delivery_date,
+                'updated_by': status.updated_by.username if status.updated_by else None
+            }
+            for status in order_statuses
+        ],
+        'comments': [
+            {
+                'id': comment.id,
+                'comment_text': comment.comment_text,
+                'created_at': comment.created_at,
+                'user': {
+                    'id': comment.user.id,
+                    'username': comment.user.username
+                }
+            }
+            for comment in comments
+        ],
+        'attachments': [
+            {
+                'id': attachment.id,
+                'file_url': attachment.file_url,
+                'uploaded_at': attachment.uploaded_at
+            }
+            for attachment in attachments
+        ]
+    }
+    
+    # Calculate order total
+    order_data['total'] = sum(item['total'] for item in order_data['items'])
+    return order_data
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(public_order_validators)
 def public_order_detail(request, order_id):
     """
     Get detailed information about a specific order including items, statuses, etc.
@@ -345,91 +498,11 @@ def public_order_detail(request, order_id):
     - order_id: ID of the order to fetch
     """
     try:
-        # Get order with related data
-        order = Order.objects.get(id=order_id)
-        
-        # Get order items
-        order_items = OrderItem.objects.filter(order=order).select_related('item')
-        
-        # Get order statuses
-        order_statuses = OrderStatus.objects.filter(order=order).order_by('-location_timestamp')
-        
-        # Get comments
-        comments = Comment.objects.filter(order=order).select_related('user').order_by('-created_at')
-        
-        # Get attachments
-        attachments = Attachment.objects.filter(order=order)
-        
-        # Format order data
-        order_data = {
-            'id': order.id,
-            'status': order.status,
-            'created_at': order.created_at,
-            'updated_at': order.updated_at,
-            'user': {
-                'id': order.user.id,
-                'username': order.user.username,
-                'email': order.user.email,
-                'department': {
-                    'id': order.user.department.id,
-                    'name': order.user.department.name
-                }
-            },
-            'items': [
-                {
-                    'id': order_item.id,
-                    'item': {
-                        'id': order_item.item.id,
-                        'name': order_item.item.name,
-                        'description': order_item.item.description,
-                        'measurement_unit': order_item.item.measurement_unit,
-                        'price': float(order_item.item.price)
-                    },
-                    'quantity': order_item.quantity,
-                    'price_at_order_time': float(order_item.price_at_order_time),
-                    'total': float(order_item.quantity * order_item.price_at_order_time)
-                }
-                for order_item in order_items
-            ],
-            'statuses': [
-                {
-                    'id': status.id,
-                    'status': status.status,
-                    'current_location': status.current_location,
-                    'location_timestamp': status.location_timestamp,
-                    'remarks': status.remarks,
-                    'expected_delivery_date': status.expected_delivery_date,
-                    'updated_by': status.updated_by.username if status.updated_by else None
-                }
-                for status in order_statuses
-            ],
-            'comments': [
-                {
-                    'id': comment.id,
-                    'comment_text': comment.comment_text,
-                    'created_at': comment.created_at,
-                    'user': {
-                        'id': comment.user.id,
-                        'username': comment.user.username
-                    }
-                }
-                for comment in comments
-            ],
-            'attachments': [
-                {
-                    'id': attachment.id,
-                    'file_url': attachment.file_url,
-                    'uploaded_at': attachment.uploaded_at
-                }
-                for attachment in attachments
-            ]
-        }
-        
-        # Calculate order total
-        total = sum(item['total'] for item in order_data['items'])
-        order_data['total'] = total
+        order = get_public_order(order_id)
+        if order is None:
+            raise Order.DoesNotExist
         
-        return Response(order_data)
+        return Response(public_order_data(order, *public_order_related(order)))
         
     except Order.DoesNotExist:
         return Response({'error': f'Order with ID {order_id} not found'}, status=404)
@@ -4,13 +4,14 @@ Views for handling email operations in DistribuTech
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-import datetime
 
-from .models import Order, Item, Stock, OrderStatus, OrderStatusChoices
-from .utils.email_utils import send_test_email, send_order_notification, send_stock_alert, send_status_change_notification
-from .serializers import OrderStatusSerializer
+from .models import Order, Item, Stock
+from .utils.email_utils import send_test_email
+from .utils.email_outbox import queue_order_notification, queue_stock_alert
+from .utils.order_transitions import InvalidStatusTransition, apply_status_change, apply_bulk_status_changes
+from .serializers import OrderStatusBulkUpdateSerializer, OrderStatusSerializer, OrderStatusUpdateSerializer
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -90,19 +91,14 @@ def order_notification(request, order_id):
     # Use provided email or let the function use defaults
     email = request.data.get('email')
     
-    # Send order notification
-    success = send_order_notification(order, email)
+    # Queue order notification for the email worker
+    outbox = queue_order_notification(order, email, immediate=True)
     
-    if success:
-        return Response({
-            'success': True,
-            'message': f'Order notification for Order #{order_id} sent successfully'
-        })
-    else:
-        return Response({
-            'success': False,
-            'message': 'Failed to send order notification. Check server logs for details.'
-        }, status=500)
+    return Response({
+        'success': True,
+        'message': f'Order notification for Order #{order_id} queued for delivery',
+        'outbox_id': outbox.id
+    }, status=202)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -123,19 +119,36 @@ def stock_alert(request, item_id):
     # Use provided email or let the function use defaults
     email = request.data.get('email')
     
-    # Send stock alert
-    success = send_stock_alert(item, stock, email)
+    # Queue stock alert for the email worker
+    outbox = queue_stock_alert(stock, email)
     
-    if success:
-        return Response({
-            'success': True,
-            'message': f'Stock alert for {item.name} sent successfully'
-        })
-    else:
-        return Response({
-            'success': False,
-            'message': 'Failed to send stock alert. Check server logs for details.'
-        }, status=500)
+    return Response({
+        'success': True,
+        'message': f'Stock alert for {item.name} queued for delivery',
+        'outbox_id': outbox.id
+    }, status=202)
+
+def _error_message(errors):
+    """Flatten serializer errors into one message"""
+    if isinstance(errors, dict):
+        return '; '.join(
+            message if field == 'non_field_errors' else f'{field}: {message}'
+            for field, messages in errors.items()
+            for message in messages
+        )
+    return '; '.join(str(message) for message in errors)
+
+def _parse_status_update(data, serializer_class=OrderStatusUpdateSerializer):
+    """
+    Validate the fields of one status update
+
+    Returns:
+        Tuple of (update dict, error message); the error is None when the data is valid
+    """
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        return None, _error_message(serializer.errors)
+    return dict(serializer.validated_data), None
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -145,74 +158,99 @@ def update_order_status(request, order_id):
     This endpoint is intentionally left without permission restrictions as requested
     
     Request params:
-    - status: New status (Pending, Processing, Shipped, etc.)
+    - status: New status (Pending, Processing, Shipped, etc.), must be allowed from the current status
     - current_location: Current location of the order
     - remarks: Any additional remarks
     - expected_delivery_date: Expected delivery date (YYYY-MM-DD)
-    - email: Optional email to send notification to (defaults to manager@distributech.com)
+    - email: Optional email to send notification to (routed to the department managers by default)
     """
+    update, error = _parse_status_update(request.data)
+    if error:
+        return Response({
+            'success': False,
+            'message': error
+        }, status=400)
+    
     try:
-        # Get order
-        order = Order.objects.get(id=order_id)
+        order_status = apply_status_change(
+            order_id,
+            updated_by=request.user if request.user.is_authenticated else None,
+            notification_email=request.data.get('email'),
+            **update
+        )
     except Order.DoesNotExist:
         return Response({
             'success': False,
             'message': f'Order with ID {order_id} not found'
         }, status=404)
+    except InvalidStatusTransition as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=400)
     
-    # Get data from request
-    status = request.data.get('status')
-    current_location = request.data.get('current_location', '')
-    remarks = request.data.get('remarks', '')
-    expected_delivery_date_str = request.data.get('expected_delivery_date')
-    notification_email = request.data.get('email')
+    return Response({
+        'success': True,
+        'message': f'Order status updated to {update["status"]}',
+        'notification_queued': True,
+        'order_status': OrderStatusSerializer(order_status).data
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_update_order_status(request):
+    """
+    Apply a batch of carrier status scans
+    
+    POST payload:
+    - updates: List of objects with order_id, status and the optional
+      current_location, remarks, expected_delivery_date and location_timestamp
+    - email: Optional email to send all notifications to
     
-    # Validate status
-    if not status:
+    Valid updates are applied in one transaction; invalid ones (unknown
+    order, bad data or a transition that is not allowed) are skipped and
+    listed in the response.
+    """
+    updates = request.data.get('updates')
+    max_updates = getattr(settings, 'ORDER_STATUS_BULK_MAX', 5000)
+    if not isinstance(updates, list) or not updates:
         return Response({
             'success': False,
-            'message': 'Status is required'
+            'message': 'updates must be a non-empty list'
         }, status=400)
-    
-    # Check if status is valid
-    if status not in dict(OrderStatusChoices.choices):
+    if len(updates) > max_updates:
         return Response({
             'success': False,
-            'message': f'Invalid status. Valid options are: {", ".join(dict(OrderStatusChoices.choices).keys())}'
+            'message': f'At most {max_updates} updates are accepted per request'
         }, status=400)
     
-    # Parse expected delivery date if provided
-    expected_delivery_date = None
-    if expected_delivery_date_str:
-        try:
-            expected_delivery_date = datetime.datetime.strptime(expected_delivery_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            return Response({
-                'success': False,
-                'message': 'Invalid expected_delivery_date format. Use YYYY-MM-DD.'
-            }, status=400)
-    
-    # Create new order status
-    order_status = OrderStatus.objects.create(
-        order=order,
-        status=status,
-        current_location=current_location,
-        location_timestamp=timezone.now(),
-        remarks=remarks,
-        expected_delivery_date=expected_delivery_date,
-        updated_by=request.user if request.user.is_authenticated else None
-    )
-    
-    # Update order status field
-    order.status = status
-    order.save()
-    
-    # Send notification email
-    success = send_status_change_notification(order_status, notification_email)
+    valid = []
+    positions = []
+    errors = []
+    for index, data in enumerate(updates):
+        update, error = _parse_status_update(data, OrderStatusBulkUpdateSerializer)
+        if error:
+            order_id = data.get('order_id') if isinstance(data, dict) else None
+            errors.append({'index': index, 'order_id': order_id, 'message': error})
+            continue
+        valid.append(update)
+        positions.append(index)
+    
+    created = []
+    if valid:
+        created, transition_errors = apply_bulk_status_changes(
+            valid, updated_by=request.user, notification_email=request.data.get('email')
+        )
+        # Report positions in the request, not in the filtered list
+        for error in transition_errors:
+            error['index'] = positions[error['index']]
+        errors.extend(transition_errors)
+        errors.sort(key=lambda error: error['index'])
     
     return Response({
-        'success': True,
-        'message': f'Order status updated to {status}',
-        'notification_sent': success,
-        'order_status': OrderStatusSerializer(order_status).data
-    }) 
\ No newline at end of file
+        'success': bool(created),
+        'applied': len(created),
+        'rejected': len(errors),
+        'errors': errors,
+        'notification_queued': bool(created)
+    }, status=200 if created else 400)
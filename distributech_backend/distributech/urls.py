@@ -19,9 +19,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.metrics_views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
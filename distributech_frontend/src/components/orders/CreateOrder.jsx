@@ -16,6 +16,7 @@ const CreateOrder = () => {
   const [submitting, setSubmitting] = useState(false);
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(false);
+  const [createdOrderId, setCreatedOrderId] = useState(null);
   
   useEffect(() => {
     fetchItems();
@@ -116,42 +117,19 @@ const CreateOrder = () => {
       setSubmitting(true);
       setError(null);
       
-      // Step 1: Create the order first - using the regular endpoint for now
-      // since we want to maintain user association
+      // The order, its lines and the initial status are created in one request
       const orderResponse = await axios.post(`${API_URL}/orders/`, {
         user_id: user.id,
-        status: 'Pending'
-      });
-      
-      const orderId = orderResponse.data.id;
-      
-      // Step 2: Add order items
-      const orderItemPromises = selectedItems.map(item => 
-        axios.post(`${API_URL}/order-items/`, {
-          order: orderId,
+        status: 'Pending',
+        items: selectedItems.map(item => ({
           item_id: item.id,
-          quantity: item.quantity,
-          price_at_order_time: item.price
-        })
-      );
-      
-      await Promise.all(orderItemPromises);
-      
-      // Step 3: Create initial order status - but don't fail the entire process if this step fails
-      try {
-        await axios.post(`${API_URL}/order-status/`, {
-          order: orderId,
-          status: 'Pending',
-          location_timestamp: new Date().toISOString(),
-          remarks: 'Order created',
-          expected_delivery_date: new Date(Date.now() + 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0] // 7 days from now
-        });
-      } catch (statusError) {
-        // Log the error but continue with order creation
-        console.warn('Could not create order status:', statusError);
-      }
+          quantity: item.quantity
+        })),
+        remarks: 'Order created',
+        expected_delivery_date: new Date(Date.now() + 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0] // 7 days from now
+      });
       
-      // Mark as success regardless of order status creation
+      setCreatedOrderId(orderResponse.data.id);
       setSuccess(true);
       
       // Clear selected items
@@ -192,7 +170,7 @@ const CreateOrder = () => {
               </svg>
             </div>
             <div>
-              <p className="font-bold">Order created successfully!</p>
+              <p className="font-bold">Order #{createdOrderId} created successfully!</p>
               <p className="text-sm">An email notification has been sent to the relevant departments. Redirecting to orders list...</p>
             </div>
           </div>